@@ -0,0 +1,68 @@
+"""
+Measure how long it takes to read the latest changes as the DB grows.
+
+Usage (from the `api` directory):
+
+    python -m benchmarks.changes_query
+"""
+import datetime
+import statistics
+import tempfile
+import time
+from dataclasses import replace
+from pathlib import Path
+
+from src.adapter.sqlite import DbClient
+from src.config import Config
+from tests import factories
+
+TABLE_SIZES = [1_000, 10_000, 100_000]
+RECENT_CHANGES = 50
+REPETITIONS = 50
+
+
+def _build_db(path: Path, size: int) -> DbClient:
+    config = Config(wipman_dir=None, db_path=path, api_token=None)
+    db = DbClient(config=config)
+    db.migrate()
+
+    start = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+    template = factories.task()
+    with db.transaction():
+        for i in range(size):
+            task = replace(
+                template,
+                id=f"{i:010d}",
+                updated=start + datetime.timedelta(minutes=i),
+            )
+            db.insert_task(task=task)
+
+    return db
+
+
+def _measure(db: DbClient, after: datetime.datetime) -> list[float]:
+    timings: list[float] = []
+    for _ in range(REPETITIONS):
+        before = time.perf_counter()
+        tasks = db.read_tasks(updated_after=after)
+        timings.append(time.perf_counter() - before)
+        assert len(tasks) == RECENT_CHANGES
+    return timings
+
+
+def main() -> None:
+    print(f"Reading the last {RECENT_CHANGES} changed tasks")
+    print(f"{'tasks':>10}  {'median':>10}  {'p95':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in TABLE_SIZES:
+            db = _build_db(path=Path(tmp) / f"{size}.db", size=size)
+            start = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+            after = start + datetime.timedelta(minutes=size - RECENT_CHANGES - 1)
+            timings = sorted(_measure(db=db, after=after))
+            median = statistics.median(timings) * 1000
+            p95 = timings[int(len(timings) * 0.95)] * 1000
+            print(f"{size:>10}  {median:>8.3f}ms  {p95:>8.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Compare how long it takes to parse task files of several sizes line by line, as
+`read_task_file` used to do, against the single-pass parser in `src.adapter.fs`.
+
+Usage (from the `api` directory):
+
+    python -m benchmarks.parse_files
+"""
+import datetime
+import statistics
+import tempfile
+import time
+from collections import defaultdict
+from dataclasses import replace
+from pathlib import Path
+from typing import Callable
+
+from src.adapter.fs import read_task_file, write_task_file
+from src.model import Task
+from tests import factories
+
+CONTENT_SIZES = {"small": 0, "medium": 10_000, "large": 1_000_000}
+REPETITIONS = 20
+
+
+def _read_task_file_line_by_line(path: Path) -> Task:
+    content_delimiter_found = False
+    tmp: defaultdict[str, str] = defaultdict(str)
+
+    with path.open("r") as f:
+        for line in f:
+            if content_delimiter_found:
+                tmp["content"] += line
+                continue
+
+            line = line.strip()
+            if line == "---":
+                content_delimiter_found = True
+                continue
+
+            key, value = line.split("=", maxsplit=1)
+            tmp[key] = value
+
+    data = dict(tmp)
+
+    return Task(
+        id=data["id"],
+        title=data["title"],
+        created=datetime.datetime.fromisoformat(data["created"]),
+        updated=datetime.datetime.fromisoformat(data["updated"]),
+        tags=frozenset(item for item in data["tags"].split(",") if item),
+        blocked_by=frozenset(item for item in data["blockedBy"].split(",") if item),
+        blocks=frozenset(item for item in data["blocks"].split(",") if item),
+        completed=data["completed"] == "true",
+        content=data.get("content"),
+    )
+
+
+def _measure(read: Callable[[Path], Task], path: Path) -> float:
+    timings: list[float] = []
+    for _ in range(REPETITIONS):
+        before = time.perf_counter()
+        read(path)
+        timings.append(time.perf_counter() - before)
+    return statistics.median(timings) * 1_000_000
+
+
+def main() -> None:
+    line = "- Some markdown describing what needs to be done, and why.\n"
+    print(f"{'file':>8}  {'line by line':>14}  {'single pass':>14}  {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for label, size in CONTENT_SIZES.items():
+            content = (line * (size // len(line) + 1))[:size] or None
+            path = Path(tmp_dir) / label
+            write_task_file(path=path, task=replace(factories.task(), content=content))
+            assert _read_task_file_line_by_line(path) == read_task_file(path)
+
+            baseline = _measure(_read_task_file_line_by_line, path)
+            candidate = _measure(read_task_file, path)
+            print(
+                f"{label:>8}  {baseline:>12.1f}us  {candidate:>12.1f}us"
+                f"  {baseline / candidate:>7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Compare how long it takes to encode a /get-all body with apischema and the standard
+library, as Flask does it, against the hand-written serializers in `src.adapter.json`.
+
+Usage (from the `api` directory):
+
+    python -m benchmarks.serialization
+"""
+import json
+import statistics
+import time
+from dataclasses import replace
+from typing import Callable
+
+import apischema
+from src.adapter.json import dumps, task_to_encodable
+from src.model import Task
+from tests import factories
+
+TASK_COUNTS = [1_000, 10_000, 100_000]
+REPETITIONS = 10
+
+
+def _with_apischema(tasks: list[Task]) -> bytes:
+    payload = {"tasks": [apischema.serialize(Task, task) for task in tasks]}
+    return json.dumps(payload, sort_keys=True, separators=(",", ":")).encode()
+
+
+def _with_hand_written_serializers(tasks: list[Task]) -> bytes:
+    payload = {"tasks": list(map(task_to_encodable, tasks))}
+    return dumps(payload)
+
+
+def _measure(encode: Callable[[list[Task]], bytes], tasks: list[Task]) -> float:
+    timings: list[float] = []
+    for _ in range(REPETITIONS):
+        before = time.perf_counter()
+        encode(tasks)
+        timings.append(time.perf_counter() - before)
+    return statistics.median(timings) * 1000
+
+
+def main() -> None:
+    template = factories.task()
+    print(f"{'tasks':>10}  {'apischema':>12}  {'hand-written':>12}  {'speedup':>8}")
+    for count in TASK_COUNTS:
+        tasks = [replace(template, id=f"{i:010d}") for i in range(count)]
+        assert _with_apischema(tasks) == _with_hand_written_serializers(tasks)
+
+        baseline = _measure(_with_apischema, tasks)
+        candidate = _measure(_with_hand_written_serializers, tasks)
+        print(
+            f"{count:>10}  {baseline:>10.1f}ms  {candidate:>10.1f}ms"
+            f"  {baseline / candidate:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import gzip
+import threading
+from collections import OrderedDict
+from typing import TypeAlias
+
+from src.config import Config
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - zstd is only offered when installed
+    zstandard = None  # type: ignore[assignment]
+
+Encoding: TypeAlias = str
+ETag: TypeAlias = str
+
+
+def supported_encodings() -> list[Encoding]:
+    """
+    Content encodings the API can produce, from most to least preferred.
+    """
+    if zstandard is None:
+        return ["gzip"]
+    return ["zstd", "gzip"]
+
+
+def compress(body: bytes, encoding: Encoding, config: Config) -> bytes:
+    match encoding:
+        case "gzip":
+            # Fixed mtime, so that the same body always compresses the same way
+            return gzip.compress(
+                body, compresslevel=config.compression_gzip_level, mtime=0
+            )
+        case "zstd" if zstandard is not None:
+            compressor = zstandard.ZstdCompressor(level=config.compression_zstd_level)
+            return compressor.compress(body)
+        case other:
+            raise ValueError(f"Unsupported content encoding: {other!r}")
+
+
+class CompressedBodyCache:
+    """
+    Remember compressed bodies by ETag and encoding, so that responses that have
+    not changed are not compressed again. Least recently used bodies are evicted
+    once the cache holds more than `max_bytes`.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self._max_bytes = max_bytes
+        self._size = 0
+        self._bodies: OrderedDict[tuple[ETag, Encoding], bytes] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, etag: ETag, encoding: Encoding) -> bytes | None:
+        key = (etag, encoding)
+        with self._lock:
+            body = self._bodies.get(key)
+            if body is not None:
+                self._bodies.move_to_end(key)
+            return body
+
+    def set(self, etag: ETag, encoding: Encoding, body: bytes) -> None:
+        if len(body) > self._max_bytes:
+            return
+
+        key = (etag, encoding)
+        with self._lock:
+            if previous := self._bodies.pop(key, None):
+                self._size -= len(previous)
+
+            self._bodies[key] = body
+            self._size += len(body)
+
+            while self._size > self._max_bytes:
+                _, evicted = self._bodies.popitem(last=False)
+                self._size -= len(evicted)
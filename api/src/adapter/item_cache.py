@@ -0,0 +1,255 @@
+import logging
+import sqlite3
+import threading
+import time
+from collections.abc import Generator
+from dataclasses import dataclass, field
+from typing import cast
+from weakref import WeakKeyDictionary
+
+from src.adapter.json import JsonDict, task_to_encodable, view_to_encodable
+from src.adapter.sqlite import DbClient
+from src.model import ChangeSeq, ItemKind, Task, TaskId, View, ViewId
+
+logger = logging.getLogger(__name__)
+
+# Changes read at a time when catching up with writes made by other processes
+REPLAY_PAGE_SIZE = 1_000
+# Seconds to wait before trying to cache items again, once they did not fit. The
+# wait doubles every time they still do not fit, up to the maximum
+RELOAD_BACKOFF_SECONDS = 60.0
+RELOAD_MAX_BACKOFF_SECONDS = 3_600.0
+
+# Rough memory taken by an item and its JSON, besides their strings
+_ITEM_OVERHEAD_BYTES = 1_024
+_COLLECTION_ITEM_OVERHEAD_BYTES = 64
+
+
+@dataclass(frozen=True)
+class CachedItem:
+    item: Task | View
+    # As returned by `task_to_encodable`/`view_to_encodable`: only for `dumps`
+    encodable: JsonDict
+    size: int
+
+
+@dataclass
+class ItemChanges:
+    tasks: list[Task] = field(default_factory=list)
+    views: list[View] = field(default_factory=list)
+    deleted_task_ids: list[TaskId] = field(default_factory=list)
+    deleted_view_ids: list[ViewId] = field(default_factory=list)
+
+
+def _estimate_size(encodable: JsonDict) -> int:
+    """
+    Approximate the memory taken by an item and its JSON, which share strings.
+    """
+    size = _ITEM_OVERHEAD_BYTES
+    for value in encodable.values():
+        if isinstance(value, str):
+            size += len(value)
+        elif isinstance(value, list):
+            size += sum(len(element) for element in value)
+            size += len(value) * _COLLECTION_ITEM_OVERHEAD_BYTES
+    return size
+
+
+def _to_cached_item(item: Task | View) -> CachedItem:
+    if isinstance(item, Task):
+        encodable = task_to_encodable(item)
+    else:
+        encodable = view_to_encodable(item)
+    return CachedItem(item=item, encodable=encodable, size=_estimate_size(encodable))
+
+
+class ItemCache:
+    """
+    Keep every task and view in memory, parsed and serialized, so that listing
+    them all does not read and parse every row of the DB each time.
+
+    The cache holds all items as of the change log sequence number `seq`. Writes
+    made by this process are applied as they happen, and writes made by other
+    processes are caught up with from the change log when a read notices them.
+    If all items do not fit in `max_bytes`, nothing is cached, and reads return
+    None until caching is tried again, after `RELOAD_BACKOFF_SECONDS` or more.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self._max_bytes = max_bytes
+        self._size = 0
+        self._items: dict[tuple[ItemKind, str], CachedItem] = {}
+        # None while the cache does not hold every item
+        self._seq: ChangeSeq | None = None
+        # Data version and cache `seq` when each connection last found them in sync
+        self._checked: WeakKeyDictionary[sqlite3.Connection, tuple[int, ChangeSeq]]
+        self._checked = WeakKeyDictionary()
+        # Set while items do not fit: when to try again, and how long to wait then
+        self._retry_at: float | None = None
+        self._backoff_seconds = RELOAD_BACKOFF_SECONDS
+        self._lock = threading.Lock()
+
+    def read_all(
+        self, db: DbClient
+    ) -> tuple[list[CachedItem], list[CachedItem]] | None:
+        """
+        Return all tasks and views, up to date with the DB as seen by `db`, or None
+        if they do not fit in the cache.
+        """
+        data_version = db.read_data_version()
+        with self._lock:
+            if self._waiting_to_retry():
+                return None
+
+            seq = self._seq
+            if seq is not None and self._checked.get(db.connection) == (
+                data_version,
+                seq,
+            ):
+                # Nobody committed anything since this connection last checked
+                return self._list_items()
+
+        last_seq = db.read_last_change_seq()
+        if seq is not None and seq > last_seq:
+            # The DB went back in time, like when it is restored from a backup
+            seq = None
+        elif seq is not None and seq < last_seq:
+            seq = self._catch_up(db=db, since=seq)
+
+        if seq is None or seq < last_seq:
+            with self._lock:
+                if self._waiting_to_retry():
+                    # Items outgrew the cache while catching up
+                    return None
+            return self._reload(db=db)
+
+        with self._lock:
+            self._checked[db.connection] = (data_version, seq)
+            return self._list_items()
+
+    def apply(self, since: ChangeSeq, until: ChangeSeq, changes: ItemChanges) -> bool:
+        """
+        Apply the changes logged after `since` and up to `until`, and return whether
+        they were applied. Changes are ignored unless the cache is exactly at
+        `since`, and are then read back from the change log instead, so that they
+        are never applied out of order.
+        """
+        with self._lock:
+            if self._seq != since:
+                return False
+
+            items: list[Task | View] = [*changes.tasks, *changes.views]
+            for item in items:
+                kind: ItemKind = "task" if isinstance(item, Task) else "view"
+                self._store(key=(kind, item.id), cached=_to_cached_item(item))
+            for task_id in changes.deleted_task_ids:
+                self._discard(key=("task", task_id))
+            for view_id in changes.deleted_view_ids:
+                self._discard(key=("view", view_id))
+
+            if self._size > self._max_bytes:
+                self._give_up(size=self._size)
+                return False
+
+            self._seq = until
+            return True
+
+    def _catch_up(self, db: DbClient, since: ChangeSeq) -> ChangeSeq | None:
+        while True:
+            page = db.read_changes(since=since, limit=REPLAY_PAGE_SIZE)
+            if page.reset_required:
+                return None
+
+            changes = ItemChanges(
+                # Read without `task_fields`, so tasks are whole
+                tasks=cast(list[Task], page.tasks),
+                views=page.views,
+                deleted_task_ids=page.deleted_task_ids,
+                deleted_view_ids=page.deleted_view_ids,
+            )
+            applied = self.apply(since=since, until=page.cursor, changes=changes)
+            if not applied or not page.has_more:
+                with self._lock:
+                    return self._seq
+            since = page.cursor
+
+    def _reload(self, db: DbClient) -> tuple[list[CachedItem], list[CachedItem]] | None:
+        data_version = db.read_data_version()
+        tasks: list[CachedItem] = []
+        views: list[CachedItem] = []
+        size = 0
+        items: Generator[Task | View, None, None]
+        cached_items: list[CachedItem]
+        with db.snapshot():
+            seq = db.read_last_change_seq()
+            for items, cached_items in (
+                (db.iter_tasks(), tasks),
+                (db.iter_views(), views),
+            ):
+                for item in items:
+                    cached = _to_cached_item(item)
+                    size += cached.size
+                    if size > self._max_bytes:
+                        # Do not build the rest, only to throw it away
+                        items.close()
+                        with self._lock:
+                            self._give_up(size=size)
+                        return None
+                    cached_items.append(cached)
+
+        with self._lock:
+            self._clear()
+            for cached in tasks:
+                self._items[("task", cached.item.id)] = cached
+            for cached in views:
+                self._items[("view", cached.item.id)] = cached
+            self._size = size
+            self._seq = seq
+            self._checked[db.connection] = (data_version, seq)
+            if self._retry_at is not None:
+                logger.info("Caching items again, they fit in the configured size")
+            self._retry_at = None
+            self._backoff_seconds = RELOAD_BACKOFF_SECONDS
+
+        return tasks, views
+
+    def _waiting_to_retry(self) -> bool:
+        return self._retry_at is not None and time.monotonic() < self._retry_at
+
+    def _give_up(self, size: int) -> None:
+        """
+        Drop all items, and do not try to cache them again for a while.
+        """
+        if self._retry_at is None:
+            logger.info(
+                f"Not caching items, they take more than {size} bytes: reading them"
+                " from the DB instead"
+            )
+        else:
+            self._backoff_seconds = min(
+                self._backoff_seconds * 2, RELOAD_MAX_BACKOFF_SECONDS
+            )
+        self._clear()
+        self._retry_at = time.monotonic() + self._backoff_seconds
+
+    def _list_items(self) -> tuple[list[CachedItem], list[CachedItem]]:
+        tasks: list[CachedItem] = []
+        views: list[CachedItem] = []
+        for (kind, _), cached in self._items.items():
+            (tasks if kind == "task" else views).append(cached)
+        return tasks, views
+
+    def _store(self, key: tuple[ItemKind, str], cached: CachedItem) -> None:
+        self._discard(key=key)
+        self._items[key] = cached
+        self._size += cached.size
+
+    def _discard(self, key: tuple[ItemKind, str]) -> None:
+        if previous := self._items.pop(key, None):
+            self._size -= previous.size
+
+    def _clear(self) -> None:
+        self._items.clear()
+        self._size = 0
+        self._seq = None
+        self._checked.clear()
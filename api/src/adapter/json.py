@@ -1,13 +1,68 @@
+import datetime
+import json
 from typing import Any, TypeAlias
 
 import apischema
-from src.model import Task, View
+
+from src.model import PartialTask, Task, TaskSearchResult, View
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - falls back to the standard library
+    orjson = None  # type: ignore[assignment]
 
 JsonDict: TypeAlias = dict[str, Any]
 
 
+def task_to_encodable(task: Task) -> JsonDict:
+    """
+    Serialize `task` like `task_to_json`, but leave datetimes for `dumps` to encode,
+    which is much faster than `datetime.isoformat` when orjson is installed.
+    """
+    return {
+        "id": task.id,
+        "title": task.title,
+        "created": task.created,
+        "updated": task.updated,
+        "tags": list(task.tags),
+        "blocked_by": list(task.blocked_by),
+        "blocks": list(task.blocks),
+        "completed": task.completed,
+        "content": task.content,
+    }
+
+
+def view_to_encodable(view: View) -> JsonDict:
+    """
+    Serialize `view` like `view_to_json`, but leave datetimes for `dumps` to encode.
+    """
+    return {
+        "id": view.id,
+        "title": view.title,
+        "created": view.created,
+        "updated": view.updated,
+        "tags": list(view.tags),
+        "task_ids": list(view.task_ids),
+    }
+
+
+def partial_task_to_encodable(task: PartialTask) -> JsonDict:
+    """
+    Like `task_to_encodable`, for tasks read with only some of their fields.
+    """
+    return {
+        name: list(value) if isinstance(value, frozenset) else value
+        for name, value in task.items()
+    }
+
+
 def task_to_json(task: Task) -> JsonDict:
-    return apischema.serialize(Task, task)
+    # Same as `apischema.serialize`, without inspecting the type on every call
+    return {
+        **task_to_encodable(task),
+        "created": task.created.isoformat(),
+        "updated": task.updated.isoformat(),
+    }
 
 
 def json_to_task(raw: JsonDict) -> Task:
@@ -15,8 +70,52 @@ def json_to_task(raw: JsonDict) -> Task:
 
 
 def view_to_json(view: View) -> JsonDict:
-    return apischema.serialize(View, view)
+    # Same as `apischema.serialize`, without inspecting the type on every call
+    return {
+        **view_to_encodable(view),
+        "created": view.created.isoformat(),
+        "updated": view.updated.isoformat(),
+    }
 
 
 def json_to_view(raw: JsonDict) -> View:
     return apischema.deserialize(View, raw)
+
+
+def search_result_to_json(result: TaskSearchResult) -> JsonDict:
+    return apischema.serialize(TaskSearchResult, result)
+
+
+def _isoformat(value: Any) -> str:
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(payload: Any, sort_keys: bool = True, indent: int | None = None) -> bytes:
+    """
+    Encode `payload` as JSON, byte for byte like the standard library with the
+    default `ensure_ascii=True`, and `separators=(",", ":")` unless indenting.
+    Datetimes are encoded like `datetime.isoformat` does.
+
+    orjson is used when installed. It never escapes non-ASCII characters, so its
+    output is only kept when there were none to escape. It also formats some floats
+    differently, and drops the seconds of UTC offsets (which ISO 8601 does not
+    have): payloads with floats or such offsets must not be encoded with this.
+    """
+    if orjson is not None and indent is None:
+        option = orjson.OPT_SORT_KEYS if sort_keys else 0
+        encoded = orjson.dumps(payload, option=option)
+        # The standard library also escapes DEL, despite being ASCII
+        if encoded.isascii() and b"\x7f" not in encoded:
+            return encoded
+
+    separators = None if indent else (",", ":")
+    text = json.dumps(
+        payload,
+        sort_keys=sort_keys,
+        indent=indent,
+        separators=separators,
+        default=_isoformat,
+    )
+    return text.encode()
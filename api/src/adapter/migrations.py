@@ -0,0 +1,414 @@
+"""
+Versioned schema migrations for the SQLite DB.
+
+The schema version of a DB file is stored in `PRAGMA user_version`. Each migration
+runs in its own transaction, together with the version bump, so a DB file is never
+left half-migrated. Migrations are history: never edit one that has been released,
+add a new one instead.
+"""
+import datetime
+import logging
+import sqlite3
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import TypeAlias
+
+logger = logging.getLogger(__name__)
+
+SchemaVersion: TypeAlias = int
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: SchemaVersion
+    description: str
+    apply: Callable[[sqlite3.Connection], None]
+
+
+class MigrationError(Exception):
+    ...
+
+
+def _create_legacy_tables(connection: sqlite3.Connection) -> None:
+    # Tables as they were created before the DB schema was versioned
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS tasks"
+        " (id, title, created, updated, tags, blocked_by, blocks, completed, content);"
+    )
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS views"
+        " (id, title, created, updated, tags, task_ids);"
+    )
+
+
+def _add_types_and_primary_keys(connection: sqlite3.Connection) -> None:
+    connection.execute(
+        """
+        CREATE TABLE tasks_typed (
+            id TEXT PRIMARY KEY NOT NULL,
+            title TEXT NOT NULL,
+            created TEXT NOT NULL,
+            updated TEXT NOT NULL,
+            tags TEXT NOT NULL DEFAULT '',
+            blocked_by TEXT NOT NULL DEFAULT '',
+            blocks TEXT NOT NULL DEFAULT '',
+            completed INTEGER NOT NULL CHECK (completed IN (0, 1)),
+            content TEXT
+        );
+        """
+    )
+    # Legacy tables had no primary key: if an ID is duplicated, keep the last row
+    connection.execute(
+        """
+        INSERT OR REPLACE INTO tasks_typed
+            (id, title, created, updated, tags, blocked_by, blocks, completed, content)
+        SELECT
+            id, title, created, updated, tags, blocked_by, blocks, completed, content
+        FROM tasks
+        ORDER BY rowid;
+        """
+    )
+    connection.execute("DROP TABLE tasks;")
+    connection.execute("ALTER TABLE tasks_typed RENAME TO tasks;")
+    connection.execute("CREATE INDEX tasks_updated_idx ON tasks (updated);")
+
+    connection.execute(
+        """
+        CREATE TABLE views_typed (
+            id TEXT PRIMARY KEY NOT NULL,
+            title TEXT NOT NULL,
+            created TEXT NOT NULL,
+            updated TEXT NOT NULL,
+            tags TEXT NOT NULL DEFAULT '',
+            task_ids TEXT NOT NULL DEFAULT ''
+        );
+        """
+    )
+    connection.execute(
+        """
+        INSERT OR REPLACE INTO views_typed
+            (id, title, created, updated, tags, task_ids)
+        SELECT
+            id, title, created, updated, tags, task_ids
+        FROM views
+        ORDER BY rowid;
+        """
+    )
+    connection.execute("DROP TABLE views;")
+    connection.execute("ALTER TABLE views_typed RENAME TO views;")
+    connection.execute("CREATE INDEX views_updated_idx ON views (updated);")
+
+
+def _iso_to_epoch_us(value: str) -> int:
+    moment = datetime.datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=datetime.UTC)
+    epoch = datetime.datetime(1970, 1, 1, tzinfo=datetime.UTC)
+    return (moment - epoch) // datetime.timedelta(microseconds=1)
+
+
+def _add_sortable_updated_timestamps(connection: sqlite3.Connection) -> None:
+    connection.create_function(
+        "iso_to_epoch_us", 1, _iso_to_epoch_us, deterministic=True
+    )
+
+    for table in ("tasks", "views"):
+        connection.execute(
+            f"ALTER TABLE {table} ADD COLUMN updated_us INTEGER NOT NULL DEFAULT 0;"
+        )
+        connection.execute(f"UPDATE {table} SET updated_us = iso_to_epoch_us(updated);")
+        connection.execute(f"DROP INDEX {table}_updated_idx;")
+        connection.execute(
+            f"CREATE INDEX {table}_updated_us_idx ON {table} (updated_us);"
+        )
+
+
+def _split_commas(value: str) -> list[str]:
+    return [item for item in value.split(",") if item]
+
+
+def _add_tag_and_dependency_tables(connection: sqlite3.Connection) -> None:
+    connection.execute(
+        """
+        CREATE TABLE task_tags (
+            task_id TEXT NOT NULL,
+            tag TEXT NOT NULL,
+            PRIMARY KEY (task_id, tag)
+        ) WITHOUT ROWID;
+        """
+    )
+    connection.execute("CREATE INDEX task_tags_tag_idx ON task_tags (tag, task_id);")
+
+    # Edges are stored as declared by `task_id`: either `task_id` is blocked by
+    # `other_task_id`, or `task_id` blocks `other_task_id`
+    connection.execute(
+        """
+        CREATE TABLE task_edges (
+            task_id TEXT NOT NULL,
+            kind TEXT NOT NULL CHECK (kind IN ('blocked_by', 'blocks')),
+            other_task_id TEXT NOT NULL,
+            PRIMARY KEY (task_id, kind, other_task_id)
+        ) WITHOUT ROWID;
+        """
+    )
+    connection.execute(
+        "CREATE INDEX task_edges_other_task_idx"
+        " ON task_edges (other_task_id, kind, task_id);"
+    )
+
+    connection.execute(
+        """
+        CREATE TABLE view_tags (
+            view_id TEXT NOT NULL,
+            tag TEXT NOT NULL,
+            PRIMARY KEY (view_id, tag)
+        ) WITHOUT ROWID;
+        """
+    )
+    connection.execute("CREATE INDEX view_tags_tag_idx ON view_tags (tag, view_id);")
+
+    tasks = connection.execute("SELECT id, tags, blocked_by, blocks FROM tasks;")
+    for task_id, tags, blocked_by, blocks in tasks.fetchall():
+        connection.executemany(
+            "INSERT INTO task_tags (task_id, tag) VALUES (?, ?);",
+            [(task_id, tag) for tag in _split_commas(tags)],
+        )
+        connection.executemany(
+            "INSERT INTO task_edges (task_id, kind, other_task_id) VALUES (?, ?, ?);",
+            [
+                *(
+                    (task_id, "blocked_by", other)
+                    for other in _split_commas(blocked_by)
+                ),
+                *((task_id, "blocks", other) for other in _split_commas(blocks)),
+            ],
+        )
+
+    views = connection.execute("SELECT id, tags FROM views;")
+    for view_id, tags in views.fetchall():
+        connection.executemany(
+            "INSERT INTO view_tags (view_id, tag) VALUES (?, ?);",
+            [(view_id, tag) for tag in _split_commas(tags)],
+        )
+
+
+def _add_change_log(connection: sqlite3.Connection) -> None:
+    # One row per item: writing an item again moves it to the end of the log, so
+    # reading the log from a given sequence number yields each changed item once
+    connection.execute(
+        """
+        CREATE TABLE change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL CHECK (kind IN ('task', 'view')),
+            item_id TEXT NOT NULL,
+            UNIQUE (kind, item_id)
+        );
+        """
+    )
+
+    for kind, table in (("task", "tasks"), ("view", "views")):
+        for event in ("INSERT", "UPDATE"):
+            connection.execute(
+                f"""
+                CREATE TRIGGER {table}_log_{event.lower()}
+                AFTER {event} ON {table}
+                BEGIN
+                    DELETE FROM change_log
+                    WHERE kind = '{kind}' AND item_id = NEW.id;
+                    INSERT INTO change_log (kind, item_id) VALUES ('{kind}', NEW.id);
+                END;
+                """
+            )
+        connection.execute(
+            f"""
+            CREATE TRIGGER {table}_log_delete
+            AFTER DELETE ON {table}
+            BEGIN
+                DELETE FROM change_log WHERE kind = '{kind}' AND item_id = OLD.id;
+            END;
+            """
+        )
+        connection.execute(
+            f"""
+            INSERT INTO change_log (kind, item_id)
+            SELECT '{kind}', id FROM {table} ORDER BY updated_us;
+            """
+        )
+
+
+def _add_tombstones(connection: sqlite3.Connection) -> None:
+    # A deleted item keeps its change_log row, marked with the deletion time
+    connection.execute("ALTER TABLE change_log ADD COLUMN deleted_at_us INTEGER;")
+    connection.execute(
+        "CREATE INDEX change_log_tombstones_idx ON change_log (deleted_at_us)"
+        " WHERE deleted_at_us IS NOT NULL;"
+    )
+
+    # Highest sequence number of the tombstones removed by compaction so far
+    connection.execute(
+        """
+        CREATE TABLE sync_state (
+            key TEXT PRIMARY KEY NOT NULL,
+            value INTEGER NOT NULL
+        );
+        """
+    )
+    connection.execute(
+        "INSERT INTO sync_state (key, value) VALUES ('compacted_until_seq', 0);"
+    )
+
+    for kind, table in (("task", "tasks"), ("view", "views")):
+        connection.execute(f"DROP TRIGGER {table}_log_delete;")
+        # SQLite reads the clock in milliseconds: stamp deletions with the end of
+        # their millisecond, so that compaction never forgets them too early
+        connection.execute(
+            f"""
+            CREATE TRIGGER {table}_log_delete
+            AFTER DELETE ON {table}
+            BEGIN
+                DELETE FROM change_log WHERE kind = '{kind}' AND item_id = OLD.id;
+                INSERT INTO change_log (kind, item_id, deleted_at_us)
+                VALUES (
+                    '{kind}',
+                    OLD.id,
+                    CAST(
+                        round((julianday('now') - 2440587.5) * 86400000.0)
+                        AS INTEGER
+                    ) * 1000 + 999
+                );
+            END;
+            """
+        )
+
+
+def _add_full_text_search(connection: sqlite3.Connection) -> None:
+    # External content table: the index references `tasks` rows by rowid instead
+    # of keeping a second copy of every title and content
+    connection.execute(
+        """
+        CREATE VIRTUAL TABLE tasks_fts USING fts5 (
+            title,
+            content,
+            content = 'tasks',
+            content_rowid = 'rowid',
+            tokenize = 'unicode61 remove_diacritics 2'
+        );
+        """
+    )
+    connection.execute(
+        """
+        CREATE TRIGGER tasks_fts_insert AFTER INSERT ON tasks
+        BEGIN
+            INSERT INTO tasks_fts (rowid, title, content)
+            VALUES (NEW.rowid, NEW.title, NEW.content);
+        END;
+        """
+    )
+    connection.execute(
+        """
+        CREATE TRIGGER tasks_fts_delete AFTER DELETE ON tasks
+        BEGIN
+            INSERT INTO tasks_fts (tasks_fts, rowid, title, content)
+            VALUES ('delete', OLD.rowid, OLD.title, OLD.content);
+        END;
+        """
+    )
+    connection.execute(
+        """
+        CREATE TRIGGER tasks_fts_update AFTER UPDATE OF title, content ON tasks
+        BEGIN
+            INSERT INTO tasks_fts (tasks_fts, rowid, title, content)
+            VALUES ('delete', OLD.rowid, OLD.title, OLD.content);
+            INSERT INTO tasks_fts (rowid, title, content)
+            VALUES (NEW.rowid, NEW.title, NEW.content);
+        END;
+        """
+    )
+    connection.execute("INSERT INTO tasks_fts (tasks_fts) VALUES ('rebuild');")
+
+
+MIGRATIONS: list[Migration] = [
+    Migration(
+        version=1,
+        description="create unversioned tables",
+        apply=_create_legacy_tables,
+    ),
+    Migration(
+        version=2,
+        description="add column types, primary keys and indexes on updated",
+        apply=_add_types_and_primary_keys,
+    ),
+    Migration(
+        version=3,
+        description="store updated as UTC epoch microseconds and index it",
+        apply=_add_sortable_updated_timestamps,
+    ),
+    Migration(
+        version=4,
+        description="add task_tags, task_edges and view_tags tables",
+        apply=_add_tag_and_dependency_tables,
+    ),
+    Migration(
+        version=5,
+        description="add change_log, filled by triggers on tasks and views",
+        apply=_add_change_log,
+    ),
+    Migration(
+        version=6,
+        description="keep tombstones of deleted items in change_log",
+        apply=_add_tombstones,
+    ),
+    Migration(
+        version=7,
+        description="add full-text search index over task title and content",
+        apply=_add_full_text_search,
+    ),
+]
+
+LATEST_VERSION: SchemaVersion = MIGRATIONS[-1].version
+
+
+def get_schema_version(connection: sqlite3.Connection) -> SchemaVersion:
+    (version,) = connection.execute("PRAGMA user_version;").fetchone()
+    return version
+
+
+def migrate(connection: sqlite3.Connection) -> SchemaVersion:
+    """
+    Bring the DB schema up to date, and return the resulting schema version.
+    """
+    current = get_schema_version(connection=connection)
+    if current > LATEST_VERSION:
+        raise MigrationError(
+            f"DB schema version is {current}, but the latest known version is"
+            f" {LATEST_VERSION}. Is this DB file used by a newer API version?"
+        )
+
+    pending = [migration for migration in MIGRATIONS if migration.version > current]
+    if not pending:
+        logger.debug(f"DB schema is up to date (version {current})")
+        return current
+
+    for migration in pending:
+        logger.info(
+            f"Migrating DB schema to version {migration.version}:"
+            f" {migration.description}"
+        )
+        # Take the write lock upfront, so concurrent runners do not interleave
+        connection.execute("BEGIN IMMEDIATE;")
+        try:
+            if get_schema_version(connection=connection) >= migration.version:
+                connection.rollback()
+                continue  # another process got here first
+            migration.apply(connection)
+            # PRAGMA does not accept bound parameters
+            connection.execute(f"PRAGMA user_version = {migration.version:d};")
+            connection.commit()
+        except Exception as error:
+            connection.rollback()
+            raise MigrationError(
+                f"Failed to apply migration {migration.version}"
+                f" ({migration.description})"
+            ) from error
+
+    return get_schema_version(connection=connection)
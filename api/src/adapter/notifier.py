@@ -0,0 +1,132 @@
+import logging
+import sqlite3
+import threading
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+
+from src.adapter.sqlite import ConnectionPool, DbClient
+from src.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class ChangeNotifier:
+    """
+    Let threads and event loops wait until this process writes to the DB.
+
+    Writes made by other processes, like other server workers, go unnoticed unless
+    a `DbWriteWatcher` is watching the DB.
+    """
+
+    def __init__(self) -> None:
+        self._condition = threading.Condition()
+        self._generation = 0
+        self._listeners: set[Callable[[], None]] = set()
+
+    @property
+    def generation(self) -> int:
+        """
+        Number of notifications so far: read it before checking the DB, and wait
+        for it to change after.
+        """
+        with self._condition:
+            return self._generation
+
+    def notify(self) -> None:
+        with self._condition:
+            self._generation += 1
+            self._condition.notify_all()
+            listeners = list(self._listeners)
+
+        for listener in listeners:
+            listener()
+
+    def wait(self, generation: int, timeout: float) -> int:
+        """
+        Block until there is a notification after `generation`, or until `timeout`
+        seconds pass, and return the current generation.
+        """
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._generation != generation, timeout=timeout
+            )
+            return self._generation
+
+    def add_listener(self, listener: Callable[[], None]) -> None:
+        """
+        Call `listener` on every notification, from the notifying thread. Useful to
+        wake up event loops, which must not block on `wait`.
+        """
+        with self._condition:
+            self._listeners.add(listener)
+
+    def remove_listener(self, listener: Callable[[], None]) -> None:
+        with self._condition:
+            self._listeners.discard(listener)
+
+
+class DbWriteWatcher:
+    """
+    Notify writes made to the DB by any connection, including those of other
+    processes, by polling `PRAGMA data_version` on a background thread. Polling is
+    cheap, as it reads no table, and only happens while someone is `watching`.
+    """
+
+    def __init__(
+        self, config: Config, notifier: ChangeNotifier, interval_seconds: float
+    ) -> None:
+        self._config = config
+        self._notifier = notifier
+        self._interval_seconds = interval_seconds
+        self._lock = threading.Lock()
+        self._watchers = 0
+        self._stopped: threading.Event | None = None
+
+    @contextmanager
+    def watching(self) -> Iterator[None]:
+        with self._lock:
+            self._watchers += 1
+            if self._stopped is None:
+                self._stopped = threading.Event()
+                threading.Thread(
+                    target=self._poll,
+                    args=(self._stopped,),
+                    name="db-write-watcher",
+                    daemon=True,
+                ).start()
+
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._watchers -= 1
+                if self._watchers == 0 and self._stopped is not None:
+                    self._stopped.set()
+                    self._stopped = None
+
+    def _poll(self, stopped: threading.Event) -> None:
+        # A connection of its own, as data versions are only comparable when read
+        # from the same connection
+        pool = ConnectionPool(config=self._config, read_only=True)
+        try:
+            db = DbClient(config=self._config, pool=pool)
+            last_seen = db.read_data_version()
+            # Writes made before the first read above would go unnoticed otherwise
+            self._notifier.notify()
+            while not stopped.wait(self._interval_seconds):
+                try:
+                    data_version = db.read_data_version()
+                except sqlite3.Error as error:
+                    logger.warning(f"failed to check the DB for writes: {error}")
+                    continue
+
+                if data_version != last_seen:
+                    last_seen = data_version
+                    self._notifier.notify()
+        finally:
+            pool.release()
+            pool.close()
+
+
+# DB writes of this process are notified here, see `src.use_cases.update_items`
+change_notifier = ChangeNotifier()
@@ -1,11 +1,27 @@
 import datetime
 import logging
 import sqlite3
+import threading
+import time
+from collections.abc import Callable, Generator, Iterable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
 from textwrap import dedent
-from typing import TypeAlias
+from typing import Any, TypeAlias
 
+from src.adapter.migrations import SchemaVersion, migrate
 from src.config import Config
-from src.model import Task, TaskId, View, ViewId
+from src.model import (
+    ChangePage,
+    ChangeSeq,
+    PartialTask,
+    Tag,
+    Task,
+    TaskId,
+    TaskSearchResult,
+    View,
+    ViewId,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -14,6 +30,38 @@ Success: TypeAlias = bool
 
 TASKS_TABLE_NAME = "tasks"
 VIEWS_TABLE_NAME = "views"
+TASK_TAGS_TABLE_NAME = "task_tags"
+TASK_EDGES_TABLE_NAME = "task_edges"
+VIEW_TAGS_TABLE_NAME = "view_tags"
+CHANGE_LOG_TABLE_NAME = "change_log"
+SYNC_STATE_TABLE_NAME = "sync_state"
+TASKS_SEARCH_TABLE_NAME = "tasks_fts"
+
+# Matches in titles weigh more than matches in contents
+_SEARCH_TITLE_WEIGHT = 10.0
+_SEARCH_CONTENT_WEIGHT = 1.0
+_SEARCH_SNIPPET_TOKENS = 24
+
+# Columns read back into a Task/View, in the order `_result_to_*` expects them
+TASK_COLUMNS = (
+    "id, title, created, updated, tags, blocked_by, blocks, completed, content"
+)
+VIEW_COLUMNS = "id, title, created, updated, tags, task_ids"
+
+# Task fields tasks can be projected onto, named like the columns they are read from
+TASK_FIELDS = tuple(column.strip() for column in TASK_COLUMNS.split(","))
+
+# Rows fetched from SQLite at a time when iterating over a whole table
+ITER_BATCH_SIZE = 500
+
+# Columns written from `_task_to_row`/`_view_to_row`
+TASK_ROW_COLUMNS = f"{TASK_COLUMNS}, updated_us"
+VIEW_ROW_COLUMNS = f"{VIEW_COLUMNS}, updated_us"
+
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.UTC)
+
+# Writes rely on `RETURNING`, which was added in SQLite 3.35.0
+MINIMUM_SQLITE_VERSION = (3, 35, 0)
 
 
 def _set_to_str(str_set: frozenset[str]) -> str:
@@ -37,6 +85,20 @@ def _bool_to_int(value: bool) -> int:
             )
 
 
+def _named_placeholders(columns: str) -> str:
+    return ", ".join(f":{column.strip()}" for column in columns.split(","))
+
+
+def _datetime_to_epoch_us(value: datetime.datetime) -> int:
+    """
+    Normalise datetimes into integers that sort chronologically across time zones.
+    Naive datetimes are assumed to be in UTC.
+    """
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.UTC)
+    return (value - _EPOCH) // datetime.timedelta(microseconds=1)
+
+
 def _view_to_row(view: View) -> SqliteRow:
     return {
         "id": view.id,
@@ -45,6 +107,7 @@ def _view_to_row(view: View) -> SqliteRow:
         "updated": view.updated.isoformat(),
         "tags": _set_to_str(view.tags),
         "task_ids": _list_to_str(view.task_ids),
+        "updated_us": _datetime_to_epoch_us(view.updated),
     }
 
 
@@ -59,6 +122,7 @@ def _task_to_row(task: Task) -> SqliteRow:
         "blocks": _set_to_str(task.blocks),
         "completed": _bool_to_int(task.completed),
         "content": task.content,
+        "updated_us": _datetime_to_epoch_us(task.updated),
     }
 
 
@@ -84,6 +148,66 @@ def _str_to_list(string: str) -> list[str]:
     return string.split(",")
 
 
+def _tag_rows(item_id: str, tags: Iterable[Tag]) -> list[tuple[str, Tag]]:
+    return [(item_id, tag) for tag in tags]
+
+
+def _edge_rows(
+    task_id: TaskId, blocked_by: Iterable[TaskId], blocks: Iterable[TaskId]
+) -> list[tuple[TaskId, str, TaskId]]:
+    return [
+        *((task_id, "blocked_by", other) for other in blocked_by),
+        *((task_id, "blocks", other) for other in blocks),
+    ]
+
+
+def _to_search_query(text: str) -> str:
+    """
+    Turn user input into an FTS5 query that matches tasks containing all words, so
+    that FTS5 operators and punctuation in the input are searched for literally.
+    The last word is treated as a prefix, to support search-as-you-type.
+    """
+    words = ['"' + word.replace('"', '""') + '"' for word in text.split()]
+    if words:
+        words[-1] = f"{words[-1]}*"
+    return " ".join(words)
+
+
+def _prefix_columns(columns: str, alias: str) -> str:
+    return ", ".join(f"{alias}.{column.strip()}" for column in columns.split(","))
+
+
+# Columns stored differently than the task fields they are read into
+_TASK_COLUMN_PARSERS: dict[str, Callable[[Any], Any]] = {
+    "created": datetime.datetime.fromisoformat,
+    "updated": datetime.datetime.fromisoformat,
+    "tags": _str_to_set,
+    "blocked_by": _str_to_set,
+    "blocks": _str_to_set,
+    "completed": _int_to_bool,
+}
+
+
+def _projected_task_columns(fields: Iterable[str]) -> list[str]:
+    """
+    Return the columns to read to project tasks onto `fields`, in the order of
+    `TASK_FIELDS`. The ID is always read, so that tasks can be told apart.
+    """
+    fields = set(fields)
+    if unknown := fields.difference(TASK_FIELDS):
+        raise ValueError(f"Unknown task fields: {', '.join(sorted(unknown))}")
+    return [column for column in TASK_FIELDS if column == "id" or column in fields]
+
+
+def _result_to_partial_task(columns: list[str], result: tuple) -> PartialTask:
+    partial: PartialTask = {}
+    for column, value in zip(columns, result, strict=True):
+        if parse := _TASK_COLUMN_PARSERS.get(column):
+            value = parse(value)
+        partial[column] = value
+    return partial
+
+
 def _result_to_task(result: tuple) -> Task:
     match result:
         case (
@@ -127,14 +251,148 @@ def _result_to_view(result: tuple) -> View:
             raise ValueError(f"Failed to convert DB result into View: {other}")
 
 
-def get_sqlite_connection(config: Config) -> sqlite3.Connection:
-    connection = sqlite3.connect(str(config.db_path))
+class _Connection(sqlite3.Connection):
+    """
+    Unlike `sqlite3.Connection`, it can be weakly referenced, so that caches can
+    keep track of what each connection last saw without keeping it open.
+    """
+
+
+def get_sqlite_connection(
+    config: Config, check_same_thread: bool = True, read_only: bool = False
+) -> sqlite3.Connection:
+    if read_only:
+        database = f"{config.db_path.absolute().as_uri()}?mode=ro"
+    else:
+        database = str(config.db_path)
+
+    connection = sqlite3.connect(
+        database,
+        timeout=config.db_busy_timeout_ms / 1000,
+        check_same_thread=check_same_thread,
+        uri=read_only,
+        factory=_Connection,
+    )
+
+    # PRAGMA does not accept bound parameters, values are validated in Config
+    connection.execute(f"PRAGMA busy_timeout = {config.db_busy_timeout_ms:d};")
+    connection.execute(f"PRAGMA synchronous = {config.db_synchronous};")
+    # Negative values are interpreted as KiB by SQLite, positive values as pages
+    connection.execute(f"PRAGMA cache_size = {-config.db_cache_size_kib:d};")
+    connection.execute(f"PRAGMA mmap_size = {config.db_mmap_size_bytes:d};")
+
     return connection
 
 
+def assert_sqlite_version_is_supported() -> None:
+    if sqlite3.sqlite_version_info < MINIMUM_SQLITE_VERSION:
+        minimum = ".".join(map(str, MINIMUM_SQLITE_VERSION))
+        raise UnsupportedSqliteVersion(
+            f"Expected SQLite {minimum} or newer, but found {sqlite3.sqlite_version}"
+        )
+
+
+@dataclass
+class _IdleConnection:
+    connection: sqlite3.Connection
+    released_at: float
+
+
+class ConnectionPool:
+    """
+    Keeps SQLite connections open across requests.
+
+    Each thread leases at most one connection at a time: the first `acquire` in a
+    thread takes an idle connection (or opens a new one) and any further `acquire`
+    in the same thread returns that very same connection until `release` is called.
+    Released connections go back to the pool, which keeps up to `size` of them and
+    closes those that have been idle for longer than `max_idle_seconds`.
+
+    A `read_only` pool opens connections that cannot write to the DB. In WAL mode
+    these never block, nor are blocked by, the writer.
+    """
+
+    def __init__(self, config: Config, read_only: bool = False) -> None:
+        self._config = config
+        self._read_only = read_only
+        self._size = config.db_pool_size
+        self._max_idle_seconds = config.db_pool_max_idle_seconds
+        self._idle: list[_IdleConnection] = []
+        self._lock = threading.Lock()
+        self._leases = threading.local()
+
+    def acquire(self) -> sqlite3.Connection:
+        if leased := getattr(self._leases, "connection", None):
+            return leased
+
+        connection = self._take_idle_connection() or self._connect()
+        self._leases.connection = connection
+        return connection
+
+    def release(self) -> None:
+        connection: sqlite3.Connection | None = getattr(
+            self._leases, "connection", None
+        )
+        if connection is None:
+            return
+
+        del self._leases.connection
+
+        if connection.in_transaction:
+            logger.warning("rolling back uncommitted changes on released connection")
+            connection.rollback()
+
+        with self._lock:
+            if len(self._idle) < self._size:
+                now = time.monotonic()
+                self._idle.append(_IdleConnection(connection, released_at=now))
+                return
+
+        connection.close()
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+
+        for item in idle:
+            item.connection.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        logger.debug(f"opening new connection to {self._config.db_path}")
+        # Connections are handed over between threads, but never shared at once
+        return get_sqlite_connection(
+            config=self._config, check_same_thread=False, read_only=self._read_only
+        )
+
+    def _take_idle_connection(self) -> sqlite3.Connection | None:
+        expired: list[_IdleConnection] = []
+        connection: sqlite3.Connection | None = None
+
+        with self._lock:
+            oldest_allowed = time.monotonic() - self._max_idle_seconds
+            # Idle connections are released in order, so expired ones are at the head
+            while self._idle and self._idle[0].released_at < oldest_allowed:
+                expired.append(self._idle.pop(0))
+
+            if self._idle:
+                # Most recently released first: its page cache is the warmest
+                connection = self._idle.pop().connection
+
+        for item in expired:
+            logger.debug("closing connection that has been idle for too long")
+            item.connection.close()
+
+        return connection
+
+
 class DbClient:
-    def __init__(self, config: Config) -> None:
-        self.connection = get_sqlite_connection(config=config)
+    def __init__(self, config: Config, pool: ConnectionPool | None = None) -> None:
+        self.config = config
+        if pool:
+            self.connection = pool.acquire()
+        else:
+            self.connection = get_sqlite_connection(config=config)
+        self._savepoints = 0
 
     def is_healthy(self) -> bool:
         _healthy_db_result = (1,)
@@ -143,38 +401,145 @@ class DbClient:
             results = self.connection.execute(query).fetchone()
             return results == _healthy_db_result
 
-    def create_tables_if_missing(self) -> None:
-        try:
-            self._create_tasks_table()
-            logger.info(f"{TASKS_TABLE_NAME!r} table created")
-        except Exception:
-            logger.info(
-                f"{TASKS_TABLE_NAME!r} table already existed, so it has not ben re-created"
+    def migrate(self) -> SchemaVersion:
+        return migrate(connection=self.connection)
+
+    def set_journal_mode(self) -> str:
+        """
+        Switch the DB file to the configured journal mode. The mode is stored in the
+        DB file itself, so this only needs to happen once, before serving requests.
+        """
+        desired = self.config.db_journal_mode
+        # PRAGMA does not accept bound parameters, value is validated in Config
+        query = f"PRAGMA journal_mode = {desired};"
+        (journal_mode,) = self.connection.execute(query).fetchone()
+        if journal_mode != desired:
+            logger.warning(
+                f"Requested {desired!r} journal mode, but DB is in {journal_mode!r}"
             )
+        return journal_mode
+
+    def dump_wipman(self, views: Iterable[View], tasks: Iterable[Task]) -> None:
+        """
+        Replace all views and tasks in the DB in a single transaction.
+
+        Rows are first streamed into temporary staging tables, which live outside
+        the DB file and therefore do not lock it. The DB file is only locked for
+        the final swap, and readers see either the old or the new data, but never
+        half-loaded or empty tables.
+        """
+        self.migrate()
+
+        staged = [
+            (TASKS_TABLE_NAME, TASK_ROW_COLUMNS, map(_task_to_row, tasks)),
+            (VIEWS_TABLE_NAME, VIEW_ROW_COLUMNS, map(_view_to_row, views)),
+        ]
 
         try:
-            self._create_views_table()
-            logger.info(f"{VIEWS_TABLE_NAME!r} table created")
+            for table_name, columns, rows in staged:
+                staging_table = f"temp.{table_name}_staging"
+                self.connection.execute(f"DROP TABLE IF EXISTS {staging_table};")
+                # Columns are not copied from the `main` table: reading it would
+                # start a read transaction on the DB file, which could then not be
+                # upgraded to write if someone else writes in the meantime
+                self.connection.execute(f"CREATE TABLE {staging_table} ({columns});")
+                self.connection.executemany(
+                    f"INSERT INTO {staging_table} ({columns})"
+                    f" VALUES ({_named_placeholders(columns)});",
+                    rows,
+                )
+            # Only the staging tables have been written so far
+            self.connection.commit()
+
+            with self.transaction():
+                for table_name, columns, _ in staged:
+                    staging_table = f"temp.{table_name}_staging"
+                    logger.debug(f"Swapping {table_name!r} table contents")
+                    self.connection.execute(f"DELETE FROM main.{table_name};")
+                    self.connection.execute(
+                        f"INSERT INTO main.{table_name} ({columns})"
+                        f" SELECT {columns} FROM {staging_table};"
+                    )
+
+                self._rebuild_relations()
         except Exception:
-            logger.info(
-                f"{VIEWS_TABLE_NAME!r} table already existed, so it has not ben re-created"
+            self.connection.rollback()
+            raise
+        finally:
+            for table_name, _, _ in staged:
+                self.connection.execute(
+                    f"DROP TABLE IF EXISTS temp.{table_name}_staging;"
+                )
+
+    def _rebuild_relations(self) -> None:
+        self.connection.execute(f"DELETE FROM {TASK_TAGS_TABLE_NAME};")
+        self.connection.execute(f"DELETE FROM {TASK_EDGES_TABLE_NAME};")
+        self.connection.execute(f"DELETE FROM {VIEW_TAGS_TABLE_NAME};")
+
+        tasks = self.connection.execute(
+            f"SELECT id, tags, blocked_by, blocks FROM {TASKS_TABLE_NAME};"
+        )
+        for task_id, tags, blocked_by, blocks in tasks:
+            self._insert_task_relations(
+                task_id=task_id,
+                tags=_str_to_set(tags),
+                blocked_by=_str_to_set(blocked_by),
+                blocks=_str_to_set(blocks),
             )
 
-    def dump_wipman(self, views: set[View], tasks: set[Task]) -> None:
-        self._drop_tasks_table_if_exists()
-        self._create_tasks_table()
+        views = self.connection.execute(f"SELECT id, tags FROM {VIEWS_TABLE_NAME};")
+        for view_id, tags in views:
+            self._insert_view_relations(view_id=view_id, tags=_str_to_set(tags))
+
+    def _insert_task_relations(
+        self,
+        task_id: TaskId,
+        tags: Iterable[Tag],
+        blocked_by: Iterable[TaskId],
+        blocks: Iterable[TaskId],
+    ) -> None:
+        self.connection.executemany(
+            f"INSERT INTO {TASK_TAGS_TABLE_NAME} (task_id, tag) VALUES (?, ?);",
+            _tag_rows(item_id=task_id, tags=tags),
+        )
+        self.connection.executemany(
+            f"INSERT INTO {TASK_EDGES_TABLE_NAME} (task_id, kind, other_task_id)"
+            " VALUES (?, ?, ?);",
+            _edge_rows(task_id=task_id, blocked_by=blocked_by, blocks=blocks),
+        )
+
+    def _delete_task_relations(self, task_id: TaskId) -> None:
+        params = (task_id,)
+        query = f"DELETE FROM {TASK_TAGS_TABLE_NAME} WHERE task_id = ?;"
+        self.connection.execute(query, params)
+        query = f"DELETE FROM {TASK_EDGES_TABLE_NAME} WHERE task_id = ?;"
+        self.connection.execute(query, params)
+
+    def _sync_task_relations(self, task: Task) -> None:
+        self._delete_task_relations(task_id=task.id)
+        self._insert_task_relations(
+            task_id=task.id,
+            tags=task.tags,
+            blocked_by=task.blocked_by,
+            blocks=task.blocks,
+        )
 
-        self._drop_views_table_if_exists()
-        self._create_views_table()
+    def _insert_view_relations(self, view_id: ViewId, tags: Iterable[Tag]) -> None:
+        self.connection.executemany(
+            f"INSERT INTO {VIEW_TAGS_TABLE_NAME} (view_id, tag) VALUES (?, ?);",
+            _tag_rows(item_id=view_id, tags=tags),
+        )
 
-        for view in views:
-            self.insert_view(view=view)
+    def _delete_view_relations(self, view_id: ViewId) -> None:
+        query = f"DELETE FROM {VIEW_TAGS_TABLE_NAME} WHERE view_id = ?;"
+        self.connection.execute(query, (view_id,))
 
-        for task in tasks:
-            self.insert_task(task=task)
+    def _sync_view_relations(self, view: View) -> None:
+        self._delete_view_relations(view_id=view.id)
+        self._insert_view_relations(view_id=view.id, tags=view.tags)
 
     def read_task(self, task_id: TaskId) -> Task | None:
-        query = f"SELECT * from {TASKS_TABLE_NAME} WHERE id = ?"
+        query = f"SELECT {TASK_COLUMNS} FROM {TASKS_TABLE_NAME} WHERE id = ?"
         with self.connection:
             result = self.connection.execute(query, (task_id,)).fetchone()
             if not result:
@@ -182,179 +547,538 @@ class DbClient:
             return _result_to_task(result)
 
     def read_view(self, view_id: ViewId) -> View | None:
-        query = f"SELECT * from {VIEWS_TABLE_NAME} WHERE id = ?"
+        query = f"SELECT {VIEW_COLUMNS} FROM {VIEWS_TABLE_NAME} WHERE id = ?"
         with self.connection:
             result = self.connection.execute(query, (view_id,)).fetchone()
             if not result:
                 return None
             return _result_to_view(result)
 
+    @contextmanager
+    def snapshot(self) -> Iterator[None]:
+        """
+        Make all reads inside the block see the DB as it was when the block started,
+        even if they are spread over time, like when streaming a response.
+        """
+        self.connection.execute("BEGIN;")
+        try:
+            yield
+        finally:
+            # Nothing has been written, rolling back just ends the read transaction
+            self.connection.rollback()
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """
+        Commit all writes inside the block together, or none of them if it raises.
+
+        Blocks nested inside another transaction become savepoints: when they raise,
+        only their own writes are undone and the outer transaction carries on.
+        """
+        if self.connection.in_transaction:
+            self._savepoints += 1
+            savepoint = f"savepoint_{self._savepoints}"
+            self.connection.execute(f"SAVEPOINT {savepoint};")
+            try:
+                yield
+            except BaseException:
+                self.connection.execute(f"ROLLBACK TO {savepoint};")
+                raise
+            finally:
+                self.connection.execute(f"RELEASE {savepoint};")
+            return
+
+        # Take the write lock upfront, rather than failing to upgrade a read lock
+        self.connection.execute("BEGIN IMMEDIATE;")
+        try:
+            yield
+        except BaseException:
+            self.connection.rollback()
+            raise
+        self.connection.commit()
+
+    def iter_tasks(self, after_id: TaskId | None = None) -> Generator[Task, None, None]:
+        """
+        Yield tasks ordered by ID, starting after `after_id` if provided, without
+        loading them all in memory at once.
+        """
+        query = (
+            f"SELECT {TASK_COLUMNS} FROM {TASKS_TABLE_NAME}" " WHERE id > ? ORDER BY id"
+        )
+        cursor = self.connection.execute(query, (after_id or "",))
+        while results := cursor.fetchmany(ITER_BATCH_SIZE):
+            yield from map(_result_to_task, results)
+
+    def iter_views(self, after_id: ViewId | None = None) -> Generator[View, None, None]:
+        """
+        Yield views ordered by ID, starting after `after_id` if provided, without
+        loading them all in memory at once.
+        """
+        query = (
+            f"SELECT {VIEW_COLUMNS} FROM {VIEWS_TABLE_NAME}" " WHERE id > ? ORDER BY id"
+        )
+        cursor = self.connection.execute(query, (after_id or "",))
+        while results := cursor.fetchmany(ITER_BATCH_SIZE):
+            yield from map(_result_to_view, results)
+
     def read_all_tasks(self) -> list[Task]:
         with self.connection:
-            query = f"SELECT * FROM {TASKS_TABLE_NAME} t"
+            query = f"SELECT {TASK_COLUMNS} FROM {TASKS_TABLE_NAME}"
             results = self.connection.execute(query).fetchall()
             tasks: list[Task] = list(map(_result_to_task, results))
             return tasks
 
     def read_all_views(self) -> list[View]:
         with self.connection:
-            query = f"SELECT * FROM {VIEWS_TABLE_NAME} t"
+            query = f"SELECT {VIEW_COLUMNS} FROM {VIEWS_TABLE_NAME}"
             results = self.connection.execute(query).fetchall()
             views: list[View] = list(map(_result_to_view, results))
             return views
 
     def read_tasks(self, updated_after: datetime.datetime) -> list[Task]:
+        query = (
+            f"SELECT {TASK_COLUMNS} FROM {TASKS_TABLE_NAME}"
+            " WHERE updated_us > ?"
+            " ORDER BY updated_us"
+        )
+        params = (_datetime_to_epoch_us(updated_after),)
         with self.connection:
-            query = (
-                f"SELECT * FROM {TASKS_TABLE_NAME} t"
-                f" WHERE datetime('{updated_after.isoformat()}') < t.updated"
-            )
-            results = self.connection.execute(query).fetchall()
+            results = self.connection.execute(query, params).fetchall()
             tasks: list[Task] = list(map(_result_to_task, results))
             return tasks
 
+    def read_partial_tasks(
+        self, updated_after: datetime.datetime, fields: Iterable[str]
+    ) -> list[PartialTask]:
+        """
+        Like `read_tasks`, but only reading the columns of the given task `fields`
+        (plus the ID), to skip the cost of large columns such as `content`.
+        """
+        columns = _projected_task_columns(fields)
+        query = (
+            f"SELECT {', '.join(columns)} FROM {TASKS_TABLE_NAME}"
+            " WHERE updated_us > ?"
+            " ORDER BY updated_us"
+        )
+        params = (_datetime_to_epoch_us(updated_after),)
+        with self.connection:
+            results = self.connection.execute(query, params).fetchall()
+            return [_result_to_partial_task(columns, result) for result in results]
+
     def read_views(self, updated_after: datetime.datetime) -> list[View]:
+        query = (
+            f"SELECT {VIEW_COLUMNS} FROM {VIEWS_TABLE_NAME}"
+            " WHERE updated_us > ?"
+            " ORDER BY updated_us"
+        )
+        params = (_datetime_to_epoch_us(updated_after),)
         with self.connection:
-            query = (
-                f"SELECT * FROM {VIEWS_TABLE_NAME} t"
-                f" WHERE datetime('{updated_after.isoformat()}') < t.updated"
-            )
-            results = self.connection.execute(query).fetchall()
+            results = self.connection.execute(query, params).fetchall()
             views: list[View] = list(map(_result_to_view, results))
             return views
 
-    def _drop_tasks_table_if_exists(self) -> None:
-        self._drop_table(table_name=TASKS_TABLE_NAME, raise_if_missing=False)
+    def read_changes(
+        self,
+        since: ChangeSeq,
+        limit: int,
+        task_fields: Iterable[str] | None = None,
+    ) -> ChangePage:
+        """
+        Return up to `limit` items changed after the `since` sequence number, in
+        the order they were last changed. Pass the returned cursor as `since` to
+        fetch the next page.
+
+        With `task_fields`, tasks are projected onto those fields like
+        `read_partial_tasks` does.
+        """
+        task_columns = None
+        if task_fields is not None:
+            task_columns = _projected_task_columns(task_fields)
+        query = (
+            f"SELECT seq FROM {CHANGE_LOG_TABLE_NAME}"
+            " WHERE seq > ? ORDER BY seq LIMIT 1 OFFSET ?"
+        )
+        with self.connection:
+            if 0 < since < self._read_compacted_until_seq():
+                return ChangePage(
+                    tasks=[],
+                    views=[],
+                    deleted_task_ids=[],
+                    deleted_view_ids=[],
+                    cursor=since,
+                    has_more=False,
+                    reset_required=True,
+                )
 
-    def _drop_views_table_if_exists(self) -> None:
-        self._drop_table(table_name=VIEWS_TABLE_NAME, raise_if_missing=False)
+            # Peek one past the page to tell if there are more changes after it
+            next_page_start = self.connection.execute(query, (since, limit)).fetchone()
+            if next_page_start:
+                until = next_page_start[0] - 1
+            else:
+                # Compaction may have removed the latest changes: the cursor must
+                # never go back, or clients would be sent changes they already have
+                query = (
+                    f"SELECT max(?, coalesce(max(seq), 0)) FROM {CHANGE_LOG_TABLE_NAME}"
+                )
+                (until,) = self.connection.execute(query, (since,)).fetchone()
 
-    def _drop_table(self, table_name: str, raise_if_missing: bool = True) -> None:
-        try:
-            self.connection.execute(f"DROP TABLE {table_name};")
-        except:
-            if raise_if_missing:
-                raise
+            params = (since, until)
+            columns = ", ".join(task_columns) if task_columns else TASK_COLUMNS
+            query = (
+                f"SELECT {_prefix_columns(columns, alias='t')}"
+                f" FROM {CHANGE_LOG_TABLE_NAME} c"
+                f" JOIN {TASKS_TABLE_NAME} t ON t.id = c.item_id"
+                " WHERE c.kind = 'task' AND c.seq > ? AND c.seq <= ?"
+                " ORDER BY c.seq"
+            )
+            results = self.connection.execute(query, params).fetchall()
+            tasks: list[Task] | list[PartialTask]
+            if task_columns:
+                tasks = [
+                    _result_to_partial_task(task_columns, result) for result in results
+                ]
+            else:
+                tasks = list(map(_result_to_task, results))
 
-    def _create_tasks_table(self) -> None:
-        table_name = TASKS_TABLE_NAME
-        with self.connection:
-            logger.debug(f"Creating {table_name!r} table")
-            self.connection.execute(
-                f"CREATE TABLE {table_name}"
-                "(id, title, created, updated, tags, blocked_by, blocks, completed, content)"
-                ";"
+            query = (
+                f"SELECT {_prefix_columns(VIEW_COLUMNS, alias='v')}"
+                f" FROM {CHANGE_LOG_TABLE_NAME} c"
+                f" JOIN {VIEWS_TABLE_NAME} v ON v.id = c.item_id"
+                " WHERE c.kind = 'view' AND c.seq > ? AND c.seq <= ?"
+                " ORDER BY c.seq"
             )
+            results = self.connection.execute(query, params).fetchall()
+            views: list[View] = list(map(_result_to_view, results))
 
-    def _create_views_table(self) -> None:
-        table_name = VIEWS_TABLE_NAME
-        with self.connection:
-            logger.debug(f"Creating {table_name!r} table")
-            self.connection.execute(
-                f"CREATE TABLE {table_name} (id, title, created, updated, tags, task_ids);"
+            query = (
+                f"SELECT kind, item_id FROM {CHANGE_LOG_TABLE_NAME}"
+                " WHERE seq > ? AND seq <= ? AND deleted_at_us IS NOT NULL"
+                " ORDER BY seq"
             )
+            tombstones = self.connection.execute(query, params).fetchall()
+
+        return ChangePage(
+            tasks=tasks,
+            views=views,
+            deleted_task_ids=[id for kind, id in tombstones if kind == "task"],
+            deleted_view_ids=[id for kind, id in tombstones if kind == "view"],
+            cursor=until,
+            has_more=next_page_start is not None,
+            reset_required=False,
+        )
 
-    def insert_task(self, task: Task) -> Task:
+    def read_version(self) -> str:
+        """
+        Return a value that changes whenever the result of any read could change:
+        every write bumps the change log sequence, and compaction drops tombstones.
+        """
         query = (
-            f"INSERT INTO {TASKS_TABLE_NAME} "
-            "(id, title, created, updated, tags, blocked_by, blocks, completed, content)"
-            " "
-            "VALUES "
-            "(?, ?, ?, ?, ?, ?, ?, ?, ?);"
+            "SELECT"
+            " (SELECT seq FROM sqlite_sequence WHERE name = ?),"
+            f" (SELECT value FROM {SYNC_STATE_TABLE_NAME}"
+            "   WHERE key = 'compacted_until_seq')"
         )
-        row = _task_to_row(task=task).values()
         with self.connection:
-            self.connection.execute(query, tuple(row))
-            inserted = self.read_task(task_id=task.id)
-            return inserted
-
-    def insert_view(self, view: View) -> View:
-        insert = (
-            f"INSERT INTO {VIEWS_TABLE_NAME} "
-            "(id, title, created, updated, tags, task_ids)"
-            " "
-            "VALUES "
-            "(?, ?, ?, ?, ?, ?);"
+            last_seq, compacted_until_seq = self.connection.execute(
+                query, (CHANGE_LOG_TABLE_NAME,)
+            ).fetchone()
+        return f"{last_seq or 0}.{compacted_until_seq}"
+
+    def read_last_change_seq(self) -> ChangeSeq:
+        # Not wrapped in `with self.connection`, which would commit the transaction
+        # this read may be part of
+        query = "SELECT seq FROM sqlite_sequence WHERE name = ?"
+        result = self.connection.execute(query, (CHANGE_LOG_TABLE_NAME,)).fetchone()
+        return result[0] if result else 0
+
+    def read_data_version(self) -> int:
+        """
+        Return a value that changes whenever another connection, from this or any
+        other process, commits changes to the DB. It is cheaper than reading any
+        table, but it is only comparable with values read from the same connection.
+        """
+        (data_version,) = self.connection.execute("PRAGMA data_version;").fetchone()
+        return data_version
+
+    def read_deleted_ids(
+        self, deleted_after: datetime.datetime
+    ) -> tuple[list[TaskId], list[ViewId]]:
+        query = (
+            f"SELECT kind, item_id FROM {CHANGE_LOG_TABLE_NAME}"
+            " WHERE deleted_at_us > ?"
+            " ORDER BY deleted_at_us"
         )
-
-        row = _view_to_row(view=view).values()
+        params = (_datetime_to_epoch_us(deleted_after),)
         with self.connection:
-            self.connection.execute(insert, tuple(row))
-            inserted = self.read_view(view_id=view.id)
-            return inserted
+            tombstones = self.connection.execute(query, params).fetchall()
+
+        task_ids = [id for kind, id in tombstones if kind == "task"]
+        view_ids = [id for kind, id in tombstones if kind == "view"]
+        return task_ids, view_ids
+
+    def compact_tombstones(self, deleted_before: datetime.datetime) -> int:
+        """
+        Forget deletions older than `deleted_before`, and return how many were
+        forgotten. Clients syncing from a cursor older than the forgotten deletions
+        are then asked to reload everything.
+        """
+        params = (_datetime_to_epoch_us(deleted_before),)
+        with self.transaction():
+            query = (
+                f"SELECT count(0), max(seq) FROM {CHANGE_LOG_TABLE_NAME}"
+                " WHERE deleted_at_us < ?"
+            )
+            count, until = self.connection.execute(query, params).fetchone()
+            if not count:
+                return 0
+
+            query = f"DELETE FROM {CHANGE_LOG_TABLE_NAME} WHERE deleted_at_us < ?"
+            self.connection.execute(query, params)
+
+            query = (
+                f"UPDATE {SYNC_STATE_TABLE_NAME} SET value = max(value, ?)"
+                " WHERE key = 'compacted_until_seq'"
+            )
+            self.connection.execute(query, (until,))
+
+        logger.info(f"Compacted {count} tombstones, up to sequence number {until}")
+        return count
 
-    def update_task(self, task: Task, upsert_if_needed: bool = False) -> Task:
-        row = _task_to_row(task=task).values()
+    def _read_compacted_until_seq(self) -> ChangeSeq:
+        query = (
+            f"SELECT value FROM {SYNC_STATE_TABLE_NAME}"
+            " WHERE key = 'compacted_until_seq'"
+        )
+        (seq,) = self.connection.execute(query).fetchone()
+        return seq
 
-        task_id, *remainder_fields = tuple(row)
+    def search_tasks(self, text: str, limit: int) -> list[TaskSearchResult]:
+        search_query = _to_search_query(text)
+        if not search_query:
+            return []
 
         query = dedent(
             f"""
-            UPDATE {TASKS_TABLE_NAME}
-            SET
-                title = ?,
-                created = ?,
-                updated = ?,
-                tags = ?,
-                blocked_by = ?,
-                blocks = ?,
-                completed = ?,
-                content = ?
-            WHERE id = ?
+            SELECT
+                t.id,
+                t.title,
+                t.completed,
+                snippet(
+                    {TASKS_SEARCH_TABLE_NAME}, 1, '<mark>', '</mark>', '…', ?
+                ),
+                bm25({TASKS_SEARCH_TABLE_NAME}, ?, ?) AS rank
+            FROM {TASKS_SEARCH_TABLE_NAME}
+            JOIN {TASKS_TABLE_NAME} t ON t.rowid = {TASKS_SEARCH_TABLE_NAME}.rowid
+            WHERE {TASKS_SEARCH_TABLE_NAME} MATCH ?
+            ORDER BY rank
+            LIMIT ?
             ;
             """
         ).strip()
-
-        # must be in the right order
-        params = (*remainder_fields, task_id)
+        params = (
+            _SEARCH_SNIPPET_TOKENS,
+            _SEARCH_TITLE_WEIGHT,
+            _SEARCH_CONTENT_WEIGHT,
+            search_query,
+            limit,
+        )
 
         with self.connection:
-            self.connection.execute(query, params)
-            updated = self.read_task(task_id=task.id)
+            results = self.connection.execute(query, params).fetchall()
 
-            if not updated and upsert_if_needed:
-                self.insert_task(task=task)
-                inserted = self.read_task(task_id=task.id)
-                if not inserted:
-                    raise FailedToUpsertTask()
-                return inserted
-
-            return updated
+        return [
+            TaskSearchResult(
+                id=id,
+                title=title,
+                completed=_int_to_bool(completed),
+                snippet=snippet,
+                rank=rank,
+            )
+            for id, title, completed, snippet, rank in results
+        ]
 
-    def update_view(self, view: View, upsert_if_needed: bool = False) -> View:
-        row = _view_to_row(view=view).values()
+    def read_tasks_with_tag(
+        self, tag: Tag, completed: bool | None = None
+    ) -> list[Task]:
+        query = (
+            f"SELECT {_prefix_columns(TASK_COLUMNS, alias='t')}"
+            f" FROM {TASK_TAGS_TABLE_NAME} tt"
+            f" JOIN {TASKS_TABLE_NAME} t ON t.id = tt.task_id"
+            " WHERE tt.tag = ?"
+        )
+        params: tuple[str | int, ...] = (tag,)
+        if completed is not None:
+            query += " AND t.completed = ?"
+            params = (*params, _bool_to_int(completed))
 
-        view_id, *remainder_fields = tuple(row)
+        with self.connection:
+            results = self.connection.execute(query, params).fetchall()
+            tasks: list[Task] = list(map(_result_to_task, results))
+            return tasks
 
+    def read_tasks_blocked_by(self, task_id: TaskId) -> list[Task]:
+        """
+        Return the tasks blocked by `task_id`, regardless of whether the dependency
+        was declared in the blocked task (`blocked_by`) or in the blocker (`blocks`).
+        """
         query = dedent(
             f"""
-            UPDATE {VIEWS_TABLE_NAME}
-            SET
-                title = ?,
-                created = ?,
-                updated = ?,
-                tags = ?,
-                task_ids = ?
-            WHERE id = ?
+            SELECT {TASK_COLUMNS} FROM {TASKS_TABLE_NAME}
+            WHERE id IN (
+                SELECT task_id FROM {TASK_EDGES_TABLE_NAME}
+                WHERE other_task_id = :task_id AND kind = 'blocked_by'
+                UNION
+                SELECT other_task_id FROM {TASK_EDGES_TABLE_NAME}
+                WHERE task_id = :task_id AND kind = 'blocks'
+            )
             ;
             """
         ).strip()
+        params = {"task_id": task_id}
 
-        # must be in the right order
-        params = (*remainder_fields, view_id)
+        with self.connection:
+            results = self.connection.execute(query, params).fetchall()
+            tasks: list[Task] = list(map(_result_to_task, results))
+            return tasks
 
+    def read_views_with_tag(self, tag: Tag) -> list[View]:
+        query = (
+            f"SELECT {_prefix_columns(VIEW_COLUMNS, alias='v')}"
+            f" FROM {VIEW_TAGS_TABLE_NAME} vt"
+            f" JOIN {VIEWS_TABLE_NAME} v ON v.id = vt.view_id"
+            " WHERE vt.tag = ?"
+        )
         with self.connection:
-            self.connection.execute(query, params)
-            updated = self.read_view(view_id=view.id)
+            results = self.connection.execute(query, (tag,)).fetchall()
+            views: list[View] = list(map(_result_to_view, results))
+            return views
 
-            if not updated and upsert_if_needed:
-                self.insert_view(view=view)
-                inserted = self.read_view(view_id=view.id)
-                if not inserted:
+    def insert_task(self, task: Task) -> Task:
+        query = (
+            f"INSERT INTO {TASKS_TABLE_NAME} ({TASK_ROW_COLUMNS})"
+            f" VALUES ({_named_placeholders(TASK_ROW_COLUMNS)})"
+            f" RETURNING {TASK_COLUMNS};"
+        )
+        row = _task_to_row(task=task)
+        with self.transaction():
+            result = self.connection.execute(query, row).fetchone()
+            self._insert_task_relations(
+                task_id=task.id,
+                tags=task.tags,
+                blocked_by=task.blocked_by,
+                blocks=task.blocks,
+            )
+            return _result_to_task(result)
+
+    def insert_view(self, view: View) -> View:
+        query = (
+            f"INSERT INTO {VIEWS_TABLE_NAME} ({VIEW_ROW_COLUMNS})"
+            f" VALUES ({_named_placeholders(VIEW_ROW_COLUMNS)})"
+            f" RETURNING {VIEW_COLUMNS};"
+        )
+        row = _view_to_row(view=view)
+        with self.transaction():
+            result = self.connection.execute(query, row).fetchone()
+            self._insert_view_relations(view_id=view.id, tags=view.tags)
+            return _result_to_view(result)
+
+    def update_task(self, task: Task, upsert_if_needed: bool = False) -> Task | None:
+        if upsert_if_needed:
+            query = dedent(
+                f"""
+                INSERT INTO {TASKS_TABLE_NAME} ({TASK_ROW_COLUMNS})
+                VALUES ({_named_placeholders(TASK_ROW_COLUMNS)})
+                ON CONFLICT (id) DO UPDATE SET
+                    title = excluded.title,
+                    created = excluded.created,
+                    updated = excluded.updated,
+                    tags = excluded.tags,
+                    blocked_by = excluded.blocked_by,
+                    blocks = excluded.blocks,
+                    completed = excluded.completed,
+                    content = excluded.content,
+                    updated_us = excluded.updated_us
+                RETURNING {TASK_COLUMNS}
+                ;
+                """
+            ).strip()
+        else:
+            query = dedent(
+                f"""
+                UPDATE {TASKS_TABLE_NAME}
+                SET
+                    title = :title,
+                    created = :created,
+                    updated = :updated,
+                    tags = :tags,
+                    blocked_by = :blocked_by,
+                    blocks = :blocks,
+                    completed = :completed,
+                    content = :content,
+                    updated_us = :updated_us
+                WHERE id = :id
+                RETURNING {TASK_COLUMNS}
+                ;
+                """
+            ).strip()
+
+        params = _task_to_row(task=task)
+
+        with self.transaction():
+            result = self.connection.execute(query, params).fetchone()
+            if not result:
+                if upsert_if_needed:
+                    raise FailedToUpsertTask()
+                return None
+
+            self._sync_task_relations(task=task)
+            return _result_to_task(result)
+
+    def update_view(self, view: View, upsert_if_needed: bool = False) -> View | None:
+        if upsert_if_needed:
+            query = dedent(
+                f"""
+                INSERT INTO {VIEWS_TABLE_NAME} ({VIEW_ROW_COLUMNS})
+                VALUES ({_named_placeholders(VIEW_ROW_COLUMNS)})
+                ON CONFLICT (id) DO UPDATE SET
+                    title = excluded.title,
+                    created = excluded.created,
+                    updated = excluded.updated,
+                    tags = excluded.tags,
+                    task_ids = excluded.task_ids,
+                    updated_us = excluded.updated_us
+                RETURNING {VIEW_COLUMNS}
+                ;
+                """
+            ).strip()
+        else:
+            query = dedent(
+                f"""
+                UPDATE {VIEWS_TABLE_NAME}
+                SET
+                    title = :title,
+                    created = :created,
+                    updated = :updated,
+                    tags = :tags,
+                    task_ids = :task_ids,
+                    updated_us = :updated_us
+                WHERE id = :id
+                RETURNING {VIEW_COLUMNS}
+                ;
+                """
+            ).strip()
+
+        params = _view_to_row(view=view)
+
+        with self.transaction():
+            result = self.connection.execute(query, params).fetchone()
+            if not result:
+                if upsert_if_needed:
                     raise FailedToUpsertView()
-                return inserted
+                return None
 
-            return updated
+            self._sync_view_relations(view=view)
+            return _result_to_view(result)
 
     def delete_task(self, task_id: TaskId) -> TaskId:
         query = dedent(
@@ -366,7 +1090,7 @@ class DbClient:
         ).strip()
         params = (task_id,)
 
-        with self.connection:
+        with self.transaction():
             cursor = self.connection.execute(query, params)
             success = cursor.rowcount == 1
             if not success:
@@ -374,6 +1098,7 @@ class DbClient:
                     "Expected to find only 1 row for the provided deletion criteria, but "
                     f"found {cursor.rowcount} instead. Changes will be rolled back"
                 )
+            self._delete_task_relations(task_id=task_id)
             return task_id
 
     def delete_view(self, view_id: ViewId) -> TaskId:
@@ -386,7 +1111,7 @@ class DbClient:
         ).strip()
         params = (view_id,)
 
-        with self.connection:
+        with self.transaction():
             cursor = self.connection.execute(query, params)
             success = cursor.rowcount == 1
             if not success:
@@ -394,6 +1119,7 @@ class DbClient:
                     "Expected to find only 1 row for the provided deletion criteria, but "
                     f"found {cursor.rowcount} instead. Changes will be rolled back"
                 )
+            self._delete_view_relations(view_id=view_id)
             return view_id
 
 
@@ -411,3 +1137,7 @@ class FailedToUpsertTask(Exception):
 
 class FailedToUpsertView(Exception):
     ...
+
+
+class UnsupportedSqliteVersion(Exception):
+    ...
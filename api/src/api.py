@@ -1,182 +1,198 @@
-import datetime
+"""
+The API, for WSGI servers. Routes are defined in `src.routes`: this module only
+serves them with Flask.
+
+Each event stream of `/subscribe` holds a server thread for as long as its client
+stays connected, so only half of the `SERVER_THREADS` of each worker may serve
+them at once. Serve `src.asgi` instead to keep many subscribers connected.
+"""
 import logging
+import re
+import threading
+from collections.abc import Generator, Iterator
 
-from flask import Flask, jsonify, make_response, request
+from flask import Blueprint, Flask, Response, current_app, request, stream_with_context
 from flask_cors import CORS
-from src.adapter.json import json_to_task, json_to_view, task_to_json, view_to_json
-from src.config import get_config
-from src.model import TaskId, ViewId
-from src.use_cases.health import service_is_healthy
-from src.use_cases.read_from_db import read_tasks_updated_after, read_view_updated_after
-from src.use_cases.set_up_minimum_db import set_up_minimum_db
-from src.use_cases.update_items import (
-    create_task,
-    create_view,
-    delete_task,
-    delete_view,
-    update_task,
-    update_view,
+
+from src.adapter.notifier import change_notifier
+from src.config import Config, get_config
+from src.routes import (
+    EVENT_STREAM_MIMETYPE,
+    KEEP_ALIVE_EVENT,
+    ROUTES,
+    SUBSCRIBE_RETRY_MS,
+    ApiState,
+    Handler,
+    HttpRequest,
+    HttpResponse,
+    check_api_token,
+    handle,
+    json_response,
+    new_api_state,
+    set_up_db,
 )
 
 logger = logging.getLogger(__name__)
 
-config = get_config()
-
-app = Flask(__name__)
-
-# TODO; narrow down CORS allowed domain
-CORS(app)
-
-
-@app.route("/health", methods=["GET"])
-def health():
-    # Ideas: https://stackoverflow.com/questions/25389261/which-http-status-code-should-i-use-for-a-health-check-failure
-
-    in_debug_mode = True  # TODO: get this from...where? see WIP - take if from config
-
-    is_healthy, reason = service_is_healthy(config=config)
-
-    status = 200 if is_healthy else 503
-    payload = {"isHealthy": is_healthy}
-    if in_debug_mode and not is_healthy:
-        payload.update({"reason": reason or "unknown"})
-
-    return payload, status
-
-
-@app.route("/get-all", methods=["GET"])
-def get_all():
-    t = datetime.datetime.min
-
-    tasks = read_tasks_updated_after(t=t, config=config)
-    views = read_view_updated_after(t=t, config=config)
-
-    # TODO: use marshmallow to serialize/deserialize/validate
-    json_tasks = list(map(task_to_json, tasks))
-    json_views = list(map(view_to_json, views))
-
-    return {"tasks": json_tasks, "views": json_views}
-
-
-@app.route("/changes", methods=["GET"])
-def changes_after_date():
-    # TODO: add marshmallow to serialize/deserialize/validate
-    t = datetime.datetime.fromisoformat(request.json["after"])
+api = Blueprint("api", __name__)
 
-    tasks = read_tasks_updated_after(t=t, config=config)
-    views = read_view_updated_after(t=t, config=config)
 
-    # TODO: use marshmallow to serialize/deserialize/validate
-    json_tasks = list(map(task_to_json, tasks))
-    json_views = list(map(view_to_json, views))
+def _state() -> ApiState:
+    return current_app.extensions["wipman"]
 
-    return {"tasks": json_tasks, "views": json_views}
 
+def _event_stream_slots() -> threading.BoundedSemaphore:
+    return current_app.extensions["wipman_event_stream_slots"]
 
-@app.route("/task", methods=["POST"])
-def create_task_route():
-    # TODO: use marshmallow to serialize/deserialize/validate
-    task = json_to_task(request.json["task"])
 
-    created = create_task(task=task, config=config)
+def max_event_streams(config: Config) -> int:
+    # Leave threads for the requests that do not wait
+    return max(1, config.server_threads // 2)
 
-    # TODO: use marshmallow to serialize/deserialize/validate
-    return {"created_task": task_to_json(task=created)}
 
+def release_db_connections(_: BaseException | None) -> None:
+    state = _state()
+    state.pool.release()
+    state.read_pool.release()
 
-@app.route("/view", methods=["POST"])
-def create_view_route():
-    # TODO: use marshmallow to serialize/deserialize/validate
-    view = json_to_view(request.json["view"])
 
-    created = create_view(view=view, config=config)
+def _to_http_request() -> HttpRequest:
+    return HttpRequest(
+        method=request.method,
+        path=request.path,
+        query_string=request.query_string.decode(),
+        args=request.args,
+        headers=request.headers,
+        body=request.get_data(),
+        path_params=request.view_args or {},
+    )
 
-    # TODO: use marshmallow to serialize/deserialize/validate
-    return {"created_view": view_to_json(view=created)}
 
+def _wait_between_chunks(
+    state: ApiState, chunks: Generator[bytes | None, None, None]
+) -> Generator[bytes, None, None]:
+    """
+    Send the chunks of a streamed response, waiting for the DB to be written to
+    whenever they ask to. Waiting holds the thread serving the request.
+    """
+    try:
+        while True:
+            # Read before producing a chunk, so that no write goes unnoticed
+            generation = change_notifier.generation
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                return
 
-@app.route("/task", methods=["PUT"])
-def update_task_route():
-    # TODO: use marshmallow to serialize/deserialize/validate
-    task = json_to_task(request.json["task"])
+            if chunk is not None:
+                yield chunk
+                continue
 
-    updated = update_task(task=task, config=config)
+            # Do not hold on to a connection while waiting
+            state.read_pool.release()
+            # Check the DB again now and then, even if no write is notified
+            timeout = state.config.subscribe_poll_interval_seconds
+            if change_notifier.wait(generation, timeout=timeout) == generation:
+                yield KEEP_ALIVE_EVENT
+    finally:
+        chunks.close()
 
-    # TODO: use marshmallow to serialize/deserialize/validate
-    return {"updated_task": task_to_json(task=updated)}
 
+def _to_flask_response(state: ApiState, response: HttpResponse) -> Response:
+    body: bytes | Iterator[bytes]
+    if response.stream is None:
+        body = response.body
+    else:
+        body = stream_with_context(_wait_between_chunks(state, response.stream))
+
+    return Response(
+        body,
+        status=response.status,
+        headers=response.headers,
+        mimetype=response.media_type,
+    )
+
+
+def _view(handler: Handler):
+    def view(**_):
+        state = _state()
+        response = handle(handler, state=state, request=_to_http_request())
+        if response.media_type != EVENT_STREAM_MIMETYPE:
+            return _to_flask_response(state, response)
+
+        slots = _event_stream_slots()
+        if not slots.acquire(blocking=False):
+            response.stream.close()
+            response = json_response(
+                {"error": "too many event streams, try again later"}, status=503
+            )
+            response.headers["Retry-After"] = str(SUBSCRIBE_RETRY_MS // 1000)
+            return _to_flask_response(state, response)
 
-@app.route("/view", methods=["PUT"])
-def update_view_route():
-    # TODO: use marshmallow to serialize/deserialize/validate
-    view = json_to_view(request.json["view"])
-
-    updated = update_view(view=view, config=config)
-
-    # TODO: use marshmallow to serialize/deserialize/validate
-    return {"updated_view": view_to_json(view=updated)}
-
+        flask_response = _to_flask_response(state, response)
+        flask_response.call_on_close(slots.release)
+        return flask_response
 
-@app.route("/task/<task_id>", methods=["DELETE"])
-def delete_task_route(task_id: TaskId):
-    # TODO: use marshmallow to serialize/deserialize/validate
-    deleted_id = delete_task(task_id=task_id, config=config)
+    view.__name__ = handler.__name__
+    return view
 
-    # TODO: use marshmallow to serialize/deserialize/validate
-    return {"deleted_task_id": deleted_id}
 
+for route in ROUTES:
+    rule = re.sub(r"{(\w+)}", r"<\1>", route.path)
+    api.add_url_rule(rule, view_func=_view(route.handler), methods=[route.method])
 
-@app.route("/view/<view_id>", methods=["DELETE"])
-def delete_view_route(view_id: ViewId):
-    # TODO: use marshmallow to serialize/deserialize/validate
-    deleted_id = delete_view(view_id=view_id, config=config)
 
-    # TODO: use marshmallow to serialize/deserialize/validate
-    return {"deleted_view_id": deleted_id}
+def require_api_token() -> Response | None:
+    state = _state()
+    if response := check_api_token(state=state, request=_to_http_request()):
+        return _to_flask_response(state, response)
+    return None
 
 
-if __name__ == "__main__":
-    logging.basicConfig(level=logging.INFO)
+def create_app(config: Config | None = None) -> Flask:
+    """
+    Build the API application, and make sure its DB is ready to be served.
 
+    Every process serving the API builds its own application, with its own DB
+    connection pools: connections must not be shared across forked processes.
+    """
+    config = config or get_config()
     logger.info(f"config: {config}")
 
-    if not config.db_path.exists():
-        exit(
-            f"Expected to find DB file at {config.db_path.absolute()} but"
-            " it does not exist. Aborting..."
-        )
+    set_up_db(config=config)
 
-    set_up_minimum_db(config=config)
+    app = Flask(__name__)
+    app.extensions["wipman"] = new_api_state(config=config)
+    app.extensions["wipman_event_stream_slots"] = threading.BoundedSemaphore(
+        max_event_streams(config=config)
+    )
 
-    if expected_token := config.api_token:
+    # TODO; narrow down CORS allowed domain
+    CORS(app)
+
+    if config.api_token:
         logger.info(
             "token validation middleware has enabled with API token found in config"
         )
-
-        @app.before_request
-        def before_request_callback():
-            if request.method == "OPTIONS":
-                return  # let the request in
-
-            if token := request.headers.get("x-api-key"):
-                if token == expected_token:
-                    logger.debug("incoming request carries a valid API token")
-                    return  # let the request in
-                else:
-                    logger.debug("incoming request carries an invalid API token")
-
-            logger.warning("incoming request is missing an API token")
-            return make_response(
-                jsonify({"error": "missing or invalid token"}),
-                401,
-            )
-
+        app.before_request(require_api_token)
     else:
         logger.info(
             "token validation middleware has been disabled because no API token"
             " found in config"
         )
 
+    app.teardown_appcontext(release_db_connections)
+    app.register_blueprint(api)
+
+    return app
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    config = get_config()
+    app = create_app(config=config)
+
     # By default, flask serves in `localhost`, which makes the webserver
     # inaccessible once you containerize it.
     host = "0.0.0.0"
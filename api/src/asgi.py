@@ -0,0 +1,213 @@
+"""
+Asynchronous variant of the API, for ASGI servers. It serves the routes of
+`src.routes` like `src.api` does, but requests waiting on the DB do not hold a
+thread each: DB work runs on a bounded pool of `ASYNC_DB_THREADS` threads, so that
+a single process can keep many slow or streaming clients connected.
+
+Usage (from the `api` directory):
+
+    uvicorn --factory src.asgi:create_asgi_app --host 0.0.0.0 --port 5000
+"""
+import asyncio
+import logging
+from collections.abc import AsyncIterator, Callable, Generator
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import TypeVar
+
+import anyio
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route
+
+from src.adapter.notifier import change_notifier
+from src.config import Config, get_config
+from src.routes import (
+    KEEP_ALIVE_EVENT,
+    ROUTES,
+    ApiState,
+    Handler,
+    HttpRequest,
+    HttpResponse,
+    check_api_token,
+    handle,
+    new_api_state,
+    set_up_db,
+)
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Tells a stream that ran out of chunks apart from a chunk that is None
+_END_OF_STREAM = object()
+
+
+@dataclass(frozen=True)
+class AsgiState:
+    api: ApiState
+    # Bounds how many DB calls run at once, and therefore how many threads are used
+    db_threads: anyio.CapacityLimiter
+
+
+def _state(request: Request) -> AsgiState:
+    return request.app.state.wipman
+
+
+async def _run_in_db_thread(state: AsgiState, function: Callable[..., T], *args) -> T:
+    def call() -> T:
+        try:
+            return function(*args)
+        finally:
+            # Connections are leased per thread, and the next call of this request
+            # may run on a different thread
+            state.api.pool.release()
+            state.api.read_pool.release()
+
+    return await anyio.to_thread.run_sync(call, limiter=state.db_threads)
+
+
+async def _to_http_request(request: Request, read_body: bool = True) -> HttpRequest:
+    return HttpRequest(
+        method=request.method,
+        path=request.url.path,
+        query_string=request.url.query,
+        args=request.query_params,
+        headers=request.headers,
+        body=await request.body() if read_body else b"",
+        path_params=request.path_params,
+    )
+
+
+async def _wait_between_chunks(
+    state: AsgiState, chunks: Generator[bytes | None, None, None]
+) -> AsyncIterator[bytes]:
+    """
+    Send the chunks of a streamed response, waiting for the DB to be written to
+    whenever they ask to. Chunks are produced on DB threads, and waiting holds no
+    thread at all.
+    """
+    loop = asyncio.get_running_loop()
+    wake_up = asyncio.Event()
+
+    def listener() -> None:
+        # Called from the thread that wrote to the DB
+        loop.call_soon_threadsafe(wake_up.set)
+
+    change_notifier.add_listener(listener)
+    try:
+        while True:
+            # Clear before producing a chunk, so that no write goes unnoticed
+            wake_up.clear()
+            chunk = await _run_in_db_thread(state, next, chunks, _END_OF_STREAM)
+            if chunk is _END_OF_STREAM:
+                return
+
+            if chunk is not None:
+                yield chunk
+                continue
+
+            # Check the DB again now and then, even if no write is notified
+            timeout = state.api.config.subscribe_poll_interval_seconds
+            with anyio.move_on_after(timeout):
+                await wake_up.wait()
+
+            if not wake_up.is_set():
+                yield KEEP_ALIVE_EVENT
+    finally:
+        change_notifier.remove_listener(listener)
+        chunks.close()
+
+
+def _to_starlette_response(state: AsgiState, response: HttpResponse) -> Response:
+    if response.stream is None:
+        return Response(
+            response.body,
+            status_code=response.status,
+            headers=response.headers,
+            media_type=response.media_type,
+        )
+
+    return StreamingResponse(
+        _wait_between_chunks(state, response.stream),
+        status_code=response.status,
+        headers=response.headers,
+        media_type=response.media_type,
+    )
+
+
+def _endpoint(handler: Handler):
+    async def endpoint(request: Request) -> Response:
+        state = _state(request)
+        http_request = await _to_http_request(request)
+        response = await _run_in_db_thread(
+            state, handle, handler, state.api, http_request
+        )
+        return _to_starlette_response(state, response)
+
+    endpoint.__name__ = handler.__name__
+    return endpoint
+
+
+routes = [
+    Route(route.path, _endpoint(route.handler), methods=[route.method])
+    for route in ROUTES
+]
+
+
+async def require_api_token(
+    request: Request, call_next: RequestResponseEndpoint
+) -> Response:
+    state = _state(request)
+    # The body is left for the endpoint to read
+    http_request = await _to_http_request(request, read_body=False)
+    if response := check_api_token(state.api, http_request):
+        return _to_starlette_response(state, response)
+    return await call_next(request)  # let the request in
+
+
+def create_asgi_app(config: Config | None = None) -> Starlette:
+    """
+    Build the asynchronous API application, and make sure its DB is ready to be
+    served.
+    """
+    config = config or get_config()
+    logger.info(f"config: {config}")
+
+    set_up_db(config=config)
+
+    state = AsgiState(
+        api=new_api_state(config=config),
+        db_threads=anyio.CapacityLimiter(config.async_db_threads),
+    )
+
+    @asynccontextmanager
+    async def lifespan(app: Starlette) -> AsyncIterator[None]:
+        yield
+        state.api.pool.close()
+        state.api.read_pool.close()
+
+    # TODO; narrow down CORS allowed domain
+    middleware = [
+        Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"]),
+    ]
+    if config.api_token:
+        logger.info(
+            "token validation middleware has enabled with API token found in config"
+        )
+        middleware.append(Middleware(BaseHTTPMiddleware, dispatch=require_api_token))
+    else:
+        logger.info(
+            "token validation middleware has been disabled because no API token"
+            " found in config"
+        )
+
+    app = Starlette(
+        debug=config.debug, routes=routes, middleware=middleware, lifespan=lifespan
+    )
+    app.state.wipman = state
+    return app
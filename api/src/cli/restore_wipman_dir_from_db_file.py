@@ -20,13 +20,20 @@ def parse_arguments() -> argparse.Namespace:
         "--db-path",
         help="Overwrites the DB_PATH environment variable",
     )
+    parser.add_argument(
+        "--fsync",
+        action="store_true",
+        help="Flush restored files to disk before finishing",
+    )
     parser.add_argument("-v", "--verbose", action="store_true", help="Show debug logs")
     args = parser.parse_args()
     return args
 
 
 def restore_wipman_dir_from_db_file_cmd(
-    wipman_dir: str | None = None, db_path: str | None = None
+    wipman_dir: str | None = None,
+    db_path: str | None = None,
+    fsync: bool = False,
 ) -> None:
     config = get_config()
     if wipman_dir:
@@ -34,7 +41,7 @@ def restore_wipman_dir_from_db_file_cmd(
     if db_path:
         config = config.extend(db_path=Path(db_path))
 
-    restore_wipman_dir_from_db_file(config=config)
+    restore_wipman_dir_from_db_file(config=config, fsync=fsync)
 
 
 if __name__ == "__main__":
@@ -45,5 +52,7 @@ if __name__ == "__main__":
     logger.debug("Verbose mode: ON")
 
     restore_wipman_dir_from_db_file_cmd(
-        wipman_dir=arguments.wipman_dir, db_path=arguments.db_path
+        wipman_dir=arguments.wipman_dir,
+        db_path=arguments.db_path,
+        fsync=arguments.fsync,
     )
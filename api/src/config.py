@@ -7,6 +7,12 @@ from typing import Any, Self
 
 logger = logging.getLogger(__name__)
 
+JOURNAL_MODES = {"delete", "truncate", "persist", "memory", "wal", "off"}
+SYNCHRONOUS_MODES = {"off", "normal", "full", "extra"}
+
+# Default number of server workers and of processes loading the wipman dir
+CPU_COUNT = os.cpu_count() or 1
+
 
 @dataclass(frozen=True)
 class Config:
@@ -14,8 +20,39 @@ class Config:
     db_path: Path | None
     api_token: str | None
     debug: bool = False
-
-    def extend(self: Self, **changes: dict[str, Any]) -> Self:
+    db_pool_size: int = 8
+    db_pool_max_idle_seconds: float = 300.0
+    db_journal_mode: str = "wal"
+    db_synchronous: str = "normal"
+    db_busy_timeout_ms: int = 5_000
+    db_cache_size_kib: int = 16_384
+    db_mmap_size_bytes: int = 268_435_456
+    tombstone_retention_days: int = 90
+    compression_min_size_bytes: int = 1_024
+    compression_gzip_level: int = 6
+    compression_zstd_level: int = 3
+    compression_cache_max_bytes: int = 33_554_432
+    item_cache_max_bytes: int = 67_108_864
+    server_workers: int = CPU_COUNT
+    server_threads: int = 4
+    async_db_threads: int = 8
+    subscribe_poll_interval_seconds: float = 15.0
+    db_watch_interval_seconds: float = 0.25
+    load_workers: int = CPU_COUNT
+
+    def __post_init__(self) -> None:
+        if self.db_journal_mode not in JOURNAL_MODES:
+            raise ValueError(
+                f"got db_journal_mode={self.db_journal_mode!r}, but expected one of"
+                f" {JOURNAL_MODES}"
+            )
+        if self.db_synchronous not in SYNCHRONOUS_MODES:
+            raise ValueError(
+                f"got db_synchronous={self.db_synchronous!r}, but expected one of"
+                f" {SYNCHRONOUS_MODES}"
+            )
+
+    def extend(self: Self, **changes: Any) -> Self:
         return replace(self, **changes)
 
 
@@ -39,6 +76,30 @@ def _optional_str_from_env(envvar: str) -> str | None:
         return None
 
 
+def _optional_int_from_env(envvar: str, default_value: int) -> int:
+    try:
+        return int(os.environ[envvar])
+    except KeyError:
+        logger.info(f"environment variable {envvar} is not set")
+        return default_value
+
+
+def _optional_float_from_env(envvar: str, default_value: float) -> float:
+    try:
+        return float(os.environ[envvar])
+    except KeyError:
+        logger.info(f"environment variable {envvar} is not set")
+        return default_value
+
+
+def _optional_lowercase_str_from_env(envvar: str, default_value: str) -> str:
+    if value := os.environ.get(envvar):
+        return value.lower()
+    else:
+        logger.info(f"environment variable {envvar} is not set")
+        return default_value
+
+
 def _bool_from_env(envvar: str) -> bool:
     _true = {"TRUE", "Y", "YES"}
     _false = {"FALSE", "N", "NO"}
@@ -71,4 +132,53 @@ def get_config() -> Config:
         db_path=_optional_path_from_env("DB_PATH"),
         api_token=_optional_str_from_env("API_TOKEN"),
         debug=_optional_bool_from_env("DEBUG", default_value=False),
+        db_pool_size=_optional_int_from_env("DB_POOL_SIZE", default_value=8),
+        db_pool_max_idle_seconds=_optional_float_from_env(
+            "DB_POOL_MAX_IDLE_SECONDS", default_value=300.0
+        ),
+        db_journal_mode=_optional_lowercase_str_from_env(
+            "DB_JOURNAL_MODE", default_value="wal"
+        ),
+        db_synchronous=_optional_lowercase_str_from_env(
+            "DB_SYNCHRONOUS", default_value="normal"
+        ),
+        db_busy_timeout_ms=_optional_int_from_env(
+            "DB_BUSY_TIMEOUT_MS", default_value=5_000
+        ),
+        db_cache_size_kib=_optional_int_from_env(
+            "DB_CACHE_SIZE_KIB", default_value=16_384
+        ),
+        db_mmap_size_bytes=_optional_int_from_env(
+            "DB_MMAP_SIZE_BYTES", default_value=268_435_456
+        ),
+        tombstone_retention_days=_optional_int_from_env(
+            "TOMBSTONE_RETENTION_DAYS", default_value=90
+        ),
+        compression_min_size_bytes=_optional_int_from_env(
+            "COMPRESSION_MIN_SIZE_BYTES", default_value=1_024
+        ),
+        compression_gzip_level=_optional_int_from_env(
+            "COMPRESSION_GZIP_LEVEL", default_value=6
+        ),
+        compression_zstd_level=_optional_int_from_env(
+            "COMPRESSION_ZSTD_LEVEL", default_value=3
+        ),
+        compression_cache_max_bytes=_optional_int_from_env(
+            "COMPRESSION_CACHE_MAX_BYTES", default_value=33_554_432
+        ),
+        item_cache_max_bytes=_optional_int_from_env(
+            "ITEM_CACHE_MAX_BYTES", default_value=67_108_864
+        ),
+        server_workers=_optional_int_from_env(
+            "SERVER_WORKERS", default_value=CPU_COUNT
+        ),
+        server_threads=_optional_int_from_env("SERVER_THREADS", default_value=4),
+        async_db_threads=_optional_int_from_env("ASYNC_DB_THREADS", default_value=8),
+        subscribe_poll_interval_seconds=_optional_float_from_env(
+            "SUBSCRIBE_POLL_INTERVAL_SECONDS", default_value=15.0
+        ),
+        db_watch_interval_seconds=_optional_float_from_env(
+            "DB_WATCH_INTERVAL_SECONDS", default_value=0.25
+        ),
+        load_workers=_optional_int_from_env("LOAD_WORKERS", default_value=CPU_COUNT),
     )
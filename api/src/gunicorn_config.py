@@ -0,0 +1,37 @@
+"""
+Settings for serving the API in production with gunicorn, a pre-fork server: a
+master process forks `SERVER_WORKERS` worker processes, and each one serves up to
+`SERVER_THREADS` requests at a time.
+
+Workers do not share memory: each one keeps its own item cache and compressed body
+cache, so the API takes up to `SERVER_WORKERS` times `ITEM_CACHE_MAX_BYTES` (64 MiB
+by default) plus `COMPRESSION_CACHE_MAX_BYTES` (32 MiB by default) for caches.
+Lower them, or the number of workers, on hosts with little memory.
+
+Each `/subscribe` client holds a thread for as long as it stays connected, and only
+half of the threads of a worker may serve them: see `src.api`.
+
+Usage (from the `api` directory):
+
+    gunicorn --config python:src.gunicorn_config "src.api:create_app()"
+
+See https://docs.gunicorn.org/en/stable/settings.html
+"""
+from src.config import get_config
+
+_config = get_config()
+
+# By default, gunicorn serves in `localhost`, which makes the webserver
+# inaccessible once you containerize it.
+bind = "0.0.0.0:5000"
+
+workers = _config.server_workers
+threads = _config.server_threads
+worker_class = "gthread"
+
+# Build the app in each worker after forking, so that no DB connection is shared
+# across processes
+preload_app = False
+
+loglevel = "debug" if _config.debug else "info"
+accesslog = "-"
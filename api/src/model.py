@@ -1,10 +1,14 @@
 import datetime
 from dataclasses import dataclass
-from typing import TypeAlias
+from typing import Any, Literal, TypeAlias
 
+ChangeSeq: TypeAlias = int
 Hash: TypeAlias = str
+ItemKind: TypeAlias = Literal["task", "view"]
 ISODatetimeString: TypeAlias = str  # "2022-07-19T07:11:00+01:00"
 MarkdownString: TypeAlias = str
+# Some of the fields of a Task, by name, as read when projecting tasks
+PartialTask: TypeAlias = dict[str, Any]
 Tag: TypeAlias = str
 TaskContent: TypeAlias = MarkdownString | None
 TaskId: TypeAlias = str
@@ -35,3 +39,75 @@ class View:
     updated: datetime.datetime
     tags: frozenset[Tag]
     task_ids: list[TaskId]
+
+
+@dataclass(frozen=True)
+class ChangePage:
+    # Partial when the page was read projecting tasks onto some of their fields
+    tasks: list[Task] | list[PartialTask]
+    views: list[View]
+    deleted_task_ids: list[TaskId]
+    deleted_view_ids: list[ViewId]
+    cursor: ChangeSeq
+    has_more: bool
+    # Deletions before the requested cursor have been compacted away, so the
+    # client must discard its data and reload everything
+    reset_required: bool
+
+
+@dataclass(frozen=True)
+class TaskSearchResult:
+    id: TaskId
+    title: TaskTitle
+    completed: bool
+    # Excerpt of the task content around the matches, which are wrapped in <mark>
+    snippet: str
+    # Lower is better
+    rank: float
+
+
+@dataclass(frozen=True)
+class ItemCursor:
+    """
+    Position right after the last item returned while walking all tasks (by ID)
+    and then all views (by ID).
+    """
+
+    kind: ItemKind
+    id: TaskId | ViewId
+
+
+@dataclass(frozen=True)
+class BatchUpsert:
+    action: Literal["create", "update"]
+    item: Task | View
+
+    @property
+    def kind(self) -> ItemKind:
+        return "task" if isinstance(self.item, Task) else "view"
+
+
+@dataclass(frozen=True)
+class BatchDelete:
+    kind: ItemKind
+    item_id: TaskId | ViewId
+
+    @property
+    def action(self) -> Literal["delete"]:
+        return "delete"
+
+
+BatchOperation: TypeAlias = BatchUpsert | BatchDelete
+
+
+@dataclass(frozen=True)
+class BatchResult:
+    operation: BatchOperation
+    # Item as stored in the DB, after creating or updating it
+    item: Task | View | None = None
+    # Set when the operation failed, and none of its changes were applied
+    error: str | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
@@ -0,0 +1,857 @@
+"""
+Routes of the API, regardless of the web framework serving them: `src.api` serves
+them with Flask, and `src.asgi` with Starlette.
+
+Handlers take an `HttpRequest` and return an `HttpResponse`. They parse requests,
+call use cases and build responses, blocking on the DB as they go: each adapter
+only translates requests and responses, and decides which thread runs handlers.
+"""
+import datetime
+import functools
+import hashlib
+import json
+import logging
+from collections.abc import Callable, Generator, Iterable, Mapping
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Any, Protocol, overload
+
+from apischema import ValidationError
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header, parse_etags, quote_etag
+
+from src.adapter.compression import CompressedBodyCache, compress, supported_encodings
+from src.adapter.item_cache import ItemCache
+from src.adapter.json import (
+    dumps,
+    json_to_task,
+    json_to_view,
+    partial_task_to_encodable,
+    search_result_to_json,
+    task_to_encodable,
+    task_to_json,
+    view_to_encodable,
+    view_to_json,
+)
+from src.adapter.notifier import DbWriteWatcher, change_notifier
+from src.adapter.sqlite import TASK_FIELDS, ConnectionPool
+from src.config import Config
+from src.model import (
+    BatchDelete,
+    BatchOperation,
+    BatchResult,
+    BatchUpsert,
+    ChangePage,
+    ChangeSeq,
+    ItemCursor,
+    ItemKind,
+    PartialTask,
+    Task,
+    View,
+)
+from src.use_cases.health import service_is_healthy
+from src.use_cases.read_from_db import (
+    iter_all_items,
+    read_all_cached_items,
+    read_changes_since,
+    read_db_version,
+    read_ids_deleted_after,
+    read_last_change_seq,
+    read_partial_tasks_updated_after,
+    read_tasks_blocked_by,
+    read_tasks_updated_after,
+    read_tasks_with_tag,
+    read_view_updated_after,
+    read_views_with_tag,
+    search_tasks,
+)
+from src.use_cases.set_up_minimum_db import set_up_minimum_db
+from src.use_cases.update_items import (
+    apply_batch,
+    create_task,
+    create_view,
+    delete_task,
+    delete_view,
+    update_task,
+    update_view,
+)
+
+logger = logging.getLogger(__name__)
+
+CHANGES_DEFAULT_LIMIT = 500
+CHANGES_MAX_LIMIT = 5_000
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+GET_ALL_MAX_LIMIT = 5_000
+JSON_MIMETYPE = "application/json"
+NDJSON_MIMETYPE = "application/x-ndjson"
+EVENT_STREAM_MIMETYPE = "text/event-stream"
+# Milliseconds clients wait before reconnecting to a dropped event stream
+SUBSCRIBE_RETRY_MS = 3_000
+# Comment line, to keep event streams open and to notice disconnections
+KEEP_ALIVE_EVENT = b": keep-alive\n\n"
+BATCH_MAX_OPERATIONS = 1_000
+FIELDS_NOT_SUPPORTED_ERROR = "'fields' cannot be used with 'cursor', 'limit' or NDJSON"
+
+
+@dataclass(frozen=True)
+class ApiState:
+    config: Config
+    # Connections outlive requests, so that they are not reopened on every request
+    pool: ConnectionPool
+    # GET routes only read, and their connections do not contend with writers
+    read_pool: ConnectionPool
+    # Bodies of ETag-tagged responses only change when the ETag does
+    compressed_bodies: CompressedBodyCache
+    # None when disabled by configuration
+    item_cache: ItemCache | None
+    # Wakes up event streams on writes of other processes, like other workers
+    db_watcher: DbWriteWatcher
+
+
+class Headers(Protocol):
+    """
+    Request headers, looked up regardless of case like those of Flask and Starlette.
+    """
+
+    @overload
+    def get(self, key: str) -> str | None:
+        ...
+
+    @overload
+    def get(self, key: str, default: str) -> str:
+        ...
+
+
+@dataclass(frozen=True)
+class HttpRequest:
+    method: str
+    path: str
+    query_string: str
+    args: Mapping[str, str]
+    headers: Headers
+    body: bytes
+    path_params: Mapping[str, str] = field(default_factory=dict)
+
+    def json(self) -> Any:
+        try:
+            return json.loads(self.body)
+        except ValueError as error:
+            raise BadRequest("expected a JSON body") from error
+
+
+@dataclass
+class HttpResponse:
+    status: int = 200
+    body: bytes = b""
+    media_type: str | None = JSON_MIMETYPE
+    headers: dict[str, str] = field(default_factory=dict)
+    # Sent instead of `body`, chunk by chunk, as it is produced. A None chunk asks
+    # to wait until the DB is written to before producing the next one, see
+    # `src.adapter.notifier.change_notifier`
+    stream: Generator[bytes | None, None, None] | None = None
+
+
+Handler = Callable[[ApiState, HttpRequest], HttpResponse]
+
+
+@dataclass(frozen=True)
+class Route:
+    method: str
+    # Path parameters in braces, like `/task/{task_id}`
+    path: str
+    handler: Handler
+
+
+class BadRequest(Exception):
+    ...
+
+
+def json_response(payload: dict, status: int = 200) -> HttpResponse:
+    body = json.dumps(payload, sort_keys=True, separators=(",", ":")) + "\n"
+    return HttpResponse(status=status, body=body.encode())
+
+
+def items_response(payload: dict) -> HttpResponse:
+    """
+    Encode large payloads of tasks and views with the fast encoder, producing the
+    same body `json_response` would. Payloads must not contain floats.
+    """
+    return HttpResponse(body=dumps(payload) + b"\n")
+
+
+def handle(handler: Handler, state: ApiState, request: HttpRequest) -> HttpResponse:
+    try:
+        response = handler(state, request)
+    except BadRequest as error:
+        response = json_response({"error": str(error)}, status=400)
+
+    return compress_response(state=state, request=request, response=response)
+
+
+def check_api_token(state: ApiState, request: HttpRequest) -> HttpResponse | None:
+    """
+    Return the response to send instead of serving the request, if any.
+    """
+    if request.method == "OPTIONS":
+        return None  # let the request in
+
+    if token := request.headers.get("x-api-key"):
+        if token == state.config.api_token:
+            logger.debug("incoming request carries a valid API token")
+            return None  # let the request in
+        else:
+            logger.debug("incoming request carries an invalid API token")
+
+    logger.warning("incoming request is missing an API token")
+    return json_response({"error": "missing or invalid token"}, status=401)
+
+
+def etag_for(version: str, *request_parts: str) -> str:
+    # Responses depend on the DB contents and on what exactly was requested
+    key = "\n".join((version, *request_parts))
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def conditional_on_db_version(handler: Handler) -> Handler:
+    """
+    Tag responses with an ETag derived from the DB version, and answer with a
+    bodiless 304 when the client already holds the response for that version.
+    """
+
+    @functools.wraps(handler)
+    def wrapper(state: ApiState, request: HttpRequest) -> HttpResponse:
+        # The version is read before the data: if the DB changes in between, the
+        # client gets newer data with an older ETag, and refetches next time
+        version = read_db_version(config=state.config, pool=state.read_pool)
+        etag = etag_for(
+            version,
+            request.path,
+            request.query_string,
+            request.headers.get("accept", ""),
+            request.body.decode(errors="replace"),
+        )
+
+        if parse_etags(request.headers.get("if-none-match")).contains_weak(etag):
+            response = HttpResponse(status=304, media_type=None)
+        else:
+            response = handler(state, request)
+            if response.status != 200:
+                return response
+
+        response.headers["ETag"] = quote_etag(etag, weak=True)
+        # Let clients cache responses, but make them revalidate every time
+        response.headers["Cache-Control"] = "no-cache"
+        return response
+
+    return wrapper
+
+
+def compress_response(
+    state: ApiState, request: HttpRequest, response: HttpResponse
+) -> HttpResponse:
+    if (
+        response.status != 200
+        or response.stream is not None
+        or "Content-Encoding" in response.headers
+    ):
+        return response
+
+    response.headers["Vary"] = "Accept-Encoding"
+
+    body = response.body
+    if len(body) < state.config.compression_min_size_bytes:
+        return response
+
+    accepted = parse_accept_header(request.headers.get("accept-encoding"))
+    encoding = accepted.best_match(supported_encodings())
+    if encoding is None:
+        return response
+
+    etag = response.headers.get("ETag")
+    compressed = etag and state.compressed_bodies.get(etag, encoding)
+    if not compressed:
+        compressed = compress(body, encoding=encoding, config=state.config)
+        if etag:
+            state.compressed_bodies.set(etag, encoding, compressed)
+
+    if len(compressed) >= len(body):
+        return response
+
+    response.body = compressed
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+
+def health(state: ApiState, request: HttpRequest) -> HttpResponse:
+    # Ideas: https://stackoverflow.com/questions/25389261/which-http-status-code-should-i-use-for-a-health-check-failure
+
+    in_debug_mode = True  # TODO: get this from...where? see WIP - take if from config
+
+    is_healthy, reason = service_is_healthy(config=state.config, pool=state.read_pool)
+
+    status = 200 if is_healthy else 503
+    payload: dict[str, Any] = {"isHealthy": is_healthy}
+    if in_debug_mode and not is_healthy:
+        payload.update({"reason": reason or "unknown"})
+
+    return json_response(payload, status=status)
+
+
+def item_to_cursor(item: Task | View) -> str:
+    kind = "task" if isinstance(item, Task) else "view"
+    return f"{kind}:{item.id}"
+
+
+def cursor_to_item_cursor(raw: str) -> ItemCursor:
+    raw_kind, _, id = raw.partition(":")
+    kind: ItemKind
+    if raw_kind == "task":
+        kind = "task"
+    elif raw_kind == "view":
+        kind = "view"
+    else:
+        raise ValueError(f"Invalid cursor: {raw!r}")
+    if not id:
+        raise ValueError(f"Invalid cursor: {raw!r}")
+    return ItemCursor(kind=kind, id=id)
+
+
+def item_to_ndjson_line(item: Task | View) -> bytes:
+    if isinstance(item, Task):
+        payload = {"task": task_to_encodable(item)}
+    else:
+        payload = {"view": view_to_encodable(item)}
+    return dumps(payload, sort_keys=False) + b"\n"
+
+
+def parse_task_fields(raw: str | None) -> list[str] | None:
+    """
+    Parse the comma-separated task fields that tasks must be projected onto, if
+    any. The ID is always returned, even if it is not asked for.
+    """
+    if raw is None:
+        return None
+
+    fields = [field.strip() for field in raw.split(",") if field.strip()]
+    if unknown := set(fields).difference(TASK_FIELDS):
+        raise BadRequest(f"unknown task fields: {', '.join(sorted(unknown))}")
+    return fields
+
+
+def tasks_to_encodable(tasks: Iterable[Task] | Iterable[PartialTask]) -> list[dict]:
+    return [
+        task_to_encodable(task)
+        if isinstance(task, Task)
+        else partial_task_to_encodable(task)
+        for task in tasks
+    ]
+
+
+def _read_tasks_updated_after(
+    state: ApiState, t: datetime.datetime, fields: list[str] | None
+) -> set[Task] | list[PartialTask]:
+    if fields is None:
+        return read_tasks_updated_after(t=t, config=state.config, pool=state.read_pool)
+
+    return read_partial_tasks_updated_after(
+        t=t, fields=fields, config=state.config, pool=state.read_pool
+    )
+
+
+@conditional_on_db_version
+def get_all(state: ApiState, request: HttpRequest) -> HttpResponse:
+    fields = parse_task_fields(request.args.get("fields"))
+
+    accepted = parse_accept_header(request.headers.get("accept"), MIMEAccept)
+    streaming = (
+        request.args.get("format") == "ndjson" or accepted.best == NDJSON_MIMETYPE
+    )
+    if streaming or "limit" in request.args or "cursor" in request.args:
+        if fields is not None:
+            raise BadRequest(FIELDS_NOT_SUPPORTED_ERROR)
+        return get_all_incrementally(state=state, request=request, streaming=streaming)
+
+    if fields is None and state.item_cache is not None:
+        cached_items = read_all_cached_items(
+            cache=state.item_cache, config=state.config, pool=state.read_pool
+        )
+        if cached_items is not None:
+            cached_tasks, cached_views = cached_items
+            return items_response(
+                {
+                    "tasks": [cached.encodable for cached in cached_tasks],
+                    "views": [cached.encodable for cached in cached_views],
+                }
+            )
+
+    t = datetime.datetime.min
+
+    tasks = _read_tasks_updated_after(state=state, t=t, fields=fields)
+    views = read_view_updated_after(t=t, config=state.config, pool=state.read_pool)
+
+    # TODO: use marshmallow to serialize/deserialize/validate
+    json_tasks = tasks_to_encodable(tasks)
+    json_views = list(map(view_to_encodable, views))
+
+    return items_response({"tasks": json_tasks, "views": json_views})
+
+
+def _read_page(
+    state: ApiState, after: ItemCursor | None, limit: int
+) -> list[Task | View]:
+    items = iter_all_items(config=state.config, after=after, pool=state.read_pool)
+    try:
+        return [item for _, item in zip(range(limit), items)]
+    finally:
+        items.close()
+
+
+def _stream_items(
+    state: ApiState, after: ItemCursor | None
+) -> Generator[bytes, None, None]:
+    """
+    Yield NDJSON lines of all items, a page at a time, all read from the same
+    snapshot of the DB.
+
+    The snapshot is held by a connection of its own, not leased from
+    `state.read_pool`: leases are per thread, and adapters may produce each chunk
+    on a different thread.
+    """
+    pool = ConnectionPool(config=state.config, read_only=True)
+    items = iter_all_items(config=state.config, after=after, pool=pool)
+    try:
+        while page := list(islice(items, GET_ALL_MAX_LIMIT)):
+            yield b"".join(map(item_to_ndjson_line, page))
+    finally:
+        # Ends the snapshot
+        items.close()
+        # Closes the connection if this runs on the thread that leased it, and
+        # otherwise leaves it to be closed along with the pool
+        pool.release()
+        pool.close()
+
+
+def get_all_incrementally(
+    state: ApiState, request: HttpRequest, streaming: bool
+) -> HttpResponse:
+    # TODO: use marshmallow to serialize/deserialize/validate
+    try:
+        after = None
+        if raw_cursor := request.args.get("cursor"):
+            after = cursor_to_item_cursor(raw_cursor)
+        limit = int(request.args.get("limit", GET_ALL_MAX_LIMIT))
+    except ValueError:
+        raise BadRequest("invalid 'cursor' or 'limit'")
+
+    if limit < 1:
+        raise BadRequest("'limit' must be greater than zero")
+
+    if streaming:
+        lines = _stream_items(state=state, after=after)
+        return HttpResponse(media_type=NDJSON_MIMETYPE, stream=lines)
+
+    limit = min(limit, GET_ALL_MAX_LIMIT)
+    # Read one item past the page, to tell if there are more items after it
+    page = _read_page(state=state, after=after, limit=limit + 1)
+
+    has_more = len(page) > limit
+    page = page[:limit]
+
+    return items_response(
+        {
+            "tasks": [
+                task_to_encodable(item) for item in page if isinstance(item, Task)
+            ],
+            "views": [
+                view_to_encodable(item) for item in page if isinstance(item, View)
+            ],
+            "cursor": item_to_cursor(page[-1]) if has_more else None,
+        }
+    )
+
+
+@conditional_on_db_version
+def changes_after_date(state: ApiState, request: HttpRequest) -> HttpResponse:
+    if "since" in request.args:
+        return changes_since_cursor(state=state, request=request)
+
+    # TODO: add marshmallow to serialize/deserialize/validate
+    fields = parse_task_fields(request.args.get("fields"))
+
+    t = datetime.datetime.fromisoformat(request.json()["after"])
+
+    tasks = _read_tasks_updated_after(state=state, t=t, fields=fields)
+    views = read_view_updated_after(t=t, config=state.config, pool=state.read_pool)
+    deleted_task_ids, deleted_view_ids = read_ids_deleted_after(
+        t=t, config=state.config, pool=state.read_pool
+    )
+
+    # TODO: use marshmallow to serialize/deserialize/validate
+    return items_response(
+        {
+            "tasks": tasks_to_encodable(tasks),
+            "views": list(map(view_to_encodable, views)),
+            "deleted_task_ids": deleted_task_ids,
+            "deleted_view_ids": deleted_view_ids,
+        }
+    )
+
+
+def changes_since_cursor(state: ApiState, request: HttpRequest) -> HttpResponse:
+    # TODO: add marshmallow to serialize/deserialize/validate
+    try:
+        since = int(request.args["since"])
+        limit = int(request.args.get("limit", CHANGES_DEFAULT_LIMIT))
+    except ValueError:
+        raise BadRequest("'since' and 'limit' must be integers")
+
+    fields = parse_task_fields(request.args.get("fields"))
+
+    if limit < 1:
+        raise BadRequest("'limit' must be greater than zero")
+
+    limit = min(limit, CHANGES_MAX_LIMIT)
+
+    page = read_changes_since(
+        since=since,
+        limit=limit,
+        config=state.config,
+        pool=state.read_pool,
+        task_fields=fields,
+    )
+
+    # TODO: use marshmallow to serialize/deserialize/validate
+    return items_response(
+        {
+            "tasks": tasks_to_encodable(page.tasks),
+            "views": list(map(view_to_encodable, page.views)),
+            "deleted_task_ids": page.deleted_task_ids,
+            "deleted_view_ids": page.deleted_view_ids,
+            "cursor": page.cursor,
+            "has_more": page.has_more,
+            "reset_required": page.reset_required,
+        }
+    )
+
+
+def change_page_to_event(page: ChangePage) -> bytes:
+    """
+    Encode a page of changes as a server-sent event, identified by the page cursor
+    so that reconnecting clients resume right after it.
+    """
+    if page.reset_required:
+        return f"id: {page.cursor}\nevent: reset\ndata: {{}}\n\n".encode()
+
+    data = dumps(
+        {
+            "tasks": tasks_to_encodable(page.tasks),
+            "views": list(map(view_to_encodable, page.views)),
+            "deleted_task_ids": page.deleted_task_ids,
+            "deleted_view_ids": page.deleted_view_ids,
+            "cursor": page.cursor,
+            "has_more": page.has_more,
+            "reset_required": page.reset_required,
+        }
+    )
+    return b"id: %d\nevent: changes\ndata: %s\n\n" % (page.cursor, data)
+
+
+def parse_subscription_start(
+    last_event_id: str | None, since: str | None
+) -> ChangeSeq | None:
+    # Reconnecting clients send the ID of the last event they got
+    raw = last_event_id or since
+    return int(raw) if raw else None
+
+
+def change_events(
+    state: ApiState, since: ChangeSeq
+) -> Generator[bytes | None, None, None]:
+    """
+    Yield an event per page of changes after `since`, and a None whenever there are
+    no more changes for now. The DB is checked again on the next iteration: take
+    note of `change_notifier.generation` before each one, to wait for a write in
+    between.
+    """
+    yield f"retry: {SUBSCRIBE_RETRY_MS}\n\n".encode()
+
+    with state.db_watcher.watching():
+        while True:
+            page = read_changes_since(
+                since=since,
+                limit=CHANGES_MAX_LIMIT,
+                config=state.config,
+                pool=state.read_pool,
+            )
+
+            if page.reset_required:
+                yield change_page_to_event(page)
+                return
+
+            if page.cursor == since:
+                yield None
+                continue
+
+            yield change_page_to_event(page)
+            since = page.cursor
+
+
+def subscribe(state: ApiState, request: HttpRequest) -> HttpResponse:
+    # TODO: use marshmallow to serialize/deserialize/validate
+    try:
+        since = parse_subscription_start(
+            last_event_id=request.headers.get("Last-Event-ID"),
+            since=request.args.get("since"),
+        )
+    except ValueError:
+        raise BadRequest("'since' and 'Last-Event-ID' must be integers")
+
+    if since is None:
+        # Only changes from now on
+        since = read_last_change_seq(config=state.config, pool=state.read_pool)
+
+    return HttpResponse(
+        media_type=EVENT_STREAM_MIMETYPE,
+        # Ask reverse proxies not to buffer events
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        stream=change_events(state=state, since=since),
+    )
+
+
+def query_tasks(state: ApiState, request: HttpRequest) -> HttpResponse:
+    # TODO: use marshmallow to serialize/deserialize/validate
+    completed: bool | None = None
+    if raw_completed := request.args.get("completed"):
+        completed = raw_completed.lower() == "true"
+
+    if tag := request.args.get("tag"):
+        tasks = read_tasks_with_tag(
+            tag=tag, completed=completed, config=state.config, pool=state.read_pool
+        )
+    elif blocked_by := request.args.get("blocked_by"):
+        tasks = read_tasks_blocked_by(
+            task_id=blocked_by, config=state.config, pool=state.read_pool
+        )
+    else:
+        raise BadRequest("expected either a 'tag' or a 'blocked_by' parameter")
+
+    # TODO: use marshmallow to serialize/deserialize/validate
+    return json_response({"tasks": list(map(task_to_json, tasks))})
+
+
+def query_views(state: ApiState, request: HttpRequest) -> HttpResponse:
+    # TODO: use marshmallow to serialize/deserialize/validate
+    if not (tag := request.args.get("tag")):
+        raise BadRequest("expected a 'tag' parameter")
+
+    views = read_views_with_tag(tag=tag, config=state.config, pool=state.read_pool)
+
+    # TODO: use marshmallow to serialize/deserialize/validate
+    return json_response({"views": list(map(view_to_json, views))})
+
+
+def search(state: ApiState, request: HttpRequest) -> HttpResponse:
+    # TODO: use marshmallow to serialize/deserialize/validate
+    text = request.args.get("q", "")
+    try:
+        limit = int(request.args.get("limit", SEARCH_DEFAULT_LIMIT))
+    except ValueError:
+        raise BadRequest("'limit' must be an integer")
+
+    limit = max(1, min(limit, SEARCH_MAX_LIMIT))
+
+    results = search_tasks(
+        text=text, limit=limit, config=state.config, pool=state.read_pool
+    )
+
+    # TODO: use marshmallow to serialize/deserialize/validate
+    return json_response({"results": list(map(search_result_to_json, results))})
+
+
+def create_task_route(state: ApiState, request: HttpRequest) -> HttpResponse:
+    # TODO: use marshmallow to serialize/deserialize/validate
+    task = json_to_task(request.json()["task"])
+
+    created = create_task(
+        task=task, config=state.config, pool=state.pool, cache=state.item_cache
+    )
+
+    # TODO: use marshmallow to serialize/deserialize/validate
+    return json_response({"created_task": task_to_json(task=created)})
+
+
+def create_view_route(state: ApiState, request: HttpRequest) -> HttpResponse:
+    # TODO: use marshmallow to serialize/deserialize/validate
+    view = json_to_view(request.json()["view"])
+
+    created = create_view(
+        view=view, config=state.config, pool=state.pool, cache=state.item_cache
+    )
+
+    # TODO: use marshmallow to serialize/deserialize/validate
+    return json_response({"created_view": view_to_json(view=created)})
+
+
+def update_task_route(state: ApiState, request: HttpRequest) -> HttpResponse:
+    # TODO: use marshmallow to serialize/deserialize/validate
+    task = json_to_task(request.json()["task"])
+
+    updated = update_task(
+        task=task, config=state.config, pool=state.pool, cache=state.item_cache
+    )
+
+    # TODO: use marshmallow to serialize/deserialize/validate
+    return json_response({"updated_task": task_to_json(task=updated)})
+
+
+def update_view_route(state: ApiState, request: HttpRequest) -> HttpResponse:
+    # TODO: use marshmallow to serialize/deserialize/validate
+    view = json_to_view(request.json()["view"])
+
+    updated = update_view(
+        view=view, config=state.config, pool=state.pool, cache=state.item_cache
+    )
+
+    # TODO: use marshmallow to serialize/deserialize/validate
+    return json_response({"updated_view": view_to_json(view=updated)})
+
+
+def delete_task_route(state: ApiState, request: HttpRequest) -> HttpResponse:
+    deleted_id = delete_task(
+        task_id=request.path_params["task_id"],
+        config=state.config,
+        pool=state.pool,
+        cache=state.item_cache,
+    )
+
+    # TODO: use marshmallow to serialize/deserialize/validate
+    return json_response({"deleted_task_id": deleted_id})
+
+
+def delete_view_route(state: ApiState, request: HttpRequest) -> HttpResponse:
+    deleted_id = delete_view(
+        view_id=request.path_params["view_id"],
+        config=state.config,
+        pool=state.pool,
+        cache=state.item_cache,
+    )
+
+    # TODO: use marshmallow to serialize/deserialize/validate
+    return json_response({"deleted_view_id": deleted_id})
+
+
+def json_to_batch_operation(raw: Any) -> BatchOperation:
+    if not isinstance(raw, dict):
+        raise BadRequest("invalid 'operations'")
+
+    action, kind = raw.get("action"), raw.get("kind")
+    if action not in ("create", "update", "delete") or kind not in ("task", "view"):
+        raise BadRequest("invalid 'operations'")
+
+    if action == "delete":
+        if not isinstance(item_id := raw.get("id"), str):
+            raise BadRequest("invalid 'operations'")
+        return BatchDelete(kind=kind, item_id=item_id)
+
+    to_item = json_to_task if kind == "task" else json_to_view
+    return BatchUpsert(action=action, item=to_item(raw[kind]))
+
+
+def batch_result_to_json(result: BatchResult) -> dict:
+    if not result.ok:
+        return {"ok": False, "error": result.error}
+
+    operation, item = result.operation, result.item
+    if isinstance(operation, BatchDelete):
+        return {"ok": True, f"deleted_{operation.kind}_id": operation.item_id}
+    if isinstance(item, Task):
+        return {"ok": True, f"{operation.action}d_task": task_to_json(item)}
+    if isinstance(item, View):
+        return {"ok": True, f"{operation.action}d_view": view_to_json(item)}
+
+    raise ValueError(f"Expected {operation.action}d item, but got {item!r}")
+
+
+def batch_route(state: ApiState, request: HttpRequest) -> HttpResponse:
+    # TODO: use marshmallow to serialize/deserialize/validate
+    try:
+        raw_operations = request.json()["operations"]
+    except (KeyError, TypeError):
+        raise BadRequest("invalid 'operations'")
+
+    if not isinstance(raw_operations, list):
+        raise BadRequest("invalid 'operations'")
+
+    try:
+        operations = list(map(json_to_batch_operation, raw_operations))
+    except (KeyError, TypeError, ValueError, ValidationError):
+        raise BadRequest("invalid 'operations'")
+
+    if len(operations) > BATCH_MAX_OPERATIONS:
+        raise BadRequest(f"expected at most {BATCH_MAX_OPERATIONS} operations")
+
+    results = apply_batch(
+        operations=operations,
+        config=state.config,
+        pool=state.pool,
+        cache=state.item_cache,
+    )
+
+    # TODO: use marshmallow to serialize/deserialize/validate
+    return json_response({"results": list(map(batch_result_to_json, results))})
+
+
+ROUTES = [
+    Route("GET", "/health", health),
+    Route("GET", "/get-all", get_all),
+    Route("GET", "/changes", changes_after_date),
+    Route("GET", "/subscribe", subscribe),
+    Route("GET", "/tasks", query_tasks),
+    Route("GET", "/views", query_views),
+    Route("GET", "/search", search),
+    Route("POST", "/task", create_task_route),
+    Route("POST", "/view", create_view_route),
+    Route("PUT", "/task", update_task_route),
+    Route("PUT", "/view", update_view_route),
+    Route("DELETE", "/task/{task_id}", delete_task_route),
+    Route("DELETE", "/view/{view_id}", delete_view_route),
+    Route("POST", "/batch", batch_route),
+]
+
+
+def set_up_db(config: Config) -> None:
+    if not config.db_path.exists():
+        raise FileNotFoundError(
+            f"Expected to find DB file at {config.db_path.absolute()} but"
+            " it does not exist"
+        )
+
+    set_up_minimum_db(config=config)
+
+
+def new_item_cache(config: Config) -> ItemCache | None:
+    if config.item_cache_max_bytes <= 0:
+        return None
+    return ItemCache(max_bytes=config.item_cache_max_bytes)
+
+
+def new_api_state(config: Config) -> ApiState:
+    """
+    Every process serving the API needs its own state: connections must not be
+    shared across forked processes.
+    """
+    return ApiState(
+        config=config,
+        pool=ConnectionPool(config=config),
+        read_pool=ConnectionPool(config=config, read_only=True),
+        compressed_bodies=CompressedBodyCache(
+            max_bytes=config.compression_cache_max_bytes
+        ),
+        item_cache=new_item_cache(config=config),
+        db_watcher=DbWriteWatcher(
+            config=config,
+            notifier=change_notifier,
+            interval_seconds=config.db_watch_interval_seconds,
+        ),
+    )
@@ -1,18 +1,20 @@
 from typing import TypeAlias
 
-from src.adapter.sqlite import DbClient
+from src.adapter.sqlite import ConnectionPool, DbClient
 from src.config import Config
 
 IsHealthy: TypeAlias = bool
 Reason: TypeAlias = str | None
 
 
-def service_is_healthy(config: Config) -> tuple[IsHealthy, Reason]:
+def service_is_healthy(
+    config: Config, pool: ConnectionPool | None = None
+) -> tuple[IsHealthy, Reason]:
     is_healthy: IsHealthy = False
     reason: Reason = None
 
     try:
-        db = DbClient(config=config)
+        db = DbClient(config=config, pool=pool)
         is_healthy = db.is_healthy()
         if not is_healthy:
             reason = "DB health check returned an unexpected result"
@@ -1,17 +1,137 @@
 import datetime
+from collections.abc import Generator, Iterable
 
-from src.adapter.sqlite import DbClient
+from src.adapter.item_cache import CachedItem, ItemCache
+from src.adapter.sqlite import ConnectionPool, DbClient
 from src.config import Config
-from src.model import Task, View
+from src.model import (
+    ChangePage,
+    ChangeSeq,
+    ItemCursor,
+    PartialTask,
+    Tag,
+    Task,
+    TaskId,
+    TaskSearchResult,
+    View,
+    ViewId,
+)
 
 
-def read_tasks_updated_after(t: datetime.datetime, config: Config) -> set[Task]:
-    db = DbClient(config=config)
+def read_tasks_updated_after(
+    t: datetime.datetime, config: Config, pool: ConnectionPool | None = None
+) -> set[Task]:
+    db = DbClient(config=config, pool=pool)
     tasks = db.read_tasks(updated_after=t)
     return set(tasks)
 
 
-def read_view_updated_after(t: datetime.datetime, config: Config) -> list[View]:
-    db = DbClient(config=config)
+def read_partial_tasks_updated_after(
+    t: datetime.datetime,
+    fields: Iterable[str],
+    config: Config,
+    pool: ConnectionPool | None = None,
+) -> list[PartialTask]:
+    db = DbClient(config=config, pool=pool)
+    tasks = db.read_partial_tasks(updated_after=t, fields=fields)
+    return tasks
+
+
+def read_view_updated_after(
+    t: datetime.datetime, config: Config, pool: ConnectionPool | None = None
+) -> list[View]:
+    db = DbClient(config=config, pool=pool)
     views = db.read_views(updated_after=t)
     return views
+
+
+def read_all_cached_items(
+    cache: ItemCache, config: Config, pool: ConnectionPool | None = None
+) -> tuple[list[CachedItem], list[CachedItem]] | None:
+    """
+    Return all tasks and views from `cache`, once brought up to date with the DB,
+    or None if they do not fit in it.
+    """
+    db = DbClient(config=config, pool=pool)
+    return cache.read_all(db=db)
+
+
+def read_db_version(config: Config, pool: ConnectionPool | None = None) -> str:
+    db = DbClient(config=config, pool=pool)
+    return db.read_version()
+
+
+def read_ids_deleted_after(
+    t: datetime.datetime, config: Config, pool: ConnectionPool | None = None
+) -> tuple[list[TaskId], list[ViewId]]:
+    db = DbClient(config=config, pool=pool)
+    return db.read_deleted_ids(deleted_after=t)
+
+
+def read_tasks_with_tag(
+    tag: Tag,
+    config: Config,
+    completed: bool | None = None,
+    pool: ConnectionPool | None = None,
+) -> list[Task]:
+    db = DbClient(config=config, pool=pool)
+    tasks = db.read_tasks_with_tag(tag=tag, completed=completed)
+    return tasks
+
+
+def read_tasks_blocked_by(
+    task_id: TaskId, config: Config, pool: ConnectionPool | None = None
+) -> list[Task]:
+    db = DbClient(config=config, pool=pool)
+    tasks = db.read_tasks_blocked_by(task_id=task_id)
+    return tasks
+
+
+def read_views_with_tag(
+    tag: Tag, config: Config, pool: ConnectionPool | None = None
+) -> list[View]:
+    db = DbClient(config=config, pool=pool)
+    views = db.read_views_with_tag(tag=tag)
+    return views
+
+
+def read_changes_since(
+    since: ChangeSeq,
+    limit: int,
+    config: Config,
+    pool: ConnectionPool | None = None,
+    task_fields: Iterable[str] | None = None,
+) -> ChangePage:
+    db = DbClient(config=config, pool=pool)
+    page = db.read_changes(since=since, limit=limit, task_fields=task_fields)
+    return page
+
+
+def read_last_change_seq(
+    config: Config, pool: ConnectionPool | None = None
+) -> ChangeSeq:
+    db = DbClient(config=config, pool=pool)
+    return db.read_last_change_seq()
+
+
+def search_tasks(
+    text: str, limit: int, config: Config, pool: ConnectionPool | None = None
+) -> list[TaskSearchResult]:
+    db = DbClient(config=config, pool=pool)
+    results = db.search_tasks(text=text, limit=limit)
+    return results
+
+
+def iter_all_items(
+    config: Config, after: ItemCursor | None = None, pool: ConnectionPool | None = None
+) -> Generator[Task | View, None, None]:
+    """
+    Yield all tasks and then all views, as they were when the iteration started.
+    """
+    db = DbClient(config=config, pool=pool)
+    with db.snapshot():
+        if after is None or after.kind == "task":
+            yield from db.iter_tasks(after_id=after.id if after else None)
+            yield from db.iter_views()
+        else:
+            yield from db.iter_views(after_id=after.id)
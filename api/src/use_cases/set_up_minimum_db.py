@@ -1,7 +1,10 @@
-from src.adapter.sqlite import DbClient
+from src.adapter.sqlite import DbClient, assert_sqlite_version_is_supported
 from src.config import Config
 
 
 def set_up_minimum_db(config: Config) -> None:
+    assert_sqlite_version_is_supported()
+
     db = DbClient(config=config)
-    db.create_tables_if_missing()
+    db.set_journal_mode()
+    db.migrate()
@@ -1,39 +1,232 @@
-from src.adapter.sqlite import DbClient
+import datetime
+import logging
+import sqlite3
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+from src.adapter.item_cache import ItemCache, ItemChanges
+from src.adapter.notifier import change_notifier
+from src.adapter.sqlite import (
+    ConnectionPool,
+    DbClient,
+    FailedToUpsertTask,
+    FailedToUpsertView,
+    TaskDeletionError,
+    ViewDeletionError,
+)
 from src.config import Config
-from src.model import Task, TaskId, View, ViewId
+from src.model import (
+    BatchDelete,
+    BatchOperation,
+    BatchResult,
+    BatchUpsert,
+    Task,
+    TaskId,
+    View,
+    ViewId,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _compact_tombstones(db: DbClient, config: Config) -> None:
+    retention = datetime.timedelta(days=config.tombstone_retention_days)
+    now = datetime.datetime.now(tz=datetime.UTC)
+    db.compact_tombstones(deleted_before=now - retention)
+
+
+@contextmanager
+def _write_through(db: DbClient, cache: ItemCache | None) -> Iterator[ItemChanges]:
+    """
+    Run the block in a transaction and, once committed, apply to `cache` the
+    changes the block records, which must be all the changes it made.
+    """
+    changes = ItemChanges()
+    with db.transaction():
+        since = db.read_last_change_seq()
+        yield changes
+        until = db.read_last_change_seq()
 
+    if cache is not None:
+        cache.apply(since=since, until=until, changes=changes)
 
-def create_task(task: Task, config: Config) -> Task:
-    db = DbClient(config=config)
-    created = db.insert_task(task=task)
+
+def create_task(
+    task: Task,
+    config: Config,
+    pool: ConnectionPool | None = None,
+    cache: ItemCache | None = None,
+) -> Task:
+    db = DbClient(config=config, pool=pool)
+    with _write_through(db=db, cache=cache) as changes:
+        created = db.insert_task(task=task)
+        changes.tasks.append(created)
+    change_notifier.notify()
     return created
 
 
-def create_view(view: View, config: Config) -> View:
-    db = DbClient(config=config)
-    created = db.insert_view(view=view)
+def create_view(
+    view: View,
+    config: Config,
+    pool: ConnectionPool | None = None,
+    cache: ItemCache | None = None,
+) -> View:
+    db = DbClient(config=config, pool=pool)
+    with _write_through(db=db, cache=cache) as changes:
+        created = db.insert_view(view=view)
+        changes.views.append(created)
+    change_notifier.notify()
     return created
 
 
-def update_task(task: Task, config: Config) -> Task:
-    db = DbClient(config=config)
-    updated = db.update_task(task=task, upsert_if_needed=True)
+def update_task(
+    task: Task,
+    config: Config,
+    pool: ConnectionPool | None = None,
+    cache: ItemCache | None = None,
+) -> Task:
+    db = DbClient(config=config, pool=pool)
+    with _write_through(db=db, cache=cache) as changes:
+        updated = db.update_task(task=task, upsert_if_needed=True)
+        if updated is None:
+            raise FailedToUpsertTask()
+        changes.tasks.append(updated)
+    change_notifier.notify()
     return updated
 
 
-def update_view(view: View, config: Config) -> View:
-    db = DbClient(config=config)
-    updated = db.update_view(view=view, upsert_if_needed=True)
+def update_view(
+    view: View,
+    config: Config,
+    pool: ConnectionPool | None = None,
+    cache: ItemCache | None = None,
+) -> View:
+    db = DbClient(config=config, pool=pool)
+    with _write_through(db=db, cache=cache) as changes:
+        updated = db.update_view(view=view, upsert_if_needed=True)
+        if updated is None:
+            raise FailedToUpsertView()
+        changes.views.append(updated)
+    change_notifier.notify()
     return updated
 
 
-def delete_task(task_id: TaskId, config: Config) -> TaskId:
-    db = DbClient(config=config)
-    deleted_id = db.delete_task(task_id=task_id)
+def delete_task(
+    task_id: TaskId,
+    config: Config,
+    pool: ConnectionPool | None = None,
+    cache: ItemCache | None = None,
+) -> TaskId:
+    db = DbClient(config=config, pool=pool)
+    with _write_through(db=db, cache=cache) as changes:
+        deleted_id = db.delete_task(task_id=task_id)
+        changes.deleted_task_ids.append(deleted_id)
+    change_notifier.notify()
+    _compact_tombstones(db=db, config=config)
     return deleted_id
 
 
-def delete_view(view_id: ViewId, config: Config) -> ViewId:
-    db = DbClient(config=config)
-    deleted_id = db.delete_view(view_id=view_id)
+def delete_view(
+    view_id: ViewId,
+    config: Config,
+    pool: ConnectionPool | None = None,
+    cache: ItemCache | None = None,
+) -> ViewId:
+    db = DbClient(config=config, pool=pool)
+    with _write_through(db=db, cache=cache) as changes:
+        deleted_id = db.delete_view(view_id=view_id)
+        changes.deleted_view_ids.append(deleted_id)
+    change_notifier.notify()
+    _compact_tombstones(db=db, config=config)
     return deleted_id
+
+
+_ITEM_ERRORS = (
+    sqlite3.IntegrityError,
+    FailedToUpsertTask,
+    FailedToUpsertView,
+    TaskDeletionError,
+    ViewDeletionError,
+)
+
+
+def _apply_operation(db: DbClient, operation: BatchOperation) -> Task | View | None:
+    match operation:
+        case BatchUpsert(action="create", item=Task() as task):
+            return db.insert_task(task=task)
+        case BatchUpsert(action="create", item=View() as view):
+            return db.insert_view(view=view)
+        case BatchUpsert(action="update", item=Task() as task):
+            return db.update_task(task=task, upsert_if_needed=True)
+        case BatchUpsert(action="update", item=View() as view):
+            return db.update_view(view=view, upsert_if_needed=True)
+        case BatchDelete(kind="task", item_id=task_id):
+            db.delete_task(task_id=task_id)
+            return None
+        case BatchDelete(kind="view", item_id=view_id):
+            db.delete_view(view_id=view_id)
+            return None
+        case other:
+            raise ValueError(f"Unsupported batch operation: {other}")
+
+
+def _record_change(
+    changes: ItemChanges, operation: BatchOperation, item: Task | View | None
+) -> None:
+    if isinstance(operation, BatchDelete):
+        if operation.kind == "task":
+            changes.deleted_task_ids.append(operation.item_id)
+        else:
+            changes.deleted_view_ids.append(operation.item_id)
+    elif isinstance(item, Task):
+        changes.tasks.append(item)
+    elif isinstance(item, View):
+        changes.views.append(item)
+
+
+def _failure_message(operation: BatchOperation, error: Exception) -> str:
+    # Stable messages, that clients may rely on, rather than the internal errors
+    match error:
+        case TaskDeletionError() | ViewDeletionError():
+            return f"{operation.kind} not found"
+        case sqlite3.IntegrityError():
+            return f"{operation.kind} conflicts with a stored item"
+        case _:
+            return f"failed to {operation.action} {operation.kind}"
+
+
+def apply_batch(
+    operations: list[BatchOperation],
+    config: Config,
+    pool: ConnectionPool | None = None,
+    cache: ItemCache | None = None,
+) -> list[BatchResult]:
+    """
+    Apply all operations in a single transaction, and report how each one went.
+
+    An operation that fails is rolled back on its own, without affecting the rest.
+    """
+    db = DbClient(config=config, pool=pool)
+
+    results: list[BatchResult] = []
+    with _write_through(db=db, cache=cache) as changes:
+        for operation in operations:
+            try:
+                with db.transaction():
+                    item = _apply_operation(db=db, operation=operation)
+            except _ITEM_ERRORS as error:
+                logger.debug(f"Batch operation {operation} failed: {error!r}")
+                error_message = _failure_message(operation=operation, error=error)
+                result = BatchResult(operation=operation, error=error_message)
+            else:
+                result = BatchResult(operation=operation, item=item)
+                _record_change(changes=changes, operation=operation, item=item)
+            results.append(result)
+
+    if any(result.ok for result in results):
+        change_notifier.notify()
+
+    if any(isinstance(operation, BatchDelete) for operation in operations):
+        _compact_tombstones(db=db, config=config)
+
+    return results
@@ -0,0 +1,39 @@
+import gzip
+
+import zstandard
+
+from src.adapter.compression import CompressedBodyCache, compress, supported_encodings
+
+
+def test_compress_round_trips(test_config) -> None:
+    body = b'{"tasks": []}' * 100
+
+    assert supported_encodings() == ["zstd", "gzip"]
+    assert gzip.decompress(compress(body, encoding="gzip", config=test_config)) == body
+
+    decompressor = zstandard.ZstdDecompressor()
+    assert decompressor.decompress(compress(body, "zstd", config=test_config)) == body
+
+
+def test_gzip_output_is_deterministic(test_config) -> None:
+    body = b"x" * 2_000
+
+    a = compress(body, encoding="gzip", config=test_config)
+    b = compress(body, encoding="gzip", config=test_config)
+
+    assert a == b
+
+
+def test_compressed_body_cache_evicts_least_recently_used() -> None:
+    cache = CompressedBodyCache(max_bytes=10)
+
+    cache.set("etag-a", "gzip", b"aaaa")
+    cache.set("etag-b", "gzip", b"bbbb")
+    assert cache.get("etag-a", "gzip") == b"aaaa"  # now most recently used
+
+    cache.set("etag-c", "gzip", b"cccc")
+
+    assert cache.get("etag-a", "gzip") == b"aaaa"
+    assert cache.get("etag-b", "gzip") is None
+    assert cache.get("etag-c", "gzip") == b"cccc"
+    assert cache.get("etag-c", "zstd") is None
@@ -1,8 +1,13 @@
 import datetime
+from dataclasses import replace
 from pathlib import Path
 
+from src.adapter import fs
 from src.adapter.fs import (
+    MANIFEST_PATH,
+    WipmanDirChanges,
     load_wipman_dir,
+    load_wipman_dir_incrementally,
     read_task_file,
     read_view_file,
     write_task_file,
@@ -160,6 +165,23 @@ def test_write_task_file_without_content(tmp_path: Path) -> None:
     )
 
 
+def test_write_task_file_skips_unchanged_content(tmp_path: Path) -> None:
+    path = tmp_path / "ab" / "cdefghij"
+    assert write_task_file(path=path, task=task(id="abcdefghij")) is True
+
+    mtime_ns = path.stat().st_mtime_ns
+    assert write_task_file(path=path, task=task(id="abcdefghij")) is False
+    assert path.stat().st_mtime_ns == mtime_ns
+
+    edited = replace(task(id="abcdefghij"), title="edited")
+    with fs.batched_fsync() as batch:
+        assert write_task_file(path=path, task=edited, fsync=batch) is True
+
+    assert read_task_file(path) == edited
+    # The temporary file the content is written to is renamed into place
+    assert sorted(path.parent.iterdir()) == [path]
+
+
 def test_read_view_file(tmp_path: Path) -> None:
     path = tmp_path / "task"
 
@@ -316,3 +338,91 @@ def test_load_wipman_dir(tmp_path: Path, test_config: Config) -> None:
     assert len(tasks) == 2
 
     # TODO: add more assertions
+
+
+def test_load_wipman_dir_only_parses_changed_files(
+    tmp_path: Path, test_config: Config, monkeypatch
+) -> None:
+    fake_wipman_dir = _build_fake_wipman_dir(container=tmp_path)
+    config = test_config.extend(wipman_dir=fake_wipman_dir)
+
+    changes = load_wipman_dir_incrementally(config=config)
+    assert len(changes.added) == 3
+    assert changes.modified == changes.removed == []
+    assert len(changes.views) == 1
+    assert len(changes.tasks) == 2
+    views, tasks = load_wipman_dir(config=config)
+
+    def fail_to_parse(text: str) -> None:
+        raise AssertionError("unchanged files must not be parsed again")
+
+    # Loading again gives the same items, without parsing any file
+    with monkeypatch.context() as patch:
+        patch.setattr(fs, "_parse_task", fail_to_parse)
+        patch.setattr(fs, "_parse_view", fail_to_parse)
+        assert load_wipman_dir(config=config) == (views, tasks)
+        assert load_wipman_dir_incrementally(config=config) == WipmanDirChanges(
+            added=[], modified=[], removed=[], views=[], tasks=[]
+        )
+
+    task_a_path = fake_wipman_dir / "dk" / "zjtmtmap"
+    task_b_path = fake_wipman_dir / "xl" / "yckwetrb"
+    task_a = read_task_file(path=task_a_path)
+    write_task_file(path=task_a_path, task=replace(task_a, title="edited"))
+    task_b_path.unlink()
+
+    changes = load_wipman_dir_incrementally(config=config)
+    assert changes.added == []
+    assert changes.modified == [task_a_path]
+    assert changes.removed == [task_b_path]
+    assert changes.tasks == [replace(task_a, title="edited")]
+
+    _, tasks = load_wipman_dir(config=config)
+    assert tasks == {replace(task_a, title="edited")}
+
+
+def test_load_wipman_dir_starts_afresh_from_a_corrupt_manifest(
+    tmp_path: Path, test_config: Config
+) -> None:
+    fake_wipman_dir = _build_fake_wipman_dir(container=tmp_path)
+    config = test_config.extend(wipman_dir=fake_wipman_dir)
+    expected = load_wipman_dir(config=config)
+
+    (fake_wipman_dir / MANIFEST_PATH).write_bytes(b"not a manifest" * 100)
+
+    assert load_wipman_dir(config=config) == expected
+    assert load_wipman_dir(config=config) == expected
+    assert load_wipman_dir_incrementally(config=config).added == []
+
+
+def test_load_wipman_dir_in_parallel_matches_serial_load(
+    tmp_path: Path, test_config: Config, monkeypatch
+) -> None:
+    fake_wipman_dir = _build_fake_wipman_dir(container=tmp_path)
+    config = test_config.extend(wipman_dir=fake_wipman_dir, load_workers=1)
+
+    serial = load_wipman_dir(config=config)
+
+    (fake_wipman_dir / MANIFEST_PATH).unlink()
+    monkeypatch.setattr(fs, "PARALLEL_LOAD_MIN_FILES", 0)
+    parallel = load_wipman_dir(config=config.extend(load_workers=2))
+
+    assert parallel == serial
+
+
+def test_load_wipman_dir_ignores_hidden_and_unrelated_directories(
+    tmp_path: Path, test_config: Config
+) -> None:
+    fake_wipman_dir = _build_fake_wipman_dir(container=tmp_path)
+    config = test_config.extend(wipman_dir=fake_wipman_dir)
+
+    # Would be mistaken for task files if these directories were looked into
+    for directory in [".git/objects/ab", "notes/ab", "xl/.hidden"]:
+        (fake_wipman_dir / directory).mkdir(parents=True)
+        (fake_wipman_dir / directory / "cdefghij").write_text("not a task")
+    (fake_wipman_dir / "views" / ".backlog.view.swp").write_text("not a view")
+
+    views, tasks = load_wipman_dir(config=config)
+
+    assert len(views) == 1
+    assert len(tasks) == 2
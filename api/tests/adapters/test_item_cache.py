@@ -0,0 +1,92 @@
+import logging
+from dataclasses import replace
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from src.adapter import item_cache
+from src.adapter.item_cache import CachedItem, ItemCache
+from src.adapter.sqlite import ConnectionPool, DbClient
+from src.config import Config
+from src.model import Task, View
+from src.use_cases.read_from_db import read_all_cached_items
+from src.use_cases.update_items import create_task, update_task
+from tests import factories
+
+
+def _task_ids(cache: ItemCache, config: Config, pool: ConnectionPool) -> list[str]:
+    cached_items = read_all_cached_items(cache=cache, config=config, pool=pool)
+    assert cached_items is not None
+    tasks, _ = cached_items
+    return [cached.item.id for cached in tasks]
+
+
+def test_item_cache_follows_writes_from_this_and_other_processes(
+    test_config: Config, tmp_path: Path
+) -> None:
+    config = test_config.extend(db_path=tmp_path / "db.db")
+    DbClient(config=config).migrate()
+    pool = ConnectionPool(config=config, read_only=True)
+    cache = ItemCache(max_bytes=1_000_000)
+
+    create_task(task=factories.task(id="aaaaaaaaaa"), config=config, cache=cache)
+    assert _task_ids(cache, config, pool) == ["aaaaaaaaaa"]
+
+    edited = replace(factories.task(id="aaaaaaaaaa"), title="edited")
+    update_task(task=edited, config=config, cache=cache)
+    cached_items = read_all_cached_items(cache=cache, config=config, pool=pool)
+    assert cached_items is not None
+    tasks, _ = cached_items
+    assert [cached.item for cached in tasks] == [edited]
+    assert tasks[0].encodable["title"] == "edited"
+
+    # Writes that bypass the cache, like those made by another process
+    other_process = DbClient(config=config)
+    other_process.insert_task(task=factories.task(id="bbbbbbbbbb"))
+    other_process.delete_task(task_id="aaaaaaaaaa")
+    assert _task_ids(cache, config, pool) == ["bbbbbbbbbb"]
+
+
+def test_item_cache_backs_off_while_items_do_not_fit(
+    test_config: Config,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    config = test_config.extend(db_path=tmp_path / "db.db")
+    DbClient(config=config).migrate()
+    pool = ConnectionPool(config=config, read_only=True)
+    now = 0.0
+    monkeypatch.setattr(item_cache, "time", SimpleNamespace(monotonic=lambda: now))
+    cached_items: list[str] = []
+    to_cached_item = item_cache._to_cached_item
+
+    def counting_to_cached_item(item: Task | View) -> CachedItem:
+        cached_items.append(item.id)
+        return to_cached_item(item)
+
+    monkeypatch.setattr(item_cache, "_to_cached_item", counting_to_cached_item)
+
+    # Fits a single task
+    one_task_size = to_cached_item(factories.task(id="aaaaaaaaaa")).size
+    cache = ItemCache(max_bytes=one_task_size)
+
+    create_task(task=factories.task(id="aaaaaaaaaa"), config=config, cache=cache)
+    assert _task_ids(cache, config, pool) == ["aaaaaaaaaa"]
+
+    DbClient(config=config).insert_task(task=factories.task(id="bbbbbbbbbb"))
+    with caplog.at_level(logging.INFO, logger=item_cache.__name__):
+        cached_items.clear()
+        for _ in range(3):
+            assert read_all_cached_items(cache=cache, config=config, pool=pool) is None
+
+    # Items are not built again on every read, nor is it logged every time
+    assert cached_items == ["bbbbbbbbbb"]
+    assert len(caplog.records) == 1
+
+    DbClient(config=config).delete_task(task_id="bbbbbbbbbb")
+    assert read_all_cached_items(cache=cache, config=config, pool=pool) is None
+
+    now += item_cache.RELOAD_BACKOFF_SECONDS
+    assert _task_ids(cache, config, pool) == ["aaaaaaaaaa"]
@@ -0,0 +1,72 @@
+import datetime
+import json
+from dataclasses import replace
+
+import apischema
+
+from src.adapter.json import (
+    dumps,
+    task_to_encodable,
+    task_to_json,
+    view_to_encodable,
+    view_to_json,
+)
+from src.model import Task, View
+from tests import factories
+
+
+def _views() -> list[View]:
+    return [
+        View(
+            id="vvvvvvvvvv",
+            title="Backlog",
+            created=datetime.datetime(2023, 1, 1, 10, 0, 0, 123456),
+            updated=datetime.datetime(2023, 1, 2, tzinfo=datetime.UTC),
+            tags=frozenset({"work", "home"}),
+            task_ids=["aaaaaaaaaa", "bbbbbbbbbb"],
+        )
+    ]
+
+
+def _tasks() -> list[Task]:
+    task = factories.task(id="aaaaaaaaaa")
+    return [
+        task,
+        replace(task, id="bbbbbbbbbb", title="Café ☕", content="line\nbreak\x7f"),
+        replace(task, id="cccccccccc", tags=frozenset(), blocked_by=frozenset({"x"})),
+    ]
+
+
+def test_serializers_match_apischema() -> None:
+    for task in _tasks():
+        assert task_to_json(task) == apischema.serialize(Task, task)
+
+    for view in _views():
+        assert view_to_json(view) == apischema.serialize(View, view)
+
+
+def test_dumps_matches_the_standard_library_byte_for_byte() -> None:
+    # Each task on its own, as some need escaping and others do not
+    payloads = [{"task": task_to_json(task)} for task in _tasks()] + [
+        {
+            "tasks": list(map(task_to_json, _tasks())),
+            "views": list(map(view_to_json, _views())),
+            "cursor": None,
+            "has_more": False,
+        }
+    ]
+
+    for payload in payloads:
+        for sort_keys in (True, False):
+            expected = json.dumps(payload, sort_keys=sort_keys, separators=(",", ":"))
+            assert dumps(payload, sort_keys=sort_keys) == expected.encode()
+
+
+def test_dumps_encodes_datetimes_like_the_serializers() -> None:
+    for task in _tasks():
+        expected = dumps({"task": task_to_json(task)})
+        assert dumps({"task": task_to_encodable(task)}) == expected
+
+    for view in _views():
+        expected = dumps({"view": view_to_json(view)}, indent=2)
+        assert dumps({"view": view_to_encodable(view)}, indent=2) == expected
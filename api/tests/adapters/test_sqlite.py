@@ -1,12 +1,21 @@
 import datetime
 import os
+import sqlite3
+import threading
+from collections.abc import Iterator
 from dataclasses import replace
 from pathlib import Path
 
-from src.adapter.sqlite import DbClient
+import pytest
+
+from src.adapter.migrations import LATEST_VERSION
+from src.adapter.sqlite import ConnectionPool, DbClient
 from src.config import Config
-from src.model import Task, View
+from src.model import BatchDelete, BatchUpsert, Task, View
 from src.use_cases.files_to_db import dump_wipman_dir_to_db
+from src.use_cases.set_up_minimum_db import set_up_minimum_db
+from src.use_cases.update_items import apply_batch
+from tests import factories
 
 
 def test_read_tasks_and_views(test_config: Config) -> None:
@@ -30,7 +39,7 @@ def test_update_task(test_config: Config, tmp_path: Path) -> None:
     )
 
     db = DbClient(config=config)
-    db._create_tasks_table()
+    db.migrate()
 
     def _count_tasks_in_db() -> int:
         return db.connection.execute("SELECT count(0) FROM tasks;").fetchone()[0]
@@ -68,7 +77,7 @@ def test_update_view(test_config: Config, tmp_path: Path) -> None:
     )
 
     db = DbClient(config=config)
-    db._create_views_table()
+    db.migrate()
 
     def _count_views_in_db() -> int:
         return db.connection.execute("SELECT count(0) FROM views;").fetchone()[0]
@@ -94,3 +103,652 @@ def test_update_view(test_config: Config, tmp_path: Path) -> None:
     assert updated == view2
 
     assert _count_views_in_db() == 1
+
+
+def test_connection_pool_reuses_connections(
+    test_config: Config, tmp_path: Path
+) -> None:
+    config = test_config.extend(db_path=tmp_path / "db.db")
+    pool = ConnectionPool(config=config)
+
+    first = pool.acquire()
+    assert pool.acquire() is first, "same thread must get the same connection"
+    pool.release()
+
+    assert pool.acquire() is first, "released connection must be reused"
+    pool.release()
+
+    pool.close()
+
+
+def test_connection_pool_leases_one_connection_per_thread(
+    test_config: Config, tmp_path: Path
+) -> None:
+    config = test_config.extend(db_path=tmp_path / "db.db")
+    pool = ConnectionPool(config=config)
+
+    main_connection = pool.acquire()
+    leased_in_thread = []
+
+    def _lease() -> None:
+        connection = pool.acquire()
+        connection.execute("SELECT 1;")
+        leased_in_thread.append(connection)
+        pool.release()
+
+    thread = threading.Thread(target=_lease)
+    thread.start()
+    thread.join()
+
+    assert leased_in_thread[0] is not main_connection
+    pool.release()
+
+    pool.close()
+
+
+def test_connection_pool_limits_idle_connections(
+    test_config: Config, tmp_path: Path
+) -> None:
+    config = test_config.extend(db_path=tmp_path / "db.db", db_pool_size=1)
+    pool = ConnectionPool(config=config)
+
+    barrier = threading.Barrier(2)
+    leased = []
+
+    def _lease() -> None:
+        leased.append(pool.acquire())
+        barrier.wait()
+        pool.release()
+
+    threads = [threading.Thread(target=_lease) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert leased[0] is not leased[1]
+    assert pool.acquire() in leased
+    pool.release()
+
+    pool.close()
+
+
+def test_connection_pool_recycles_idle_connections(
+    test_config: Config, tmp_path: Path
+) -> None:
+    config = test_config.extend(
+        db_path=tmp_path / "db.db", db_pool_max_idle_seconds=0.0
+    )
+    pool = ConnectionPool(config=config)
+
+    first = pool.acquire()
+    pool.release()
+
+    assert pool.acquire() is not first
+    pool.release()
+
+    pool.close()
+
+
+def test_db_client_uses_pooled_connection(test_config: Config, tmp_path: Path) -> None:
+    config = test_config.extend(db_path=tmp_path / "db.db")
+    pool = ConnectionPool(config=config)
+
+    db = DbClient(config=config, pool=pool)
+    assert db.connection is pool.acquire()
+    assert db.is_healthy()
+    pool.release()
+
+    pool.close()
+
+
+def test_migrate_upgrades_legacy_db_in_place(
+    test_config: Config, tmp_path: Path
+) -> None:
+    config = test_config.extend(db_path=tmp_path / "db.db")
+
+    db = DbClient(config=config)
+    db.connection.execute(
+        "CREATE TABLE tasks"
+        " (id, title, created, updated, tags, blocked_by, blocks, completed, content);"
+    )
+    db.connection.execute(
+        "CREATE TABLE views (id, title, created, updated, tags, task_ids);"
+    )
+    legacy_row = (
+        "xlyckwetrb",
+        "old title",
+        "2022-11-24T13:17:49+00:00",
+        "2022-11-25T07:34:37+00:00",
+        "bar,foo",
+        "",
+        "",
+        1,
+        None,
+    )
+    db.connection.execute("INSERT INTO tasks VALUES (?,?,?,?,?,?,?,?,?);", legacy_row)
+    db.connection.execute(
+        "INSERT INTO tasks VALUES (?,?,?,?,?,?,?,?,?);",
+        (*legacy_row[:1], "new title", *legacy_row[2:]),
+    )
+    db.connection.commit()
+
+    assert db.migrate() == LATEST_VERSION
+
+    task = db.read_task(task_id="xlyckwetrb")
+    assert task is not None
+    assert task.title == "new title", "last duplicated row must win"
+    assert task.tags == frozenset({"foo", "bar"})
+    assert db.read_tasks(updated_after=datetime.datetime(2022, 11, 25)) == [task]
+
+    query_plan = db.connection.execute(
+        "EXPLAIN QUERY PLAN SELECT * FROM tasks WHERE id = ?;", ("xlyckwetrb",)
+    ).fetchall()
+    assert "USING INDEX" in query_plan[0][-1]
+
+    assert db.migrate() == LATEST_VERSION, "migrating twice must be a no-op"
+
+
+def test_read_tasks_updated_after_compares_instants(
+    test_config: Config, tmp_path: Path
+) -> None:
+    config = test_config.extend(db_path=tmp_path / "db.db")
+    db = DbClient(config=config)
+    db.migrate()
+
+    plus_one = datetime.timezone(datetime.timedelta(hours=1))
+    earlier = factories.task(id="aaaaaaaaaa")
+    later = replace(
+        factories.task(id="bbbbbbbbbb"),
+        # 08:00+01:00 is 07:00 UTC, which is later than the 06:30 UTC cut-off below
+        updated=datetime.datetime(2023, 1, 1, 8, 0, tzinfo=plus_one),
+    )
+    earlier = replace(
+        earlier, updated=datetime.datetime(2023, 1, 1, 6, 0, tzinfo=plus_one)
+    )
+    db.insert_task(task=earlier)
+    db.insert_task(task=later)
+
+    t = datetime.datetime(2023, 1, 1, 6, 30, tzinfo=datetime.UTC)
+    assert db.read_tasks(updated_after=t) == [later]
+    assert db.read_tasks(updated_after=datetime.datetime.min) == [earlier, later]
+
+    query_plan = db.connection.execute(
+        "EXPLAIN QUERY PLAN"
+        " SELECT * FROM tasks WHERE updated_us > ? ORDER BY updated_us;",
+        (0,),
+    ).fetchall()
+    assert "tasks_updated_us_idx" in query_plan[0][-1]
+
+
+def test_dump_wipman_replaces_all_rows(test_config: Config, tmp_path: Path) -> None:
+    config = test_config.extend(db_path=tmp_path / "db.db")
+    db = DbClient(config=config)
+
+    view = View(
+        id="0000000000",
+        title="backlog",
+        created=datetime.datetime.fromisoformat("2022-10-01T18:00:00+00:00"),
+        updated=datetime.datetime.fromisoformat("2022-10-01T18:00:00+00:00"),
+        tags=frozenset(),
+        task_ids=["aaaaaaaaaa", "bbbbbbbbbb"],
+    )
+    task_a = factories.task(id="aaaaaaaaaa")
+    task_b = factories.task(id="bbbbbbbbbb")
+
+    db.dump_wipman(views=[view], tasks={task_a, task_b})
+    assert db.read_all_views() == [view]
+    assert sorted(db.read_all_tasks(), key=lambda task: task.id) == [task_a, task_b]
+
+    db.dump_wipman(views=[], tasks={task_b})
+    assert db.read_all_views() == []
+    assert db.read_all_tasks() == [task_b]
+
+
+def test_dump_wipman_keeps_previous_rows_if_it_fails(
+    test_config: Config, tmp_path: Path
+) -> None:
+    config = test_config.extend(db_path=tmp_path / "db.db")
+    db = DbClient(config=config)
+
+    task = factories.task(id="aaaaaaaaaa")
+    db.dump_wipman(views=[], tasks={task})
+
+    duplicated = [factories.task(id="bbbbbbbbbb"), factories.task(id="bbbbbbbbbb")]
+    with pytest.raises(sqlite3.IntegrityError):
+        db.dump_wipman(views=[], tasks=duplicated)
+
+    assert db.read_all_tasks() == [task]
+
+
+def test_dump_wipman_does_not_fail_on_writes_made_while_staging(
+    test_config: Config, tmp_path: Path
+) -> None:
+    config = test_config.extend(db_path=tmp_path / "db.db", db_journal_mode="wal")
+    db = DbClient(config=config)
+    db.migrate()
+    assert db.set_journal_mode() == "wal"
+
+    other_writer = DbClient(config=config)
+
+    def views_written_alongside() -> Iterator[View]:
+        # Written by another connection while the views are being staged
+        other_writer.insert_task(task=factories.task(id="cccccccccc"))
+        yield from []
+
+    task = factories.task(id="aaaaaaaaaa")
+    db.dump_wipman(views=views_written_alongside(), tasks=[task])
+
+    assert db.read_all_tasks() == [task]
+
+
+def test_read_only_pool_reads_while_a_write_is_in_progress(
+    test_config: Config, tmp_path: Path
+) -> None:
+    config = test_config.extend(db_path=tmp_path / "db.db", db_journal_mode="wal")
+    set_up_minimum_db(config=config)
+
+    writer = DbClient(config=config)
+    assert writer.set_journal_mode() == "wal"
+    task = factories.task(id="aaaaaaaaaa")
+    writer.insert_task(task=task)
+
+    read_pool = ConnectionPool(config=config, read_only=True)
+    reader = DbClient(config=config, pool=read_pool)
+
+    writer.connection.execute("BEGIN IMMEDIATE;")
+    writer.connection.execute("DELETE FROM tasks;")
+    try:
+        assert reader.read_all_tasks() == [task], "uncommitted write must not block"
+    finally:
+        writer.connection.rollback()
+
+    with pytest.raises(sqlite3.OperationalError, match="readonly"):
+        reader.insert_task(task=factories.task(id="bbbbbbbbbb"))
+
+    read_pool.release()
+    read_pool.close()
+
+
+def test_tag_and_dependency_queries_follow_writes(
+    test_config: Config, tmp_path: Path
+) -> None:
+    config = test_config.extend(db_path=tmp_path / "db.db")
+    db = DbClient(config=config)
+    db.migrate()
+
+    blocker = replace(
+        factories.task(id="aaaaaaaaaa", completed=False),
+        tags=frozenset({"wipman"}),
+        blocks=frozenset({"cccccccccc"}),
+    )
+    blocked = replace(
+        factories.task(id="bbbbbbbbbb", completed=False),
+        tags=frozenset({"wipman", "api"}),
+        blocked_by=frozenset({"aaaaaaaaaa"}),
+    )
+    also_blocked = replace(
+        factories.task(id="cccccccccc", completed=True), tags=frozenset({"api"})
+    )
+    db.insert_task(task=blocker)
+    db.insert_task(task=blocked)
+    db.insert_task(task=also_blocked)
+
+    assert sorted(t.id for t in db.read_tasks_with_tag(tag="api")) == [
+        "bbbbbbbbbb",
+        "cccccccccc",
+    ]
+    assert db.read_tasks_with_tag(tag="api", completed=False) == [blocked]
+    assert sorted(t.id for t in db.read_tasks_blocked_by(task_id="aaaaaaaaaa")) == [
+        "bbbbbbbbbb",
+        "cccccccccc",
+    ]
+
+    db.update_task(task=replace(blocked, tags=frozenset(), blocked_by=frozenset()))
+    assert db.read_tasks_with_tag(tag="api", completed=False) == []
+    assert db.read_tasks_blocked_by(task_id="aaaaaaaaaa") == [also_blocked]
+
+    db.delete_task(task_id="cccccccccc")
+    assert db.read_tasks_with_tag(tag="api") == []
+
+    # A full reload rebuilds the relations from scratch
+    db.dump_wipman(views=[], tasks=[also_blocked])
+    assert db.read_tasks_with_tag(tag="wipman") == []
+    assert db.read_tasks_with_tag(tag="api") == [also_blocked]
+
+
+def test_view_tag_queries_follow_writes(test_config: Config, tmp_path: Path) -> None:
+    config = test_config.extend(db_path=tmp_path / "db.db")
+    db = DbClient(config=config)
+    db.migrate()
+
+    view = View(
+        id="0000000000",
+        title="backlog",
+        created=datetime.datetime.fromisoformat("2022-10-01T18:00:00+00:00"),
+        updated=datetime.datetime.fromisoformat("2022-10-01T18:00:00+00:00"),
+        tags=frozenset({"wipman"}),
+        task_ids=[],
+    )
+    db.insert_view(view=view)
+    assert db.read_views_with_tag(tag="wipman") == [view]
+
+    db.update_view(view=replace(view, tags=frozenset({"api"})))
+    assert db.read_views_with_tag(tag="wipman") == []
+
+    db.delete_view(view_id=view.id)
+    assert db.read_views_with_tag(tag="api") == []
+
+
+def test_update_task_upserts_in_a_single_statement(
+    test_config: Config, tmp_path: Path
+) -> None:
+    config = test_config.extend(db_path=tmp_path / "db.db")
+    db = DbClient(config=config)
+    db.migrate()
+
+    task = factories.task(id="aaaaaaaaaa")
+    assert db.update_task(task=task) is None, "must not insert unless upserting"
+
+    statements: list[str] = []
+    db.connection.set_trace_callback(statements.append)
+
+    assert db.update_task(task=task, upsert_if_needed=True) == task
+    task_2 = replace(task, title="new title")
+    assert db.update_task(task=task_2, upsert_if_needed=True) == task_2
+
+    db.connection.set_trace_callback(None)
+
+    # Statements run by triggers are traced with the text of the statement firing
+    # them, hence the deduplication
+    writes_on_tasks = {
+        statement
+        for statement in statements
+        if statement.lstrip().startswith("INSERT INTO tasks")
+    }
+    assert len(writes_on_tasks) == 2
+    assert not any(statement.startswith("SELECT") for statement in statements)
+    assert db.read_all_tasks() == [task_2]
+
+
+def test_read_changes_pages_through_the_change_log(
+    test_config: Config, tmp_path: Path
+) -> None:
+    config = test_config.extend(db_path=tmp_path / "db.db")
+    db = DbClient(config=config)
+    db.migrate()
+
+    task_a = factories.task(id="aaaaaaaaaa")
+    task_b = factories.task(id="bbbbbbbbbb")
+    task_c = factories.task(id="cccccccccc")
+    view = View(
+        id="0000000000",
+        title="backlog",
+        created=datetime.datetime.fromisoformat("2022-10-01T18:00:00+00:00"),
+        updated=datetime.datetime.fromisoformat("2022-10-01T18:00:00+00:00"),
+        tags=frozenset(),
+        task_ids=[],
+    )
+    db.insert_task(task=task_a)
+    db.insert_view(view=view)
+    db.insert_task(task=task_b)
+
+    first = db.read_changes(since=0, limit=2)
+    assert first.tasks == [task_a]
+    assert first.views == [view]
+    assert first.has_more
+
+    second = db.read_changes(since=first.cursor, limit=2)
+    assert second.tasks == [task_b]
+    assert second.views == []
+    assert not second.has_more
+
+    # Edits carrying an old `updated` timestamp are still picked up
+    old_edit = replace(task_a, title="edited", updated=datetime.datetime(2000, 1, 1))
+    db.update_task(task=old_edit)
+    db.insert_task(task=task_c)
+
+    third = db.read_changes(since=second.cursor, limit=10)
+    assert third.tasks == [old_edit, task_c]
+    assert not third.has_more
+
+    idle = db.read_changes(since=third.cursor, limit=10)
+    assert idle.tasks == [] and idle.views == []
+    assert idle.cursor == third.cursor
+
+
+def test_projected_reads_only_return_the_requested_fields(
+    test_config: Config, tmp_path: Path
+) -> None:
+    config = test_config.extend(db_path=tmp_path / "db.db")
+    db = DbClient(config=config)
+    db.migrate()
+
+    task = replace(factories.task(), content="a long description")
+    db.insert_task(task=task)
+
+    expected = {"id": task.id, "tags": task.tags, "completed": task.completed}
+    fields = ["completed", "tags"]
+    assert db.read_partial_tasks(datetime.datetime.min, fields=fields) == [expected]
+
+    page = db.read_changes(since=0, limit=10, task_fields=fields)
+    assert page.tasks == [expected]
+
+    with pytest.raises(ValueError):
+        db.read_partial_tasks(datetime.datetime.min, fields=["id; DROP TABLE"])
+
+
+def test_read_changes_reports_deletions_until_compacted(
+    test_config: Config, tmp_path: Path
+) -> None:
+    config = test_config.extend(db_path=tmp_path / "db.db")
+    db = DbClient(config=config)
+    db.migrate()
+
+    task_a = factories.task(id="aaaaaaaaaa")
+    task_b = factories.task(id="bbbbbbbbbb")
+    db.insert_task(task=task_a)
+    db.insert_task(task=task_b)
+    synced = db.read_changes(since=0, limit=10)
+
+    db.delete_task(task_id=task_a.id)
+
+    page = db.read_changes(since=synced.cursor, limit=10)
+    assert page.tasks == []
+    assert page.deleted_task_ids == [task_a.id]
+    assert not page.reset_required
+
+    deleted_task_ids, _ = db.read_deleted_ids(deleted_after=datetime.datetime.min)
+    assert deleted_task_ids == [task_a.id]
+
+    # Re-creating a deleted item replaces its tombstone
+    db.insert_task(task=task_a)
+    page = db.read_changes(since=synced.cursor, limit=10)
+    assert page.tasks == [task_a]
+    assert page.deleted_task_ids == []
+
+    db.delete_task(task_id=task_b.id)
+    not_yet = datetime.datetime.now(tz=datetime.UTC) - datetime.timedelta(days=1)
+    assert db.compact_tombstones(deleted_before=not_yet) == 0
+    tomorrow = datetime.datetime.now(tz=datetime.UTC) + datetime.timedelta(days=1)
+    assert db.compact_tombstones(deleted_before=tomorrow) == 1
+
+    stale = db.read_changes(since=synced.cursor, limit=10)
+    assert stale.reset_required
+
+    fresh = db.read_changes(since=0, limit=10)
+    assert fresh.tasks == [task_a]
+    assert not fresh.reset_required
+
+
+def test_read_changes_cursor_does_not_go_back_after_compaction(
+    test_config: Config, tmp_path: Path
+) -> None:
+    config = test_config.extend(db_path=tmp_path / "db.db")
+    db = DbClient(config=config)
+    db.migrate()
+
+    db.insert_task(task=factories.task(id="aaaaaaaaaa"))
+    db.insert_task(task=factories.task(id="bbbbbbbbbb"))
+    db.delete_task(task_id="bbbbbbbbbb")
+    synced = db.read_changes(since=0, limit=10)
+    assert synced.cursor == 3
+
+    tomorrow = datetime.datetime.now(tz=datetime.UTC) + datetime.timedelta(days=1)
+    # Only the tombstone, which is the latest change, is compacted
+    assert db.compact_tombstones(deleted_before=tomorrow) == 1
+
+    page = db.read_changes(since=synced.cursor, limit=10)
+    assert page.cursor == synced.cursor
+    assert page.tasks == []
+    assert page.deleted_task_ids == []
+    assert not page.reset_required
+
+
+def test_compaction_does_not_forget_deletions_too_early(
+    test_config: Config, tmp_path: Path
+) -> None:
+    config = test_config.extend(db_path=tmp_path / "db.db")
+    db = DbClient(config=config)
+    db.migrate()
+
+    db.insert_task(task=factories.task(id="aaaaaaaaaa"))
+    before = datetime.datetime.now(tz=datetime.UTC)
+    db.delete_task(task_id="aaaaaaaaaa")
+
+    assert db.compact_tombstones(deleted_before=before) == 0
+    deleted_task_ids, _ = db.read_deleted_ids(deleted_after=before)
+    assert deleted_task_ids == ["aaaaaaaaaa"]
+
+
+def test_search_tasks_follows_writes(test_config: Config, tmp_path: Path) -> None:
+    config = test_config.extend(db_path=tmp_path / "db.db")
+    db = DbClient(config=config)
+    db.migrate()
+
+    in_title = replace(
+        factories.task(id="aaaaaaaaaa"), title="Migrate the database", content=None
+    )
+    in_content = replace(
+        factories.task(id="bbbbbbbbbb"),
+        title="Housekeeping",
+        content="Remember to back up the database before upgrading",
+    )
+    db.insert_task(task=in_title)
+    db.update_task(task=in_content, upsert_if_needed=True)
+
+    results = db.search_tasks(text="databa", limit=10)
+    assert [result.id for result in results] == ["aaaaaaaaaa", "bbbbbbbbbb"]
+    assert "<mark>database</mark>" in results[1].snippet
+
+    assert db.search_tasks(text='"unbalanced AND (', limit=10) == []
+    assert db.search_tasks(text="   ", limit=10) == []
+
+    db.update_task(task=replace(in_content, content="Nothing to see here"))
+    assert [r.id for r in db.search_tasks(text="database", limit=10)] == ["aaaaaaaaaa"]
+
+    db.delete_task(task_id=in_title.id)
+    assert db.search_tasks(text="database", limit=10) == []
+
+    db.dump_wipman(views=[], tasks=[in_title])
+    assert [r.id for r in db.search_tasks(text="migrate", limit=10)] == ["aaaaaaaaaa"]
+
+
+def test_iter_tasks_walks_a_snapshot_in_id_order(
+    test_config: Config, tmp_path: Path
+) -> None:
+    config = test_config.extend(db_path=tmp_path / "db.db")
+    db = DbClient(config=config)
+    db.migrate()
+
+    db.set_journal_mode()
+    tasks = [factories.task(id=f"{i:010d}") for i in range(5)]
+    db.dump_wipman(views=[], tasks=reversed(tasks))
+
+    writer = DbClient(config=config)
+    reader = DbClient(config=config)
+    with reader.snapshot():
+        iterator = reader.iter_tasks(after_id=tasks[1].id)
+        assert next(iterator) == tasks[2]
+
+        writer.delete_task(task_id=tasks[4].id)
+
+        assert list(iterator) == tasks[3:], "must not see writes made meanwhile"
+
+    assert list(reader.iter_tasks()) == tasks[:4]
+
+
+def test_read_version_changes_on_every_write(
+    test_config: Config, tmp_path: Path
+) -> None:
+    config = test_config.extend(db_path=tmp_path / "db.db")
+    db = DbClient(config=config)
+    db.migrate()
+
+    versions = [db.read_version()]
+    assert db.read_version() == versions[-1], "reads must not change the version"
+
+    task = factories.task(id="aaaaaaaaaa")
+    db.insert_task(task=task)
+    versions.append(db.read_version())
+
+    db.update_task(task=replace(task, title="new title"))
+    versions.append(db.read_version())
+
+    db.delete_task(task_id=task.id)
+    versions.append(db.read_version())
+
+    tomorrow = datetime.datetime.now(tz=datetime.UTC) + datetime.timedelta(days=1)
+    db.compact_tombstones(deleted_before=tomorrow)
+    versions.append(db.read_version())
+
+    db.dump_wipman(views=[], tasks=[task])
+    versions.append(db.read_version())
+
+    assert len(set(versions)) == len(versions)
+
+
+def test_apply_batch_rolls_back_failed_operations_only(
+    test_config: Config, tmp_path: Path
+) -> None:
+    config = test_config.extend(db_path=tmp_path / "db.db")
+    db = DbClient(config=config)
+    db.migrate()
+
+    existing = factories.task(id="aaaaaaaaaa", title="existing")
+    db.insert_task(task=existing)
+
+    new = factories.task(id="bbbbbbbbbb", title="new")
+    operations = [
+        BatchUpsert(action="create", item=new),
+        # Fails: the task already exists
+        BatchUpsert(action="create", item=existing),
+        BatchUpsert(action="update", item=replace(existing, title="updated")),
+        # Fails: there is no such task
+        BatchDelete(kind="task", item_id="cccccccccc"),
+    ]
+
+    results = apply_batch(operations=operations, config=config)
+
+    assert [result.ok for result in results] == [True, False, True, False]
+    assert results[1].error == "task conflicts with a stored item"
+    assert results[3].error == "task not found"
+    assert results[0].item == new
+    assert results[2].item.title == "updated"
+    assert db.read_task(task_id=new.id) == new
+    assert db.read_task(task_id=existing.id).title == "updated"
+    assert not db.connection.in_transaction
+
+
+def test_transaction_rolls_back_everything_on_error(
+    test_config: Config, tmp_path: Path
+) -> None:
+    config = test_config.extend(db_path=tmp_path / "db.db")
+    db = DbClient(config=config)
+    db.migrate()
+
+    with pytest.raises(RuntimeError), db.transaction():
+        db.insert_task(task=factories.task(id="aaaaaaaaaa"))
+        raise RuntimeError("boom")
+
+    assert db.read_task(task_id="aaaaaaaaaa") is None
@@ -1,6 +1,7 @@
 from pathlib import Path
 
 import pytest
+
 from src.config import Config
 
 
@@ -9,4 +10,5 @@ def test_config() -> Config:
     return Config(
         wipman_dir=Path("tests/test_wipman_dir"),
         db_path=Path("tests/test_db.db"),
+        api_token=None,
     )
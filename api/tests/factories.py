@@ -1,6 +1,6 @@
 import datetime
 
-from src.model import Task, TaskId
+from src.model import Task, TaskId, View, ViewId
 
 
 def task(
@@ -17,3 +17,14 @@ def task(
         completed=completed if completed is not None else True,
         content=None,
     )
+
+
+def view(id: ViewId | None = None, title: str | None = None) -> View:
+    return View(
+        id=id or "dohxduozbs",
+        title=title or "Backlog",
+        created=datetime.datetime.fromisoformat("2023-06-02T07:37:39+00:00"),
+        updated=datetime.datetime.fromisoformat("2023-06-02T07:37:41+00:00"),
+        tags=frozenset({"foo"}),
+        task_ids=[],
+    )
@@ -1,15 +1,29 @@
 import datetime
+import json
+import threading
+import time
+from dataclasses import replace
+from pathlib import Path
+from typing import Any
 
 import pytest
+import zstandard
 from flask import Flask
 from flask.testing import FlaskClient
-from src import model
+
+from src import model, routes
 from src.adapter.json import json_to_task, json_to_view, task_to_json, view_to_json
-from src.api import app
+from src.adapter.sqlite import DbClient
+from src.api import create_app
+from src.config import Config
+from tests import factories
 
 
 @pytest.fixture
-def test_app() -> Flask:
+def test_app(test_config: Config, tmp_path: Path) -> Flask:
+    config = test_config.extend(db_path=tmp_path / "db.db")
+    config.db_path.touch()
+    app = create_app(config=config)
     app.config.update({"TESTING": True})
     return app
 
@@ -74,6 +88,313 @@ def test_update_view(test_client: FlaskClient) -> None:
     print()
 
 
+def test_api_token_is_required_when_configured(
+    test_config: Config, tmp_path: Path
+) -> None:
+    config = test_config.extend(db_path=tmp_path / "db.db", api_token="secret")
+    config.db_path.touch()
+    client = create_app(config=config).test_client()
+
+    assert client.get("/health").status_code == 401
+    assert client.get("/health", headers={"x-api-key": "wrong"}).status_code == 401
+    assert client.get("/health", headers={"x-api-key": "secret"}).status_code == 200
+
+
+def test_get_all_projects_tasks_onto_the_requested_fields(
+    test_client: FlaskClient,
+) -> None:
+    task = task_to_json(factories.task())
+    assert test_client.put("/task", json={"task": task}).status_code == 200
+
+    response = test_client.get("/get-all?fields=title,updated")
+    assert response.status_code == 200
+    assert response.json["tasks"] == [
+        {"id": task["id"], "title": task["title"], "updated": task["updated"]}
+    ]
+
+    changes = test_client.get("/changes?since=0&fields=title,updated")
+    assert changes.json["tasks"] == response.json["tasks"]
+
+    assert test_client.get("/get-all?fields=secret").status_code == 400
+    assert test_client.get("/get-all?fields=title&limit=10").status_code == 400
+
+
+def test_search_matches_user_input_literally(test_client: FlaskClient) -> None:
+    tasks = [
+        replace(factories.task(id="aaaaaaaaaa"), title="Migrate the database"),
+        replace(
+            factories.task(id="bbbbbbbbbb"),
+            title="Housekeeping",
+            content="Back up the database AND the config (first)",
+        ),
+    ]
+    for task in tasks:
+        assert (
+            test_client.put("/task", json={"task": task_to_json(task)}).status_code
+            == 200
+        )
+
+    def search(q: str, **params: str) -> list[str]:
+        response = test_client.get("/search", query_string={"q": q, **params})
+        assert response.status_code == 200
+        return [result["id"] for result in response.json["results"]]
+
+    # The last word is a prefix, titles rank above contents
+    assert search("databa") == ["aaaaaaaaaa", "bbbbbbbbbb"]
+    assert search("databa", limit="1") == ["aaaaaaaaaa"]
+    # FTS5 operators and punctuation are searched for, not interpreted
+    assert search("database AND") == ["bbbbbbbbbb"]
+    assert search("(first)") == ["bbbbbbbbbb"]
+    assert search('"unbalanced AND (') == []
+    assert search("   ") == []
+
+    response = test_client.get("/search", query_string={"q": "x", "limit": "many"})
+    assert response.status_code == 400
+
+
+def test_get_all_answers_304_until_the_db_changes(
+    test_app: Flask, test_client: FlaskClient
+) -> None:
+    etag = test_client.get("/get-all").headers["ETag"]
+
+    response = test_client.get("/get-all", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+    assert response.headers["ETag"] == etag
+
+    task = task_to_json(factories.task(id="aaaaaaaaaa"))
+    assert test_client.put("/task", json={"task": task}).status_code == 200
+
+    response = test_client.get("/get-all", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert len(response.json["tasks"]) == 1
+
+    etag = response.headers["ETag"]
+    assert test_client.delete("/task/aaaaaaaaaa").status_code == 200
+    etag_before_compaction = test_client.get("/get-all").headers["ETag"]
+    assert etag_before_compaction != etag
+
+    config = test_app.extensions["wipman"].config
+    tomorrow = datetime.datetime.now(datetime.UTC) + datetime.timedelta(1)
+    assert DbClient(config=config).compact_tombstones(deleted_before=tomorrow) == 1
+
+    response = test_client.get(
+        "/get-all", headers={"If-None-Match": etag_before_compaction}
+    )
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag_before_compaction
+
+
+def test_get_all_negotiates_compression(
+    test_config: Config, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    config = test_config.extend(
+        db_path=tmp_path / "db.db", compression_min_size_bytes=512
+    )
+    config.db_path.touch()
+    client = create_app(config=config).test_client()
+    headers = {"Accept-Encoding": "gzip, zstd"}
+
+    compressed: list[str] = []
+    original_compress = routes.compress
+
+    def compress(body: bytes, encoding: str, config: Config) -> bytes:
+        compressed.append(encoding)
+        return original_compress(body, encoding=encoding, config=config)
+
+    monkeypatch.setattr(routes, "compress", compress)
+
+    # Empty, and therefore under the minimum size
+    response = client.get("/get-all", headers=headers)
+    assert "Content-Encoding" not in response.headers
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert response.json == {"tasks": [], "views": []}
+
+    tasks = [task_to_json(factories.task(id=f"task{i:06d}")) for i in range(5)]
+    for task in tasks:
+        assert client.put("/task", json={"task": task}).status_code == 200
+
+    response = client.get("/get-all", headers=headers)
+    assert response.headers["Content-Encoding"] == "zstd"
+    assert response.headers["Vary"] == "Accept-Encoding"
+    body = zstandard.ZstdDecompressor().decompress(response.data)
+    assert json.loads(body)["tasks"] == tasks
+    assert compressed == ["zstd"]
+
+    # Same version, so the compressed body is reused
+    assert client.get("/get-all", headers=headers).data == response.data
+    assert compressed == ["zstd"]
+
+    # New version, so the body is compressed again
+    assert client.delete(f"/task/{tasks[0]['id']}").status_code == 200
+    response = client.get("/get-all", headers=headers)
+    body = zstandard.ZstdDecompressor().decompress(response.data)
+    assert json.loads(body)["tasks"] == tasks[1:]
+    assert compressed == ["zstd", "zstd"]
+
+
+def test_ndjson_stream_reads_a_single_snapshot(
+    test_client: FlaskClient, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(routes, "GET_ALL_MAX_LIMIT", 1)
+    for id in ("aaaaaaaaaa", "bbbbbbbbbb"):
+        task = task_to_json(factories.task(id=id))
+        assert test_client.put("/task", json={"task": task}).status_code == 200
+
+    response = test_client.get("/get-all?format=ndjson", buffered=False)
+    chunks = iter(response.response)
+    assert b'"id":"aaaaaaaaaa"' in next(chunks)
+
+    # Written while the stream is halfway through
+    assert test_client.delete("/task/bbbbbbbbbb").status_code == 200
+    task = task_to_json(factories.task(id="cccccccccc"))
+    assert test_client.put("/task", json={"task": task}).status_code == 200
+
+    rest = b"".join(chunks)
+    response.close()
+    assert b'"id":"bbbbbbbbbb"' in rest
+    assert b'"id":"cccccccccc"' not in rest
+
+
+def test_tasks_are_filtered_by_tag_and_by_blocker(test_client: FlaskClient) -> None:
+    blocker = replace(factories.task(id="aaaaaaaaaa"), blocks=frozenset({"cccccccccc"}))
+    tasks = [
+        blocker,
+        replace(
+            factories.task(id="bbbbbbbbbb", completed=False),
+            tags=frozenset({"foo"}),
+            blocked_by=frozenset({"aaaaaaaaaa"}),
+        ),
+        # Only `blocker` says that it blocks this one
+        replace(factories.task(id="cccccccccc"), tags=frozenset({"foobar"})),
+    ]
+    for task in tasks:
+        response = test_client.put("/task", json={"task": task_to_json(task)})
+        assert response.status_code == 200
+
+    def task_ids(query: str) -> set[str]:
+        response = test_client.get(f"/tasks?{query}")
+        assert response.status_code == 200
+        return {task["id"] for task in response.json["tasks"]}
+
+    assert task_ids("tag=foo") == {"aaaaaaaaaa", "bbbbbbbbbb"}
+    assert task_ids("tag=foobar") == {"cccccccccc"}
+    assert task_ids("tag=foo&completed=false") == {"bbbbbbbbbb"}
+    assert task_ids("blocked_by=aaaaaaaaaa") == {"bbbbbbbbbb", "cccccccccc"}
+    assert task_ids("blocked_by=bbbbbbbbbb") == set()
+
+
+def test_views_are_filtered_by_tag(test_client: FlaskClient) -> None:
+    views = [
+        replace(factories.view(id="aaaaaaaaaa"), tags=frozenset({"foo", "bar"})),
+        replace(factories.view(id="bbbbbbbbbb"), tags=frozenset({"foobar"})),
+    ]
+    for view in views:
+        response = test_client.put("/view", json={"view": view_to_json(view)})
+        assert response.status_code == 200
+
+    response = test_client.get("/views?tag=foo")
+    assert response.status_code == 200
+    assert [view["id"] for view in response.json["views"]] == ["aaaaaaaaaa"]
+
+
+@pytest.mark.parametrize("path", ["/tasks", "/tasks?completed=true", "/views"])
+def test_queries_require_a_filter(test_client: FlaskClient, path: str) -> None:
+    response = test_client.get(path)
+
+    assert response.status_code == 400
+    assert "error" in response.json
+
+
+def _task_without_title() -> dict:
+    task = task_to_json(factories.task(id="aaaaaaaaaa"))
+    del task["title"]
+    return task
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        {
+            "operations": [
+                {"action": "update", "kind": "task", "task": _task_without_title()}
+            ]
+        },
+        {"operations": [1]},
+        {"operations": {"a": 1}},
+        {"operations": [{"action": "delete", "kind": "task", "id": {"x": 1}}]},
+        {"operations": [{"action": "rename", "kind": "task", "id": "aaaaaaaaaa"}]},
+        {"tasks": []},
+        [],
+    ],
+)
+def test_batch_rejects_invalid_operations(test_client: FlaskClient, body: Any) -> None:
+    response = test_client.post("/batch", json=body)
+
+    assert response.status_code == 400
+    assert response.json == {"error": "invalid 'operations'"}
+    assert test_client.get("/get-all").json["tasks"] == []
+
+
+def test_batch_applies_every_operation(test_client: FlaskClient) -> None:
+    existing = task_to_json(factories.task(id="aaaaaaaaaa", title="existing"))
+    doomed = task_to_json(factories.task(id="bbbbbbbbbb"))
+    for task in (existing, doomed):
+        assert test_client.put("/task", json={"task": task}).status_code == 200
+
+    created = task_to_json(factories.task(id="cccccccccc", title="created"))
+    updated = {**existing, "title": "updated"}
+    view = view_to_json(factories.view(id="dddddddddd"))
+    operations = [
+        {"action": "create", "kind": "task", "task": created},
+        {"action": "update", "kind": "task", "task": updated},
+        {"action": "delete", "kind": "task", "id": "bbbbbbbbbb"},
+        {"action": "create", "kind": "view", "view": view},
+    ]
+
+    response = test_client.post("/batch", json={"operations": operations})
+
+    assert response.status_code == 200
+    assert response.json["results"] == [
+        {"ok": True, "created_task": created},
+        {"ok": True, "updated_task": updated},
+        {"ok": True, "deleted_task_id": "bbbbbbbbbb"},
+        {"ok": True, "created_view": view},
+    ]
+    everything = test_client.get("/get-all").json
+    tasks = {task["id"]: task for task in everything["tasks"]}
+    assert tasks == {"aaaaaaaaaa": updated, "cccccccccc": created}
+    assert [view["id"] for view in everything["views"]] == ["dddddddddd"]
+
+
+def test_batch_commits_valid_operations_next_to_failing_ones(
+    test_client: FlaskClient,
+) -> None:
+    existing = task_to_json(factories.task(id="aaaaaaaaaa"))
+    assert test_client.put("/task", json={"task": existing}).status_code == 200
+
+    first = task_to_json(factories.task(id="bbbbbbbbbb"))
+    last = task_to_json(factories.task(id="cccccccccc"))
+    operations = [
+        {"action": "create", "kind": "task", "task": first},
+        # Fails: the task already exists
+        {"action": "create", "kind": "task", "task": {**existing, "title": "new"}},
+        {"action": "create", "kind": "task", "task": last},
+    ]
+
+    response = test_client.post("/batch", json={"operations": operations})
+
+    assert response.status_code == 200
+    assert response.json["results"] == [
+        {"ok": True, "created_task": first},
+        {"ok": False, "error": "task conflicts with a stored item"},
+        {"ok": True, "created_task": last},
+    ]
+    tasks = {task["id"]: task for task in test_client.get("/get-all").json["tasks"]}
+    assert tasks == {"aaaaaaaaaa": existing, "bbbbbbbbbb": first, "cccccccccc": last}
+
+
 def test_serde_task_as_json() -> None:
     tz = datetime.timezone(datetime.timedelta(seconds=3600))
 
@@ -132,3 +453,87 @@ def test_serde_view_as_json() -> None:
     view_2 = json_to_view(raw=raw)
 
     assert view_2 == view
+
+
+def test_subscribe_streams_changes_and_resumes_from_last_event_id(
+    test_config: Config, tmp_path: Path
+) -> None:
+    config = test_config.extend(
+        db_path=tmp_path / "db.db", subscribe_poll_interval_seconds=0.05
+    )
+    config.db_path.touch()
+    client = create_app(config=config).test_client()
+
+    def put_task(id: str) -> None:
+        task = task_to_json(factories.task(id=id))
+        assert client.put("/task", json={"task": task}).status_code == 200
+
+    put_task("aaaaaaaaaa")
+
+    response = client.get("/subscribe?since=0", buffered=False)
+    events = (chunk for chunk in response.response if not chunk.startswith(b":"))
+    assert response.mimetype == "text/event-stream"
+    assert next(events) == b"retry: 3000\n\n"
+
+    first = next(events)
+    assert first.startswith(b"id: 1\nevent: changes\n")
+    assert b'"id":"aaaaaaaaaa"' in first
+
+    # Written while the stream waits for changes
+    threading.Timer(0.1, put_task, args=("bbbbbbbbbb",)).start()
+    second = next(events)
+    assert second.startswith(b"id: 2\nevent: changes\n")
+    assert b'"id":"bbbbbbbbbb"' in second
+    response.close()
+
+    response = client.get("/subscribe", headers={"Last-Event-ID": "1"}, buffered=False)
+    events = (chunk for chunk in response.response if not chunk.startswith(b":"))
+    next(events)  # retry
+    assert next(events).startswith(b"id: 2\nevent: changes\n")
+    response.close()
+
+
+def test_subscribe_notices_writes_of_other_processes_right_away(
+    test_config: Config, tmp_path: Path
+) -> None:
+    config = test_config.extend(
+        db_path=tmp_path / "db.db",
+        subscribe_poll_interval_seconds=30.0,
+        db_watch_interval_seconds=0.05,
+    )
+    config.db_path.touch()
+    client = create_app(config=config).test_client()
+
+    response = client.get("/subscribe?since=0", buffered=False)
+    events = (chunk for chunk in response.response if not chunk.startswith(b":"))
+    next(events)  # retry
+
+    def insert_task_like_another_worker() -> None:
+        # Written without notifying this process
+        DbClient(config=config).insert_task(factories.task(id="aaaaaaaaaa"))
+
+    threading.Timer(0.1, insert_task_like_another_worker).start()
+    started_at = time.monotonic()
+    assert next(events).startswith(b"id: 1\nevent: changes\n")
+    assert time.monotonic() - started_at < 5.0
+    response.close()
+
+
+def test_subscribe_refuses_event_streams_beyond_half_the_threads(
+    test_config: Config, tmp_path: Path
+) -> None:
+    config = test_config.extend(db_path=tmp_path / "db.db", server_threads=2)
+    config.db_path.touch()
+    client = create_app(config=config).test_client()
+
+    first = client.get("/subscribe", buffered=False)
+    assert first.status_code == 200
+
+    refused = client.get("/subscribe", buffered=False)
+    assert refused.status_code == 503
+    assert refused.headers["Retry-After"] == "3"
+
+    first.close()
+    second = client.get("/subscribe", buffered=False)
+    assert second.status_code == 200
+    second.close()
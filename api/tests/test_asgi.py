@@ -0,0 +1,63 @@
+from pathlib import Path
+
+import pytest
+from starlette.testclient import TestClient
+
+from src.adapter.json import task_to_json
+from src.api import create_app
+from src.asgi import create_asgi_app
+from src.config import Config
+from tests import factories
+
+
+@pytest.fixture
+def config(test_config: Config, tmp_path: Path) -> Config:
+    config = test_config.extend(db_path=tmp_path / "db.db")
+    config.db_path.touch()
+    return config
+
+
+def test_async_routes_answer_like_the_flask_ones(config: Config) -> None:
+    flask_client = create_app(config=config).test_client()
+
+    with TestClient(create_asgi_app(config=config)) as client:
+        for id in ("aaaaaaaaaa", "bbbbbbbbbb"):
+            task = task_to_json(factories.task(id=id))
+            assert client.put("/task", json={"task": task}).status_code == 200
+
+        for path in ("/get-all", "/get-all?format=ndjson", "/changes?since=0"):
+            response = client.get(path)
+            assert response.status_code == 200
+            assert response.content == flask_client.get(path).data
+
+        etag = client.get("/get-all").headers["etag"]
+        response = client.get("/get-all", headers={"if-none-match": etag})
+        assert response.status_code == 304
+
+
+def test_async_api_token_is_required_when_configured(config: Config) -> None:
+    config = config.extend(api_token="secret")
+
+    with TestClient(create_asgi_app(config=config)) as client:
+        assert client.get("/health").status_code == 401
+        assert client.get("/health", headers={"x-api-key": "secret"}).status_code == 200
+
+
+def test_async_routes_compress_like_the_flask_ones(config: Config) -> None:
+    config = config.extend(compression_min_size_bytes=0)
+    flask_client = create_app(config=config).test_client()
+    headers = {"accept": "*/*", "accept-encoding": "gzip, zstd"}
+
+    with TestClient(create_asgi_app(config=config)) as client:
+        task = task_to_json(factories.task(id="aaaaaaaaaa"))
+        assert client.put("/task", json={"task": task}).status_code == 200
+
+        response = client.get("/get-all", headers=headers)
+        assert response.headers["content-encoding"] == "zstd"
+        assert "Accept-Encoding" in response.headers["vary"]
+        assert response.headers["etag"] == (
+            flask_client.get("/get-all", headers=headers).headers["etag"]
+        )
+
+        response = client.get("/get-all?format=ndjson", headers=headers)
+        assert "content-encoding" not in response.headers
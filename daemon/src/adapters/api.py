@@ -2,7 +2,7 @@ from __future__ import annotations
 
 import logging
 from dataclasses import dataclass
-from typing import Any, TypeAlias
+from typing import Any, Iterable, TypeAlias
 
 import apischema
 import requests
@@ -11,6 +11,9 @@ from src.config import Config
 
 logger = logging.getLogger(__name__)
 
+# Must not exceed the API's own limit of operations per batch
+BATCH_MAX_OPERATIONS = 1_000
+
 JsonDict: TypeAlias = dict[str, Any]
 
 
@@ -32,17 +35,38 @@ def get_all(config: Config) -> GetAllResponse:
     return data
 
 
-def update_task(task: model.Task, config: Config) -> None:
-    response = requests.put(
-        url=f"{config.api_url}/task",
-        json={"task": apischema.serialize(model.Task, task)},
-    )
-    response.raise_for_status()
+def update_items(
+    tasks: Iterable[model.Task], views: Iterable[model.View], config: Config
+) -> None:
+    """
+    Upsert tasks and views in as few requests as possible. Each request is applied
+    by the API in a single transaction.
+    """
+    operations = [
+        {"action": "update", "kind": "task", "task": apischema.serialize(model.Task, t)}
+        for t in tasks
+    ] + [
+        {"action": "update", "kind": "view", "view": apischema.serialize(model.View, v)}
+        for v in views
+    ]
 
+    for start in range(0, len(operations), BATCH_MAX_OPERATIONS):
+        batch = operations[start : start + BATCH_MAX_OPERATIONS]
+        response = requests.post(
+            url=f"{config.api_url}/batch",
+            json={"operations": batch},
+        )
+        response.raise_for_status()
 
-def update_view(view: model.View, config: Config):
-    response = requests.put(
-        url=f"{config.api_url}/view",
-        json={"view": apischema.serialize(model.View, view)},
-    )
-    response.raise_for_status()
+        errors = [
+            result["error"] for result in response.json()["results"] if not result["ok"]
+        ]
+        if errors:
+            raise BatchUpdateError(
+                f"API failed to apply {len(errors)} out of {len(batch)} operations,"
+                f" first error: {errors[0]}"
+            )
+
+
+class BatchUpdateError(Exception):
+    ...
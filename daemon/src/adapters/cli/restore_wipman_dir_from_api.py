@@ -19,13 +19,20 @@ def parse_arguments() -> argparse.Namespace:
         "--api-url",
         help="Overwrites the API_URL environment variable",
     )
+    parser.add_argument(
+        "--fsync",
+        action="store_true",
+        help="Flush restored files to disk before finishing",
+    )
     parser.add_argument("-v", "--verbose", action="store_true", help="Show debug logs")
     args = parser.parse_args()
     return args
 
 
 def restore_wipman_dir_from_api_cmd(
-    wipman_dir: str | None = None, api_url: str | None = None
+    wipman_dir: str | None = None,
+    api_url: str | None = None,
+    fsync: bool = False,
 ) -> None:
     config = get_config()
     if wipman_dir:
@@ -33,7 +40,7 @@ def restore_wipman_dir_from_api_cmd(
     if api_url:
         config = config.extend(api_url=api_url)
 
-    restore_wipman_dir_from_api(config=config)
+    restore_wipman_dir_from_api(config=config, fsync=fsync)
 
 
 if __name__ == "__main__":
@@ -44,5 +51,7 @@ if __name__ == "__main__":
     logger.debug("Verbose mode: ON")
 
     restore_wipman_dir_from_api_cmd(
-        wipman_dir=arguments.wipman_dir, api_url=arguments.api_url
+        wipman_dir=arguments.wipman_dir,
+        api_url=arguments.api_url,
+        fsync=arguments.fsync,
     )
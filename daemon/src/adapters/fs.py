@@ -1,11 +1,20 @@
 import datetime
+import hashlib
+import json
 import logging
+import os
 import re
+import sqlite3
+import time
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Any, Iterator
 
 from src.config import Config
-from src.model import Task, TaskId, View
+from src.model import Hash, ItemKind, Task, TaskId, View
 
 logger = logging.getLogger(__name__)
 
@@ -26,25 +35,36 @@ def _str_to_frozenset(string: str) -> frozenset[str]:
     return frozenset((item for item in string.split(",") if item))
 
 
-def read_task_file(path: Path) -> Task:
-    content_delimiter_found = False
-    tmp: defaultdict[str, str] = defaultdict(str)
-
-    with path.open("r") as f:
-        for line in f:
-            if content_delimiter_found:
-                tmp["content"] += line
-                continue
-
-            line = line.strip()
-            if line == "---":
-                content_delimiter_found = True
-                continue
-
-            key, value = line.split("=", maxsplit=1)
-            tmp[key] = value
-
-    data = dict(tmp)
+def _decode(data: bytes) -> str:
+    # Newlines are translated like text mode does by default
+    text = data.decode("utf-8")
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text
+
+
+def _split_at_delimiter(text: str) -> tuple[list[str], str | None]:
+    """
+    Split a file into its stripped header lines and the content after the `---`
+    line, which is None when there is nothing after it.
+    """
+    header: list[str] = []
+    start = 0
+    while start < len(text):
+        end = text.find("\n", start)
+        if end == -1:
+            end = len(text)
+        line = text[start:end].strip()
+        start = end + 1
+        if line == "---":
+            return header, text[start:] or None
+        header.append(line)
+    return header, None
+
+
+def _parse_task(text: str) -> Task:
+    header, content = _split_at_delimiter(text)
+    data = dict(line.split("=", 1) for line in header)
 
     return Task(
         id=data["id"],
@@ -55,10 +75,78 @@ def read_task_file(path: Path) -> Task:
         blocked_by=_str_to_frozenset(data["blockedBy"]),
         blocks=_str_to_frozenset(data["blocks"]),
         completed=_str_to_bool(data["completed"]),
-        content=data.get("content"),
+        content=content,
     )
 
 
+def read_task_file(path: Path) -> Task:
+    return _parse_task(_decode(path.read_bytes()))
+
+
+class FsyncBatch:
+    """
+    Directories to fsync once a batch of files has been written to them, rather
+    than once per file, so that the files written are durable.
+    """
+
+    def __init__(self) -> None:
+        self._directories: set[Path] = set()
+
+    def add(self, directory: Path) -> None:
+        self._directories.add(directory)
+
+    def sync(self) -> None:
+        for directory in sorted(self._directories):
+            fd = os.open(directory, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        self._directories.clear()
+
+
+@contextmanager
+def batched_fsync() -> Iterator[FsyncBatch]:
+    batch = FsyncBatch()
+    yield batch
+    batch.sync()
+
+
+def _write_file(path: Path, content: str, fsync: FsyncBatch | None = None) -> bool:
+    """
+    Replace the file at `path` with `content`, unless it already holds it, and
+    return whether it was written.
+
+    The content is written to a temporary file next to it, which then replaces
+    the file at once, so that it is never found half-written. With `fsync`, the
+    content is flushed to disk first, and the directory is left for `fsync` to
+    flush once all files are written.
+    """
+    data = content.encode("utf-8")
+    try:
+        if os.stat(path).st_size == len(data) and path.read_bytes() == data:
+            return False
+    except FileNotFoundError:
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+    # Hidden, so that loading the wipman dir never picks it up
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    try:
+        with tmp_path.open("wb") as f:
+            f.write(data)
+            if fsync is not None:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+    if fsync is not None:
+        fsync.add(path.parent)
+    return True
+
+
 def _set_to_str(str_set: frozenset[str]) -> str:
     return ",".join(sorted(list(str_set)))
 
@@ -75,7 +163,7 @@ def _bool_to_str(value: bool) -> str:
             )
 
 
-def write_task_file(path: Path, task: Task) -> None:
+def write_task_file(path: Path, task: Task, fsync: FsyncBatch | None = None) -> bool:
     lines: list[str] = [
         f"id={task.id}",
         f"title={task.title}",
@@ -93,11 +181,14 @@ def write_task_file(path: Path, task: Task) -> None:
     if content[-1] != "\n":
         content = f"{content}\n"
 
-    path.parent.mkdir(parents=True, exist_ok=True)
-    path.write_text(content)
+    return _write_file(path=path, content=content, fsync=fsync)
 
 
 _TASK_ID_IN_VIEW_LINE_PATTERN = re.compile(r"^.*\[([a-z0-9]{10})\]")
+# Matches once in every content line with a task ID, like the pattern above
+_TASK_IDS_IN_VIEW_CONTENT_PATTERN = re.compile(
+    _TASK_ID_IN_VIEW_LINE_PATTERN.pattern, re.MULTILINE
+)
 
 
 class ReadViewError(Exception):
@@ -114,28 +205,21 @@ def _extract_task_id(*, line: str) -> TaskId:
     return matches.group(1)
 
 
-def read_view_file(path: Path) -> View:
-    content_delimiter_found = False
-    tmp: defaultdict[str, str] = defaultdict(str)
-    task_ids: list[TaskId] = []
-
-    with path.open("r") as f:
-        for line in f:
-            if content_delimiter_found:
-                # Extract task ID from View content line
-                task_id = _extract_task_id(line=line)
-                task_ids.append(task_id)
-                continue
+def _extract_task_ids(content: str) -> list[TaskId]:
+    task_ids = _TASK_IDS_IN_VIEW_CONTENT_PATTERN.findall(content)
 
-            line = line.strip()
-            if line == "---":
-                content_delimiter_found = True
-                continue
+    line_count = content.count("\n") + (not content.endswith("\n"))
+    if len(task_ids) != line_count:
+        # Find the offending line, to report it
+        for line in content.split("\n"):
+            _extract_task_id(line=line)
+
+    return task_ids
 
-            key, value = line.split("=")
-            tmp[key] = value
 
-    data = dict(tmp)
+def _parse_view(text: str) -> View:
+    header, content = _split_at_delimiter(text)
+    data = dict(line.split("=", 1) for line in header)
 
     return View(
         id=data["id"],
@@ -143,11 +227,20 @@ def read_view_file(path: Path) -> View:
         created=datetime.datetime.fromisoformat(data["created"]),
         updated=datetime.datetime.fromisoformat(data["updated"]),
         tags=_str_to_frozenset(data["tags"]),
-        task_ids=task_ids,
+        task_ids=_extract_task_ids(content) if content else [],
     )
 
 
-def write_view_file(path: Path, view: View, tasks: dict[TaskId, Task]) -> None:
+def read_view_file(path: Path) -> View:
+    return _parse_view(_decode(path.read_bytes()))
+
+
+def write_view_file(
+    path: Path,
+    view: View,
+    tasks: dict[TaskId, Task],
+    fsync: FsyncBatch | None = None,
+) -> bool:
     lines: list[str] = [
         f"id={view.id}",
         f"title={view.title}",
@@ -174,24 +267,417 @@ def write_view_file(path: Path, view: View, tasks: dict[TaskId, Task]) -> None:
 
     lines.append(END_OF_FILE_EMPTY_LINE)
 
+    return _write_file(path=path, content="\n".join(lines), fsync=fsync)
+
+
+# Hidden, so that it is never mistaken for a task shard directory
+MANIFEST_PATH = Path(".wipman") / "manifest.db"
+_MANIFEST_VERSION = 2
+# Files modified this close to the previous load may have been modified again
+# without their mtime changing, depending on the resolution of the file system
+_RACY_MTIME_NS = 2_000_000_000
+# Below this many files to read, starting processes costs more than it saves
+PARALLEL_LOAD_MIN_FILES = 512
+
+
+@dataclass(frozen=True)
+class WipmanDirChanges:
+    """
+    Task and view files added, modified and removed since the previous load, and
+    the tasks and views read from the files added or modified.
+    """
+
+    added: list[Path]
+    modified: list[Path]
+    removed: list[Path]
+    views: list[View]
+    tasks: list[Task]
+
+
+def _task_to_record(task: Task) -> dict[str, Any]:
+    return {
+        "id": task.id,
+        "title": task.title,
+        "created": task.created.isoformat(),
+        "updated": task.updated.isoformat(),
+        "tags": sorted(task.tags),
+        "blocked_by": sorted(task.blocked_by),
+        "blocks": sorted(task.blocks),
+        "completed": task.completed,
+        "content": task.content,
+    }
+
+
+def _record_to_task(record: dict[str, Any]) -> Task:
+    return Task(
+        id=record["id"],
+        title=record["title"],
+        created=datetime.datetime.fromisoformat(record["created"]),
+        updated=datetime.datetime.fromisoformat(record["updated"]),
+        tags=frozenset(record["tags"]),
+        blocked_by=frozenset(record["blocked_by"]),
+        blocks=frozenset(record["blocks"]),
+        completed=record["completed"],
+        content=record["content"],
+    )
+
+
+def _view_to_record(view: View) -> dict[str, Any]:
+    return {
+        "id": view.id,
+        "title": view.title,
+        "created": view.created.isoformat(),
+        "updated": view.updated.isoformat(),
+        "tags": sorted(view.tags),
+        "task_ids": view.task_ids,
+    }
+
+
+def _record_to_view(record: dict[str, Any]) -> View:
+    return View(
+        id=record["id"],
+        title=record["title"],
+        created=datetime.datetime.fromisoformat(record["created"]),
+        updated=datetime.datetime.fromisoformat(record["updated"]),
+        tags=frozenset(record["tags"]),
+        task_ids=record["task_ids"],
+    )
+
+
+def _create_manifest_tables(connection: sqlite3.Connection) -> None:
+    connection.executescript(
+        f"""
+        DROP TABLE IF EXISTS files;
+        DROP TABLE IF EXISTS records;
+        DROP TABLE IF EXISTS state;
+        CREATE TABLE files (
+            key TEXT PRIMARY KEY NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            hash TEXT NOT NULL
+        );
+        -- Apart from files, so that checking which files changed reads little
+        CREATE TABLE records (
+            key TEXT PRIMARY KEY NOT NULL,
+            record TEXT NOT NULL
+        );
+        CREATE TABLE state (
+            key TEXT PRIMARY KEY NOT NULL,
+            value INTEGER NOT NULL
+        );
+        INSERT INTO state (key, value) VALUES ('loaded_at_ns', 0);
+        PRAGMA user_version = {_MANIFEST_VERSION:d};
+        """
+    )
+
+
+def _connect_to_manifest(path: Path) -> sqlite3.Connection:
     path.parent.mkdir(parents=True, exist_ok=True)
-    path.write_text("\n".join(lines))
+    connection = sqlite3.connect(path)
+    try:
+        (version,) = connection.execute("PRAGMA user_version;").fetchone()
+        if version != _MANIFEST_VERSION:
+            _create_manifest_tables(connection)
+    except sqlite3.Error:
+        connection.close()
+        raise
+    return connection
+
+
+@contextmanager
+def _open_manifest(path: Path) -> Iterator[sqlite3.Connection]:
+    """
+    Open the manifest of what each file contained when last parsed. It is a SQLite
+    DB, so that a load only reads the columns it needs and only writes the rows of
+    the files that changed.
+    """
+    try:
+        connection = _connect_to_manifest(path)
+    except (OSError, sqlite3.Error) as error:
+        # The next load will just have to parse everything again
+        logger.warning(f"Parsing every file, failed to open manifest {path}: {error!r}")
+        if type(error) is sqlite3.DatabaseError:
+            # Not a DB, or a corrupt one: start afresh next time
+            path.unlink(missing_ok=True)
+        connection = sqlite3.connect(":memory:")
+        _create_manifest_tables(connection)
+
+    try:
+        yield connection
+    finally:
+        connection.close()
+
+
+def _update_manifest(
+    manifest: sqlite3.Connection,
+    upserted: list[tuple[str, int, int, Hash, str]],
+    refreshed: list[tuple[int, int, str]],
+    removed: list[str],
+    loaded_at_ns: int,
+) -> None:
+    try:
+        with manifest:
+            manifest.executemany(
+                "INSERT OR REPLACE INTO files (key, mtime_ns, size, hash)"
+                " VALUES (?, ?, ?, ?);",
+                [
+                    (key, mtime_ns, size, digest)
+                    for key, mtime_ns, size, digest, _ in upserted
+                ],
+            )
+            manifest.executemany(
+                "INSERT OR REPLACE INTO records (key, record) VALUES (?, ?);",
+                [(key, record) for key, _, _, _, record in upserted],
+            )
+            manifest.executemany(
+                "UPDATE files SET mtime_ns = ?, size = ? WHERE key = ?;", refreshed
+            )
+            manifest.executemany(
+                "DELETE FROM files WHERE key = ?;", [(key,) for key in removed]
+            )
+            manifest.executemany(
+                "DELETE FROM records WHERE key = ?;", [(key,) for key in removed]
+            )
+            manifest.execute(
+                "UPDATE state SET value = ? WHERE key = 'loaded_at_ns';",
+                (loaded_at_ns,),
+            )
+    except sqlite3.Error as error:
+        # The next load will just have to parse these files again
+        logger.warning(f"Failed to update manifest: {error!r}")
+
+
+def _list_files(directory: os.DirEntry, name_length: int | None = None) -> list[str]:
+    with os.scandir(directory.path) as entries:
+        return [
+            f"{directory.name}/{entry.name}"
+            for entry in entries
+            if not entry.name.startswith(".")
+            and (name_length is None or len(entry.name) == name_length)
+            and entry.is_file()
+        ]
+
+
+def _find_wipman_files(config: Config) -> tuple[list[str], list[str]]:
+    """
+    Find view and task files, as paths relative to the wipman dir. Only `views/`
+    and the task shard directories are looked into, so that other directories,
+    like `.git`, cost nothing to skip.
+    """
+    views_files: list[str] = []
+    tasks_files: list[str] = []
+
+    with os.scandir(config.wipman_dir) as entries:
+        directories = [
+            entry
+            for entry in entries
+            if not entry.name.startswith(".")
+            and (entry.name == "views" or len(entry.name) == 2)
+            and entry.is_dir()
+        ]
+
+    for directory in directories:
+        if directory.name == "views":
+            views_files.extend(_list_files(directory))
+        else:
+            tasks_files.extend(_list_files(directory, name_length=8))
+
+    return views_files, tasks_files
+
+
+def _read_item_files(
+    files: list[tuple[ItemKind, Path, Hash | None]]
+) -> list[tuple[Hash, dict[str, Any] | None]]:
+    """
+    Read and hash each file, and parse it unless its hash is the given one.
+    """
+    results: list[tuple[Hash, dict[str, Any] | None]] = []
+    for kind, path, previous_hash in files:
+        data = path.read_bytes()
+        digest = hashlib.sha256(data).hexdigest()
+        if digest == previous_hash:
+            results.append((digest, None))
+            continue
 
+        text = _decode(data)
+        if kind == "task":
+            record = _task_to_record(_parse_task(text))
+        else:
+            record = _view_to_record(_parse_view(text))
+        results.append((digest, record))
+    return results
+
+
+def _by_directory(paths: list[str] | list[Path]) -> dict[str, list[int]]:
+    """
+    Group the positions of `paths` by directory, like task shard directories.
+    """
+    chunks: defaultdict[str, list[int]] = defaultdict(list)
+    for i, path in enumerate(paths):
+        chunks[os.path.dirname(path)].append(i)
+    return chunks
+
+
+def _stat_files(root: Path, paths: list[str], workers: int) -> list[os.stat_result]:
+    # Cheaper than `os.path.join`, which adds up over many files
+    paths = [f"{root}/{path}" for path in paths]
+    if workers <= 1:
+        return list(map(os.stat, paths))
+
+    # Waiting on the file system releases the GIL, threads are enough
+    def _stat_chunk(positions: list[int]) -> list[tuple[int, os.stat_result]]:
+        return [(i, os.stat(paths[i])) for i in positions]
+
+    stats: dict[int, os.stat_result] = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for chunk in executor.map(_stat_chunk, _by_directory(paths).values()):
+            stats.update(chunk)
+    return [stats[i] for i in range(len(paths))]
+
+
+def _read_files_in_parallel(
+    files: list[tuple[ItemKind, Path, Hash | None]], workers: int
+) -> list[tuple[Hash, dict[str, Any] | None]]:
+    """
+    Like `_read_item_files`, spreading whole shard directories across processes,
+    so that parsing is not bound to a single core.
+    """
+    results: dict[int, tuple[Hash, dict[str, Any] | None]] = {}
+    chunks = _by_directory([path for _, path, _ in files])
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(_read_item_files, [files[i] for i in positions]): positions
+            for positions in chunks.values()
+        }
+        for future in as_completed(futures):
+            results.update(zip(futures[future], future.result()))
+    return [results[i] for i in range(len(files))]
+
+
+def _sync_manifest(
+    config: Config, manifest: sqlite3.Connection
+) -> tuple[WipmanDirChanges, set[str]]:
+    """
+    Bring the manifest up to date with the wipman dir, and return what changed
+    along with the keys of the files added, modified or removed.
+    """
+    previous: dict[str, tuple[int, int, Hash]] = {
+        key: (mtime_ns, size, digest)
+        for key, mtime_ns, size, digest in manifest.execute(
+            "SELECT key, mtime_ns, size, hash FROM files;"
+        )
+    }
+    (previous_loaded_at_ns,) = manifest.execute(
+        "SELECT value FROM state WHERE key = 'loaded_at_ns';"
+    ).fetchone()
+    trusted_until_ns = previous_loaded_at_ns - _RACY_MTIME_NS
+    loaded_at_ns = time.time_ns()
+
+    views_keys, tasks_keys = _find_wipman_files(config=config)
+    kinds: list[ItemKind] = ["view"] * len(views_keys) + ["task"] * len(tasks_keys)
+    keys = [*views_keys, *tasks_keys]
+    stats = _stat_files(root=config.wipman_dir, paths=keys, workers=config.load_workers)
+
+    # Files to read, along with their key and stat
+    to_read: list[tuple[ItemKind, Path, Hash | None]] = []
+    to_read_stats: list[tuple[str, os.stat_result]] = []
+    for kind, key, stat in zip(kinds, keys, stats):
+        entry = previous.get(key)
+        if (
+            entry is not None
+            and entry[0] == stat.st_mtime_ns
+            and entry[1] == stat.st_size
+            and entry[0] < trusted_until_ns
+        ):
+            continue
 
-def load_wipman_dir(config: Config) -> tuple[list[View], set[Task]]:
-    def _ignore_hidden(path: Path) -> bool:
-        return not path.name.startswith(".")
+        path = config.wipman_dir / key
+        to_read.append((kind, path, entry[2] if entry else None))
+        to_read_stats.append((key, stat))
+
+    if config.load_workers > 1 and len(to_read) >= PARALLEL_LOAD_MIN_FILES:
+        read = _read_files_in_parallel(files=to_read, workers=config.load_workers)
+    else:
+        read = _read_item_files(files=to_read)
+
+    changes = WipmanDirChanges(added=[], modified=[], removed=[], views=[], tasks=[])
+    changed_keys: set[str] = set()
+    upserted: list[tuple[str, int, int, Hash, str]] = []
+    # Files touched without their content changing
+    refreshed: list[tuple[int, int, str]] = []
+    for (kind, path, _), (key, stat), (digest, record) in zip(
+        to_read, to_read_stats, read
+    ):
+        if record is None:
+            refreshed.append((stat.st_mtime_ns, stat.st_size, key))
+            continue
 
-    def _is_task_dir(path: Path) -> bool:
-        return path.is_dir() and len(path.name) == 2
+        added_or_modified = changes.modified if key in previous else changes.added
+        added_or_modified.append(path)
+        if kind == "task":
+            changes.tasks.append(_record_to_task(record))
+        else:
+            changes.views.append(_record_to_view(record))
+
+        changed_keys.add(key)
+        encoded = json.dumps(record, separators=(",", ":"))
+        upserted.append((key, stat.st_mtime_ns, stat.st_size, digest, encoded))
+
+    removed = sorted(previous.keys() - set(keys))
+    changes.removed.extend(config.wipman_dir / key for key in removed)
+    changed_keys.update(removed)
+
+    if upserted or refreshed or removed:
+        _update_manifest(
+            manifest=manifest,
+            upserted=upserted,
+            refreshed=refreshed,
+            removed=removed,
+            loaded_at_ns=loaded_at_ns,
+        )
 
-    def _is_task_file(path: Path) -> bool:
-        return path.is_file() and _is_task_dir(path.parent) and len(path.name) == 8
+    logger.debug(
+        f"Loaded wipman dir: {len(changes.added)} files added,"
+        f" {len(changes.modified)} modified and {len(changes.removed)} removed"
+    )
+    return changes, changed_keys
 
-    views_dir = config.wipman_dir / "views"
-    views = [read_view_file(path) for path in views_dir.glob("*")]
 
-    non_hidden = filter(_ignore_hidden, config.wipman_dir.rglob("*"))
-    tasks_paths = filter(_is_task_file, non_hidden)
-    tasks = {read_task_file(path) for path in tasks_paths}
+def load_wipman_dir_incrementally(config: Config) -> WipmanDirChanges:
+    """
+    Report which task and view files changed since the last load, only reading and
+    parsing those, so that the cost of a load is proportional to what changed.
+
+    What each file contained when last parsed is kept in a manifest inside the
+    wipman dir. Files whose size and mtime did not change are not read again, and
+    files whose content hash did not change are not parsed again.
+
+    With more than one `config.load_workers`, files are stat-ed on a thread pool
+    and, when there are many to read, read and parsed on a process pool.
+    """
+    with _open_manifest(config.wipman_dir / MANIFEST_PATH) as manifest:
+        changes, _ = _sync_manifest(config=config, manifest=manifest)
+    return changes
+
+
+def load_wipman_dir(config: Config) -> tuple[list[View], set[Task]]:
+    """
+    Load all views and tasks, like `load_wipman_dir_incrementally` does, and read
+    those in files that did not change from the manifest.
+    """
+    with _open_manifest(config.wipman_dir / MANIFEST_PATH) as manifest:
+        changes, changed_keys = _sync_manifest(config=config, manifest=manifest)
+
+        views = changes.views
+        tasks = set(changes.tasks)
+        # Changed files are skipped, in case the manifest could not be updated
+        for key, record in manifest.execute("SELECT key, record FROM records;"):
+            if key in changed_keys:
+                continue
+            if key.startswith("views/"):
+                views.append(_record_to_view(json.loads(record)))
+            else:
+                tasks.add(_record_to_task(json.loads(record)))
+
     return views, tasks
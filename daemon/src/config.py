@@ -4,11 +4,16 @@ from functools import lru_cache
 from pathlib import Path
 from typing import Any, Self
 
+# Default number of processes loading the wipman dir
+CPU_COUNT = os.cpu_count() or 1
+
 
 @dataclass(frozen=True)
 class Config:
     wipman_dir: Path
     api_url: str
+    # Processes parsing the wipman dir, 1 to parse it in this process
+    load_workers: int = CPU_COUNT
 
     def extend(self: Self, **changes: dict[str, Any]) -> Self:
         return replace(self, **changes)
@@ -26,4 +31,5 @@ def get_config() -> Config:
     return Config(
         wipman_dir=_path_from_env("WIPMAN_DIR"),
         api_url=api_url,
+        load_workers=int(os.environ.get("LOAD_WORKERS", CPU_COUNT)),
     )
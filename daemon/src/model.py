@@ -1,8 +1,9 @@
 import datetime
 from dataclasses import dataclass
-from typing import TypeAlias
+from typing import Literal, TypeAlias
 
 Hash: TypeAlias = str
+ItemKind: TypeAlias = Literal["task", "view"]
 ISODatetimeString: TypeAlias = str  # "2022-07-19T07:11:00+01:00"
 MarkdownString: TypeAlias = str
 Tag: TypeAlias = str
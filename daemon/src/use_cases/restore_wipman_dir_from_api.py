@@ -1,4 +1,5 @@
 import logging
+from contextlib import ExitStack
 from pathlib import Path
 
 from src.adapters import api, fs
@@ -17,24 +18,49 @@ def _build_view_path(wipman_dir: Path, view: View) -> Path:
     return wipman_dir / "views" / filename
 
 
-def _create_task_file(config: Config, task: Task) -> None:
+def _create_task_file(
+    config: Config, task: Task, fsync: fs.FsyncBatch | None = None
+) -> bool:
     path = _build_task_path(task=task, wipman_dir=config.wipman_dir)
-    fs.write_task_file(path=path, task=task)
+    return fs.write_task_file(path=path, task=task, fsync=fsync)
 
 
-def _create_view_file(config: Config, view: View, tasks: dict[TaskId, Task]) -> None:
+def _create_view_file(
+    config: Config,
+    view: View,
+    tasks: dict[TaskId, Task],
+    fsync: fs.FsyncBatch | None = None,
+) -> bool:
     path = _build_view_path(view=view, wipman_dir=config.wipman_dir)
-    fs.write_view_file(path=path, view=view, tasks=tasks)
+    return fs.write_view_file(path=path, view=view, tasks=tasks, fsync=fsync)
 
 
-def restore_wipman_dir_from_api(config: Config) -> None:
-    response = api.get_all(config=config)
-
+def _write_files(
+    config: Config, tasks: list[Task], views: list[View], fsync: bool
+) -> None:
+    """
+    Write a file per task and view, leaving alone those that are up to date. With
+    `fsync`, the files are flushed to disk before returning.
+    """
     _task_map: dict[TaskId, Task] = {}
+    written = 0
+
+    with ExitStack() as stack:
+        batch = stack.enter_context(fs.batched_fsync()) if fsync else None
+
+        for task in tasks:
+            written += _create_task_file(task=task, config=config, fsync=batch)
+            _task_map[task.id] = task
 
-    for task in response.tasks:
-        _create_task_file(task=task, config=config)
-        _task_map[task.id] = task
+        for view in views:
+            written += _create_view_file(
+                view=view, tasks=_task_map, config=config, fsync=batch
+            )
 
-    for view in response.views:
-        _create_view_file(view=view, tasks=_task_map, config=config)
+    unchanged = len(tasks) + len(views) - written
+    logger.info(f"Restored {written} files, {unchanged} were already up to date")
+
+
+def restore_wipman_dir_from_api(config: Config, fsync: bool = False) -> None:
+    response = api.get_all(config=config)
+    _write_files(config=config, tasks=response.tasks, views=response.views, fsync=fsync)